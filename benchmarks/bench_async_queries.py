@@ -0,0 +1,77 @@
+"""Measure query throughput of the async path under concurrent load.
+
+Queries are answered one at a time with ``process_query`` and then
+concurrently with ``aprocess_query`` at each concurrency level; the async
+responses must match the sequential ones. Run with::
+
+    python -m benchmarks.bench_async_queries --queries 400 --concurrency 1 8 32 64
+"""
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+import time
+import warnings
+from typing import List
+
+from benchmarks.synthetic import LatencyEmbeddings, make_documents, random_text
+from rag_app.utils import resources
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore")
+
+    rng = random.Random(3)
+    queries = [random_text(8, rng) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        resources.configure(embeddings=LatencyEmbeddings(size=384), persist_directory=tmp)
+        from rag_app.agent import aprocess_query, ingest_documents, process_query
+        from rag_app.utils.concurrency import get_query_batcher, shutdown_executors
+        from rag_app.utils.nodes import clear_query_caches
+
+        ingest_documents(make_documents(args.pages))
+
+        clear_query_caches()
+        start = time.perf_counter()
+        expected = [process_query(query) for query in queries]
+        sync_seconds = time.perf_counter() - start
+        print(f"{'mode':<14} {'QPS':>8} {'avg batch':>10}")
+        print(f"{'sync':<14} {len(queries) / sync_seconds:>8.1f} {1.0:>10.1f}")
+
+        batcher = get_query_batcher(resources.get_embeddings())
+        for concurrency in args.concurrency:
+            clear_query_caches()
+            batcher.batches = batcher.items = 0
+
+            async def run() -> List[str]:
+                semaphore = asyncio.Semaphore(concurrency)
+
+                async def one(query: str) -> str:
+                    async with semaphore:
+                        return await aprocess_query(query)
+
+                return await asyncio.gather(*(one(query) for query in queries))
+
+            start = time.perf_counter()
+            responses = asyncio.run(run())
+            seconds = time.perf_counter() - start
+            average_batch = batcher.items / batcher.batches if batcher.batches else 0.0
+            print(f"{f'async x{concurrency}':<14} {len(queries) / seconds:>8.1f} {average_batch:>10.1f}")
+            if responses != expected:
+                print(f"FAIL: async responses differ at concurrency {concurrency}")
+                return 1
+        shutdown_executors()
+
+    print("OK: async responses match process_query")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""Compare batched query processing with the per-query loop.
+
+Run with::
+
+    python -m benchmarks.bench_batch_queries --queries 500 --pages 200
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+import warnings
+from typing import List
+
+from benchmarks.synthetic import LatencyEmbeddings, make_documents, random_text
+from rag_app.utils import resources
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--pages", type=int, default=200)
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore")
+
+    rng = random.Random(1)
+    queries = [random_text(8, rng) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        resources.configure(embeddings=LatencyEmbeddings(size=384), persist_directory=tmp)
+        from rag_app.agent import ingest_documents, process_queries, process_query
+
+        ingest_documents(make_documents(args.pages))
+
+        start = time.perf_counter()
+        looped = [process_query(q) for q in queries]
+        t_loop = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = process_queries(queries)
+        t_batch = time.perf_counter() - start
+
+    print(f"per-query loop: {len(queries) / t_loop:8.1f} queries/s ({t_loop:.2f}s)")
+    print(f"batched:        {len(queries) / t_batch:8.1f} queries/s ({t_batch:.2f}s, {t_loop / t_batch:.1f}x)")
+    if looped != batched:
+        print("FAIL: batched responses differ from the per-query loop")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
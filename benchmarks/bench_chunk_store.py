@@ -0,0 +1,100 @@
+"""Compare the columnar chunk store with keeping chunks as ``Document`` objects.
+
+Reports the Python heap used to hold N chunks, the time to pickle the graph
+state between steps when it carries retrieved documents versus chunk IDs,
+and the time to materialize the chunks ``generate`` needs. Run with::
+
+    python -m benchmarks.bench_chunk_store --chunks 200000
+"""
+import argparse
+import gc
+import pickle
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List
+
+from benchmarks.synthetic import random_text
+
+from langchain_core.documents import Document
+
+from rag_app.utils.chunkstore import ChunkStore
+from rag_app.utils.tools import chunk_id
+
+
+def heap_mb(build) -> tuple:
+    """Return what ``build()`` returns and the Python heap it keeps allocated, in MB."""
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size / 1e6
+
+
+def per_call_us(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=200_000)
+    parser.add_argument("--words", type=int, default=150, help="Words per chunk")
+    parser.add_argument("-k", type=int, default=3, help="Chunks in the graph state")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    texts = [random_text(args.words, rng) for _ in range(args.chunks)]
+    metadatas = [{"source": f"/data/pdfs/manual-{i // 500}.pdf", "page": i // 4 % 500} for i in range(args.chunks)]
+    del rng
+
+    documents, documents_mb = heap_mb(
+        lambda: [Document(page_content=text, metadata=dict(metadata)) for text, metadata in zip(texts, metadatas)]
+    )
+    ids = [chunk_id(doc) for doc in documents]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = ChunkStore(tmp)
+        start = time.perf_counter()
+        for i in range(0, args.chunks, 10_000):
+            writer.add(ids[i:i + 10_000], documents[i:i + 10_000])
+        write_s = time.perf_counter() - start
+        writer.close()
+        # Both heaps leave out the text: the documents share the existing strings, the store keeps it on disk
+        del writer
+        store, store_mb = heap_mb(lambda: ChunkStore(tmp))
+        store.rows(ids[:1])  # Build the sorted key index before timing lookups
+
+        sample = random.Random(1).sample(range(args.chunks), 1000)
+        picks = [[ids[i] for i in sample[j:j + args.k]] for j in range(0, len(sample), args.k)]
+        doc_state = {"query": "q", "context": [documents[i] for i in sample[:args.k]], "response": None}
+        id_state = {"query": "q", "context_ids": picks[0], "response": None}
+        it = iter(range(10 ** 9))
+        materialize_us = per_call_us(lambda: store.documents(picks[next(it) % len(picks)]), 2000)
+        assert [d.page_content for d in store.documents(picks[0])] == [texts[i] for i in sample[:args.k]]
+
+        print(f"{args.chunks} chunks of {args.words} words, state with k={args.k}")
+        print(f"{'':<28} {'documents':>12} {'chunk store':>12}")
+        print(f"{'heap MB':<28} {documents_mb:>12.1f} {store_mb:>12.1f}")
+        print(
+            f"{'state pickle bytes':<28} {len(pickle.dumps(doc_state)):>12} {len(pickle.dumps(id_state)):>12}"
+        )
+        print(
+            f"{'state pickle+unpickle us':<28} "
+            f"{per_call_us(lambda: pickle.loads(pickle.dumps(doc_state)), 5000):>12.1f} "
+            f"{per_call_us(lambda: pickle.loads(pickle.dumps(id_state)), 5000):>12.1f}"
+        )
+        print(f"{'materialize k chunks us':<28} {'-':>12} {materialize_us:>12.1f}")
+        print(f"{'write chunks/s':<28} {'-':>12} {args.chunks / write_s:>12.0f}")
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Compare the offset-based chunker with RecursiveCharacterTextSplitter.
+
+Both splitters run on a golden corpus of synthetic pages plus pages with
+irregular whitespace and very long words, and the benchmark fails if any
+chunk differs. Run with::
+
+    python -m benchmarks.bench_chunking --pages 2000
+"""
+import argparse
+import random
+import sys
+import time
+import warnings
+from typing import List
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from benchmarks.synthetic import make_documents, random_text
+from rag_app.utils.chunking import TextChunker
+
+
+def irregular_page(rng: random.Random) -> str:
+    """Return a page mixing prose, blank lines, runs of spaces and unbroken strings."""
+    parts = []
+    for _ in range(rng.randint(1, 20)):
+        kind = rng.random()
+        if kind < 0.4:
+            parts.append(random_text(rng.randint(1, 400), rng))
+        elif kind < 0.6:
+            parts.append("\n" * rng.randint(1, 4))
+        elif kind < 0.7:
+            parts.append(" " * rng.randint(1, 5))
+        elif kind < 0.8:
+            parts.append("x" * rng.randint(1, 2500))
+        else:
+            parts.append(random_text(rng.randint(1, 30), rng).replace(" ", "\n"))
+    return "".join(parts)
+
+
+def golden_corpus(n_pages: int, seed: int = 5) -> List[Document]:
+    rng = random.Random(seed)
+    documents = make_documents(n_pages)
+    documents += [
+        Document(page_content=irregular_page(rng), metadata={"source": "irregular.pdf", "page": i})
+        for i in range(max(n_pages // 4, 50))
+    ]
+    return documents
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore")
+
+    documents = golden_corpus(args.pages)
+    size = sum(len(d.page_content) for d in documents) / 1e6
+
+    def recursive() -> List[Document]:
+        # What split_documents used to do: a new splitter for every page
+        chunks = []
+        for document in documents:
+            splitter = RecursiveCharacterTextSplitter(
+                chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, length_function=len
+            )
+            chunks.extend(splitter.split_documents([document]))
+        return chunks
+
+    chunker = TextChunker(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+
+    def offsets() -> List[Document]:
+        return chunker.split_documents(documents)
+
+    timings = {}
+    outputs = {}
+    for name, fn in (("recursive", recursive), ("offsets", offsets)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            outputs[name] = fn()
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+
+    print(f"{len(documents)} pages, {size:.1f} MB of text, {len(outputs['recursive'])} chunks")
+    for name, seconds in timings.items():
+        print(f"{name:<10} {seconds:8.3f}s {size / seconds:8.1f} MB/s")
+    print(f"speedup    {timings['recursive'] / timings['offsets']:8.1f}x")
+
+    expected = [(d.page_content, d.metadata) for d in outputs["recursive"]]
+    actual = [(d.page_content, d.metadata) for d in outputs["offsets"]]
+    if expected != actual:
+        print("FAIL: chunks differ from RecursiveCharacterTextSplitter")
+        return 1
+    print("OK: identical chunks")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
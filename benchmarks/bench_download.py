@@ -0,0 +1,108 @@
+"""Benchmark the concurrent downloader against a local HTTP stand-in server.
+
+The server adds a fixed latency to every response and honours
+``If-None-Match`` so the conditional re-fetch path can be checked. Run with::
+
+    python -m benchmarks.bench_download --files 32 --latency 0.05
+"""
+import argparse
+import hashlib
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+from benchmarks.synthetic import make_pages, make_pdf
+from rag_app.utils.download import Downloader
+
+
+def serve(files: Dict[str, bytes], latency: float) -> ThreadingHTTPServer:
+    """Start a threaded HTTP server for ``files`` on a free local port."""
+    etags = {name: '"%s"' % hashlib.md5(body).hexdigest() for name, body in files.items()}
+    stats = {"full": 0, "not_modified": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            name = self.path.lstrip("/")
+            if name not in files:
+                self.send_error(404)
+                return
+            if self.headers.get("If-None-Match") == etags[name]:
+                stats["not_modified"] += 1
+                self.send_response(304)
+                self.send_header("ETag", etags[name])
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            stats["full"] += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(len(files[name])))
+            self.send_header("ETag", etags[name])
+            self.end_headers()
+            self.wfile.write(files[name])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=32)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="Server latency per request in seconds")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = make_pdf(f"{tmp}/source.pdf", make_pages(args.pages))
+        with open(pdf, "rb") as f:
+            body = f.read()
+        files = {f"doc{i}.pdf": body + b"%" + str(i).encode() for i in range(args.files)}
+        server = serve(files, args.latency)
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        urls = [f"{base}/{name}" for name in files]
+
+        sequential = Downloader(cache_dir=f"{tmp}/sequential", max_workers=1, per_host=1)
+        start = time.perf_counter()
+        for url in urls:
+            sequential.fetch(url)
+        t_sequential = time.perf_counter() - start
+
+        concurrent = Downloader(cache_dir=f"{tmp}/concurrent", max_workers=args.workers, per_host=args.workers)
+        start = time.perf_counter()
+        first = concurrent.fetch_many(urls)
+        t_concurrent = time.perf_counter() - start
+
+        full_before = server.stats["full"]
+        start = time.perf_counter()
+        second = concurrent.fetch_many(urls)
+        t_refetch = time.perf_counter() - start
+        server.shutdown()
+
+    print(f"sequential:  {t_sequential:.3f}s ({len(urls) / t_sequential:.1f} files/s)")
+    print(f"concurrent:  {t_concurrent:.3f}s ({len(urls) / t_concurrent:.1f} files/s, {t_sequential / t_concurrent:.1f}x)")
+    print(f"revalidate:  {t_refetch:.3f}s ({server.stats['not_modified']} not modified)")
+
+    if not all(r.ok and r.changed for r in first):
+        print("FAIL: first fetch did not download every file")
+        return 1
+    if server.stats["full"] != full_before or any(r.changed for r in second):
+        print("FAIL: unchanged files were downloaded again")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
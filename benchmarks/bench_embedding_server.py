@@ -0,0 +1,81 @@
+"""Measure the shared embedding server against every process embedding on its own.
+
+Several client processes embed queries one at a time, either with their own
+copy of the (stub) model or through one ``EmbeddingServer`` that batches
+requests across clients. Each model copy pays ``--load-seconds``, standing
+in for loading all-MiniLM-L6-v2. The stub's latency is a sleep, so separate
+copies do not contend for CPU the way real models do; compare the number of
+resident models and model calls rather than QPS alone. Run with::
+
+    python -m benchmarks.bench_embedding_server --clients 8 --queries 200
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from typing import List, Tuple
+
+from benchmarks.synthetic import LatencyEmbeddings
+from rag_app.utils.embedding_server import EmbeddingClient, EmbeddingServer
+
+
+def run_client(args: Tuple[str, int, int, float]) -> List[float]:
+    address, client, queries, load_seconds = args
+    if address:
+        embeddings = EmbeddingClient(address)
+    else:
+        time.sleep(load_seconds)
+        embeddings = LatencyEmbeddings(size=384)
+    latencies = []
+    for i in range(queries):
+        start = time.perf_counter()
+        embeddings.embed_query(f"client {client} query {i}")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run(address: str, clients: int, queries: int, load_seconds: float) -> Tuple[float, List[float]]:
+    start = time.perf_counter()
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(run_client, [(address, c, queries, load_seconds) for c in range(clients)])
+    return time.perf_counter() - start, [latency for latencies in results for latency in latencies]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=200, help="Queries per client")
+    parser.add_argument("--load-seconds", type=float, default=2.0)
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore")
+
+    total = args.clients * args.queries
+    print(f"{args.clients} clients x {args.queries} queries")
+    print(f"{'mode':<10} {'wall s':>8} {'QPS':>8} {'p50 ms':>8} {'p95 ms':>8} {'models':>7} {'calls':>7}")
+
+    # Every process loads its own model in parallel before its queries
+    elapsed, latencies = run("", args.clients, args.queries, args.load_seconds)
+    p50, p95 = statistics.median(latencies) * 1000, statistics.quantiles(latencies, n=100)[94] * 1000
+    qps = total / (elapsed - args.load_seconds)
+    print(f"{'per-proc':<10} {elapsed:>8.2f} {qps:>8.0f} {p50:>8.2f} {p95:>8.2f} {args.clients:>7} {total:>7}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        address = "unix:" + os.path.join(tmp, "embeddings.sock")
+        start = time.perf_counter()
+        time.sleep(args.load_seconds)
+        server = EmbeddingServer(LatencyEmbeddings(size=384), address, model_name="stub").start()
+        load = time.perf_counter() - start
+        elapsed, latencies = run(address, args.clients, args.queries, args.load_seconds)
+        calls = server.batcher.batches
+        server.shutdown()
+    p50, p95 = statistics.median(latencies) * 1000, statistics.quantiles(latencies, n=100)[94] * 1000
+    print(f"{'server':<10} {elapsed + load:>8.2f} {total / elapsed:>8.0f} {p50:>8.2f} {p95:>8.2f} {1:>7} {calls:>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
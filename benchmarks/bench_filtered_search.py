@@ -0,0 +1,144 @@
+"""Measure search latency with source and page filters of varying selectivity.
+
+A matrix store holds chunks of many documents, each split over pages. For
+each kind of filter the benchmark compares three ways of answering it:
+
+* pushdown: the store's metadata index turns the filter into the matching
+  rows, and few matching rows are scored directly. The cold pass uses a new
+  filter per query, so every row lookup is built; the warm pass repeats
+  them, so they come from the store's cache.
+* metadata scan: a row mask built by evaluating the filter on every row's
+  metadata dict, then a masked search, as before the metadata index.
+* post-filter: an unfiltered search for ``k * overfetch`` chunks whose
+  non-matching hits are dropped afterwards. It is fast but returns fewer than
+  ``k`` chunks, or the wrong ones, when the filter is selective.
+
+Recall@k is measured against an exact search over just the matching rows.
+Run with::
+
+    python -m benchmarks.bench_filtered_search --size 200000 --sources 256
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from typing import Callable, Dict, List
+
+from benchmarks.bench_vector_backends import make_queries, make_vectors
+
+import numpy as np
+from langchain_core.documents import Document
+
+from rag_app.utils.filters import metadata_filter, metadata_matches
+from rag_app.utils.vectorstores import MatrixVectorStore, add_embedded_chunks
+
+
+def timed(search: Callable[[int], List[int]], n: int) -> Dict:
+    times, results = [], []
+    for i in range(n):
+        start = time.perf_counter()
+        results.append(search(i))
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {"p50": statistics.median(times) * 1000, "p95": times[int(0.95 * (len(times) - 1))] * 1000, "ids": results}
+
+
+def recall(results: List[List[int]], truth: List[List[int]]) -> float:
+    expected = sum(len(t) for t in truth)
+    return sum(len(set(r) & set(t)) for r, t in zip(results, truth)) / expected if expected else 1.0
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--sources", type=int, default=256, help="Documents the chunks belong to")
+    parser.add_argument("--chunks-per-page", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--overfetch", type=int, default=10, help="Post-filter searches fetch k * overfetch chunks")
+    parser.add_argument("--index", choices=["exact", "hnsw"], default="exact")
+    parser.add_argument("--quantization", choices=["none", "int8", "float16"], default="none")
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore")
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.size, rng)
+    queries = make_queries(vectors, args.queries, rng)
+    per_source = -(-args.size // args.sources)
+    # Documents are ingested one after another, so each source is a contiguous run of rows
+    metadatas = [
+        {"source": f"doc-{i // per_source}.pdf", "page": (i % per_source) // args.chunks_per_page}
+        for i in range(args.size)
+    ]
+    pages = -(-per_source // args.chunks_per_page)
+    tenth = max(1, args.sources // 10)
+    kinds = {
+        "one source": lambda i: metadata_filter(f"doc-{i % args.sources}.pdf"),
+        "source + 5 pages": lambda i: metadata_filter(
+            f"doc-{i % args.sources}.pdf", (i % pages, i % pages + 4)
+        ),
+        "10% of sources": lambda i: metadata_filter(
+            [f"doc-{(i + j) % args.sources}.pdf" for j in range(tenth)]
+        ),
+        "pages in all sources": lambda i: metadata_filter(pages=(i % pages, i % pages + max(1, pages // 10) - 1)),
+    }
+
+    print(
+        f"{args.size} rows in {args.sources} documents of {pages} pages, {args.queries} queries, k={args.k}, "
+        f"index={args.index}, quantization={args.quantization}"
+    )
+    print(
+        f"{'filter':<21} {'match %':>8} {'push cold ms':>13} {'push warm ms':>13} {'p95 ms':>8} {'recall':>7} "
+        f"{'scan ms':>8} {'post ms':>8} {'post recall':>12}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        store = MatrixVectorStore(os.path.join(tmp, "matrix"), None, index=args.index, quantization=args.quantization)
+        ids = [str(i) for i in range(args.size)]
+        for start in range(0, args.size, 50_000):
+            end = start + 50_000
+            chunks = [Document(page_content="", metadata=m) for m in metadatas[start:end]]
+            add_embedded_chunks(store, chunks, ids[start:end], vectors[start:end])
+        store.similarity_search_ids_by_vector(queries[0], k=args.k)  # Build lazily created indexes
+
+        for name, make_filter in kinds.items():
+            filters = [make_filter(i) for i in range(args.queries)]
+            masks = [np.fromiter((metadata_matches(m, f) for m in metadatas), bool, args.size) for f in filters]
+            truth = []
+            for query, mask in zip(queries, masks):
+                rows = np.flatnonzero(mask)
+                truth.append(rows[np.argsort(-(vectors[rows] @ query))[:args.k]].tolist())
+
+            def pushdown(i: int) -> List[int]:
+                return [int(r) for r, _ in store.similarity_search_ids_by_vector(queries[i], k=args.k, filter=filters[i])]
+
+            def scan(i: int) -> List[int]:
+                allowed = np.fromiter((metadata_matches(m, filters[i]) for m in store._metadatas), bool, args.size)
+                return [
+                    r for r, _ in (
+                        store._hnsw_search(queries[i], args.k, allowed) if store._use_hnsw()
+                        else store._exact_search(queries[i], args.k, allowed)
+                    )
+                ]
+
+            def post_filter(i: int) -> List[int]:
+                hits = store.similarity_search_ids_by_vector(queries[i], k=args.k * args.overfetch)
+                return [int(r) for r, _ in hits if masks[i][int(r)]][:args.k]
+
+            cold = timed(pushdown, args.queries)
+            warm = timed(pushdown, args.queries)
+            scanned = timed(scan, args.queries)
+            post = timed(post_filter, args.queries)
+            share = 100 * sum(int(m.sum()) for m in masks) / (args.size * args.queries)
+            print(
+                f"{name:<21} {share:>8.2f} {cold['p50']:>13.2f} {warm['p50']:>13.2f} {warm['p95']:>8.2f} "
+                f"{recall(warm['ids'], truth):>7.3f} {scanned['p50']:>8.2f} {post['p50']:>8.2f} "
+                f"{recall(post['ids'], truth):>12.3f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""Compare dense, lexical and hybrid retrieval on a synthetic corpus with part numbers.
+
+Half of the queries ask for an exact part number, the other half paraphrase
+the topic of a page. Run with::
+
+    python -m benchmarks.bench_hybrid_retrieval --pages 2000 --queries 400
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from typing import Dict, List, Tuple
+
+from langchain_core.documents import Document
+
+from benchmarks.synthetic import VOCABULARY, BagOfWordsEmbeddings, random_text
+from rag_app.utils import resources
+
+
+def make_corpus(n_pages: int, seed: int = 3) -> Tuple[List[Document], List[Tuple[str, int]]]:
+    """Return pages that each mention a unique part number, plus labelled queries."""
+    rng = random.Random(seed)
+    pages, queries = [], []
+    for page in range(n_pages):
+        part = f"PN-{rng.randrange(10000, 99999)}-{chr(65 + page % 26)}"
+        topic = rng.sample(VOCABULARY[100:], 3)
+        text = f"{' '.join(topic)}. Part {part} is described here. " + random_text(120, rng)
+        pages.append(Document(page_content=text, metadata={"source": "catalog.pdf", "page": page}))
+        if rng.random() < 0.5:
+            queries.append((f"where is part {part} described", page))
+        else:
+            queries.append((f"what does the catalog say about {' '.join(topic)}", page))
+    rng.shuffle(queries)
+    return pages, queries
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--dim", type=int, default=2048, help="Size of the stub embedding vectors")
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore")
+
+    pages, queries = make_corpus(args.pages)
+    queries = queries[:args.queries]
+    results: Dict[str, Tuple[float, List[float]]] = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        resources.configure(embeddings=BagOfWordsEmbeddings(size=args.dim), persist_directory=tmp)
+        from rag_app.agent import ingest_documents
+        from rag_app.utils.nodes import clear_query_caches, materialize, retrieve
+
+        # Pages are short enough to stay a single chunk each
+        ingest_documents(pages)
+        vectorstore = resources.get_vectorstore()
+        lexical_index = resources.get_lexical_index()
+        chunk_store = resources.get_chunk_store()
+
+        for mode in ("dense", "lexical", "hybrid"):
+            clear_query_caches()
+            hits, latencies = 0, []
+            for query, page in queries:
+                state = {"query": query, "query_embedding": None, "context_ids": None, "response": None}
+                start = time.perf_counter()
+                ids = retrieve(state, vectorstore, k=args.k, mode=mode, lexical_index=lexical_index)["context_ids"]
+                latencies.append(time.perf_counter() - start)
+                hits += any(doc.metadata.get("page") == page for _, doc in materialize(ids, chunk_store))
+            results[mode] = (hits / len(queries), latencies)
+
+    print(f"{'mode':<8} {'recall@' + str(args.k):>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode, (recall, latencies) in results.items():
+        p50 = statistics.median(latencies) * 1000
+        p95 = statistics.quantiles(latencies, n=20)[-1] * 1000
+        print(f"{mode:<8} {recall:>9.3f} {p50:>8.2f} {p95:>8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""Guard CLI cold-start time and check that heavy modules stay unimported.
+
+Run with::
+
+    python -m benchmarks.bench_import_time --runs 5 --max-seconds 0.5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+HEAVY_MODULES = ("torch", "sentence_transformers", "chromadb")
+
+
+def time_command(command: List[str], runs: int) -> float:
+    """Return the median wall time of ``command`` over ``runs`` runs."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def loaded_heavy_modules(module: str) -> List[str]:
+    """Import ``module`` in a fresh interpreter and list heavy modules it pulled in."""
+    code = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], text=True, stderr=subprocess.DEVNULL)
+    return [m for m in output.strip().split(",") if m]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=0.5, help="Limit for `rag_app.cli --help`")
+    args = parser.parse_args(argv)
+
+    baseline = time_command([sys.executable, "-c", "pass"], args.runs)
+    cli_help = time_command([sys.executable, "-m", "rag_app.cli", "--help"], args.runs)
+    print(f"python startup:          {baseline:.3f}s")
+    print(f"rag_app.cli --help:      {cli_help:.3f}s")
+
+    failed = False
+    if cli_help > args.max_seconds:
+        print(f"FAIL: `rag_app.cli --help` took {cli_help:.3f}s (limit {args.max_seconds}s)")
+        failed = True
+    for module in ("rag_app.cli", "rag_app.agent"):
+        heavy = loaded_heavy_modules(module)
+        print(f"import {module:<14} loads: {', '.join(heavy) or 'no heavy modules'}")
+        if heavy:
+            print(f"FAIL: importing {module} loaded {', '.join(heavy)}")
+            failed = True
+
+    if failed:
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Compare int8 and float16 quantized search with rescoring against float32 storage.
+
+Reports the memory the search keeps resident and the disk used per million
+chunks, QPS and recall@k against an exact float32 search, for the matrix
+store with and without quantization and for Chroma (the default backend).
+Run with::
+
+    python -m benchmarks.bench_quantization --size 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import warnings
+from typing import List
+
+from benchmarks.bench_vector_backends import (
+    exact_neighbours,
+    load_chroma,
+    load_matrix_store,
+    make_queries,
+    make_vectors,
+    measure,
+)
+
+import numpy as np
+
+
+def directory_bytes(directory: str, suffixes: tuple = ("",)) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(directory)
+        for name in names
+        if name.endswith(suffixes)
+    )
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--rescore-factor", type=int, default=8)
+    parser.add_argument("--skip-chroma", action="store_true")
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore")
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.size, rng)
+    queries = make_queries(vectors, args.queries, rng)
+    truth = exact_neighbours(vectors, queries, args.k)
+    per_million = 1e6 / args.size / 1e6
+
+    configs = {
+        "float32": dict(dtype="float32", index="exact"),
+        "float16": dict(dtype="float16", index="exact"),
+        "int8+rescore": dict(dtype="float32", index="exact", quantization="int8"),
+        "float16+rescore": dict(dtype="float32", index="exact", quantization="float16"),
+    }
+    print(f"{args.size} rows, {args.queries} queries, rescore factor {args.rescore_factor}")
+    print(f"{'storage':<16} {'RAM MB/1M':>10} {'disk MB/1M':>11} {'QPS':>8} {'recall@' + str(args.k):>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, kwargs in configs.items():
+            directory = os.path.join(tmp, name)
+            store = load_matrix_store(directory, vectors, rescore_factor=args.rescore_factor, **kwargs)
+
+            def search(query, store=store):
+                hits = store.similarity_search_by_vector_with_score(query, k=args.k)
+                return [doc.metadata["row"] for doc, _ in hits]
+
+            result = measure(search, queries, truth, args.k)
+            # The scan reads the quantized codes when there are any, otherwise every stored vector
+            scanned = ("codes.bin", "scales.bin") if store.quantization != "none" else ("vectors.bin",)
+            resident = directory_bytes(directory, scanned) * per_million
+            disk = directory_bytes(directory) * per_million
+            print(f"{name:<16} {resident:>10.0f} {disk:>11.0f} {result['qps']:>8.0f} {result['recall']:>9.3f}")
+
+        if not args.skip_chroma:
+            directory = os.path.join(tmp, "chroma")
+            chroma = load_chroma(directory, vectors)
+
+            def search(query):
+                result = chroma._collection.query(query_embeddings=[query.tolist()], n_results=args.k, include=["metadatas"])
+                return [m["row"] for m in result["metadatas"][0]]
+
+            result = measure(search, queries, truth, args.k)
+            # Chroma keeps its HNSW segment (float32 vectors plus graph links) in memory
+            del chroma
+            resident = directory_bytes(directory, (".bin",)) * per_million
+            disk = directory_bytes(directory) * per_million
+            print(f"{'chroma':<16} {resident:>10.0f} {disk:>11.0f} {result['qps']:>8.0f} {result['recall']:>9.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""Trade reranking latency against precision on a corpus with word-order distractors.
+
+Every query names a phrase that appears verbatim on one page, while up to
+six shorter distractor pages contain the same words out of order, so a
+bag-of-words retriever often ranks them first. Each configuration reports retrieve and
+rerank latency, the average number of candidates scored and hit@1/recall@3.
+``--model`` scores with a real cross-encoder instead of the offline stub.
+Run with::
+
+    python -m benchmarks.bench_rerank --topics 300 --candidates 20
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from typing import List, Tuple
+
+from langchain_core.documents import Document
+
+from benchmarks.synthetic import VOCABULARY, BagOfWordsEmbeddings, BigramCrossEncoder, random_text
+from rag_app.utils import resources
+
+
+def make_corpus(n_topics: int, seed: int = 4) -> Tuple[List[Document], List[Tuple[str, int]]]:
+    """Return pages and ``(query, relevant page)`` pairs."""
+    rng = random.Random(seed)
+    pages, queries = [], []
+    for topic in range(n_topics):
+        words = rng.sample(VOCABULARY[200:], 4)
+        relevant = len(pages)
+        pages.append(f"{random_text(60, rng)} {' '.join(words)} {random_text(60, rng)}")
+        for _ in range(rng.randint(0, 6)):
+            scattered = words[:]
+            rng.shuffle(scattered)
+            pages.append(" ".join(f"{word} {random_text(4, rng)}" for word in scattered))
+        queries.append((" ".join(words), relevant))
+    documents = [Document(page_content=text, metadata={"source": "phrases.pdf", "page": i}) for i, text in enumerate(pages)]
+    rng.shuffle(queries)
+    return documents, queries
+
+
+def percentile(values: List[float], q: int) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--topics", type=int, default=300)
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--model", help="Cross-encoder model name, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2")
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore")
+
+    documents, queries = make_corpus(args.topics)
+    with tempfile.TemporaryDirectory() as tmp:
+        resources.configure(embeddings=BagOfWordsEmbeddings(size=1024), persist_directory=tmp)
+        from rag_app.agent import ingest_documents
+        from rag_app.utils.nodes import clear_query_caches, materialize, retrieve
+        from rag_app.utils.rerank import Reranker, load_cross_encoder
+
+        ingest_documents(documents)
+        vectorstore = resources.get_vectorstore()
+        chunk_store = resources.get_chunk_store()
+        scorer = load_cross_encoder(args.model) if args.model else BigramCrossEncoder()
+
+        configs = {
+            "no rerank": None,
+            "full depth": dict(decisive_z=float("inf"), budget=float("inf")),
+            "adaptive": dict(decisive_z=2.0, budget=float("inf")),
+            "adaptive 20ms": dict(decisive_z=2.0, budget=0.02),
+        }
+        print(f"{len(documents)} pages, {len(queries)} queries, {args.candidates} candidates")
+        print(
+            f"{'config':<14} {'retrieve p50':>12} {'rerank p50':>11} {'rerank p95':>11} "
+            f"{'depth':>6} {'hit@1':>6} {'recall@3':>9}"
+        )
+        for name, kwargs in configs.items():
+            clear_query_caches()
+            reranker = Reranker(scorer, **kwargs) if kwargs is not None else None
+            retrieve_times, rerank_times, depths = [], [], []
+            hits = found = 0
+            for query, relevant in queries:
+                state = {"query": query, "query_embedding": None, "context_ids": None, "response": None}
+                start = time.perf_counter()
+                ids = retrieve(state, vectorstore, k=args.candidates if reranker else 3)["context_ids"]
+                materialized = materialize(ids, chunk_store)
+                candidates = [doc for _, doc in materialized]
+                retrieve_times.append(time.perf_counter() - start)
+                if reranker is not None:
+                    scored = len(reranker.cache)
+                    start = time.perf_counter()
+                    context = reranker.rerank(query, candidates, 3, ids=[i for i, _ in materialized])
+                    rerank_times.append(time.perf_counter() - start)
+                    depths.append(len(reranker.cache) - scored)
+                else:
+                    context = candidates
+                pages = [doc.metadata["page"] for doc in context]
+                hits += bool(pages) and pages[0] == relevant
+                found += relevant in pages
+
+            rerank_p50 = percentile(rerank_times, 50) * 1000 if rerank_times else 0.0
+            rerank_p95 = percentile(rerank_times, 95) * 1000 if rerank_times else 0.0
+            depth = statistics.mean(depths) if depths else 0.0
+            print(
+                f"{name:<14} {percentile(retrieve_times, 50) * 1000:>12.2f} {rerank_p50:>11.2f} {rerank_p95:>11.2f} "
+                f"{depth:>6.1f} {hits / len(queries):>6.3f} {found / len(queries):>9.3f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Measure how much work an interrupted PDF ingest repeats when it is run again.
+
+A synthetic PDF is synced in batches and interrupted part way through. The
+rest of the ingest is then run without a job store, which re-splits every
+page and looks up every chunk before skipping the stored ones, and with the
+job store, which resumes after the last checkpointed batch. Embedding uses a
+stub with a fixed cost per call and per text. Run with::
+
+    python -m benchmarks.bench_resume --pages 400 --interrupt-at 0.5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+from typing import List
+
+from benchmarks.synthetic import LatencyEmbeddings, make_pages, make_pdf
+
+from rag_app.utils import resources
+from rag_app.utils.manifest import sync_pdf
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptingEmbeddings(LatencyEmbeddings):
+    """Stub embeddings that raise after a number of calls, like a crash mid-ingest."""
+
+    calls: int = 0
+    fail_after: int = -1
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if 0 <= self.fail_after < self.calls:
+            raise Interrupted()
+        return super().embed_documents(texts)
+
+
+def run(pdf: str, directory: str, batch_size: int, interrupt_after: int, use_jobs: bool) -> dict:
+    """Interrupt an ingest after ``interrupt_after`` batches, then time running it again to the end."""
+    embeddings = InterruptingEmbeddings(size=384, fail_after=interrupt_after)
+    resources.configure(embeddings=embeddings, persist_directory=directory)
+
+    def sync():
+        return sync_pdf(
+            resources.get_vectorstore(),
+            pdf,
+            resources.get_manifest(),
+            batch_size=batch_size,
+            lexical_index=resources.get_lexical_index(),
+            chunk_store=resources.get_chunk_store(),
+            jobs=resources.get_job_store() if use_jobs else None,
+        )
+
+    start = time.perf_counter()
+    try:
+        sync()
+    except Interrupted:
+        pass
+    first = time.perf_counter() - start
+    first_calls = embeddings.calls
+    embeddings.fail_after = -1
+    embeddings.calls = 0
+    start = time.perf_counter()
+    result = sync()
+    return {
+        "first": first,
+        "first_calls": first_calls,
+        "rerun": time.perf_counter() - start,
+        "calls": embeddings.calls,
+        "chunks": len(resources.get_vectorstore().get(include=[])["ids"]),
+        "resumed": result.resumed_pages,
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--interrupt-at", type=float, default=0.5, help="Share of batches written before the crash")
+    parser.add_argument("--backend", choices=["matrix", "chroma"], default="matrix")
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore")
+    os.environ["RAG_VECTOR_BACKEND"] = args.backend
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = make_pdf(os.path.join(tmp, "manual.pdf"), make_pages(args.pages))
+        full = run(pdf, os.path.join(tmp, "full"), args.batch_size, -1, use_jobs=True)
+        batches = full["first_calls"]
+        interrupt_after = int(batches * args.interrupt_at)
+        restart = run(pdf, os.path.join(tmp, "restart"), args.batch_size, interrupt_after, use_jobs=False)
+        resume = run(pdf, os.path.join(tmp, "resume"), args.batch_size, interrupt_after, use_jobs=True)
+        resources.configure()
+
+    print(
+        f"{args.pages} pages, {full['chunks']} chunks in {batches} batches of {args.batch_size}, "
+        f"interrupted after {interrupt_after} batches ({args.backend})"
+    )
+    print(f"{'':<22} {'seconds':>8} {'embed calls':>12} {'pages skipped':>14} {'chunks':>8}")
+    print(f"{'uninterrupted':<22} {full['first']:>8.2f} {batches:>12} {'-':>14} {full['chunks']:>8}")
+    for name, r in (("rerun without job", restart), ("resume job", resume)):
+        print(f"{name:<22} {r['rerun']:>8.2f} {r['calls']:>12} {r['resumed']:>14} {r['chunks']:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
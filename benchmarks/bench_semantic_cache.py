@@ -0,0 +1,92 @@
+"""Measure the semantic query cache on a workload of paraphrased questions.
+
+Queries are drawn from a fixed set of intents, each asked with varying
+phrasing, and run through ``rag_app.agent.process_query``. The cache is
+opt-in, so this turns it on unless ``RAG_SEMANTIC_CACHE`` is set. Run with::
+
+    python -m benchmarks.bench_semantic_cache --queries 2000 --intents 50
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from typing import List
+
+from benchmarks.synthetic import WORDS, BagOfWordsEmbeddings, LatencyEmbeddings, make_documents
+from rag_app.utils import resources
+
+TEMPLATES = [
+    "what does this document say about {}",
+    "what does the document say about {}?",
+    "tell me about {}",
+    "tell me about {} please",
+    "summarize {}",
+    "explain {}",
+]
+
+
+class SlowBagOfWords(BagOfWordsEmbeddings):
+    """Bag-of-words embeddings with MiniLM-like per-call latency."""
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(LatencyEmbeddings.call_latency + LatencyEmbeddings.text_latency)
+        return super().embed_query(text)
+
+
+def make_workload(n_queries: int, n_intents: int, seed: int = 2) -> List[str]:
+    """Return queries that repeat ``n_intents`` topics with different phrasing."""
+    rng = random.Random(seed)
+    intents = [" ".join(rng.sample(WORDS, 4)) for _ in range(n_intents)]
+    return [rng.choice(TEMPLATES).format(rng.choice(intents)) for _ in range(n_queries)]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--intents", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=200)
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore")
+
+    os.environ.setdefault("RAG_SEMANTIC_CACHE", "1")
+    queries = make_workload(args.queries, args.intents)
+    with tempfile.TemporaryDirectory() as tmp:
+        resources.configure(embeddings=SlowBagOfWords(), persist_directory=tmp)
+        from rag_app.agent import ingest_documents, process_query
+        from rag_app.utils.nodes import clear_query_caches, semantic_cache
+
+        if semantic_cache is None:
+            print("Semantic cache is disabled (RAG_SEMANTIC_CACHE=0)")
+            return 1
+        ingest_documents(make_documents(args.pages))
+
+        # Compare against the same graph with the semantic cache switched off
+        threshold = semantic_cache.threshold
+        results = {}
+        for label, value in (("no semantic cache", 2.0), ("semantic cache", threshold)):
+            clear_query_caches()
+            semantic_cache.threshold = value
+            hits, saved = semantic_cache.hits, semantic_cache.saved_seconds
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                process_query(query)
+                latencies.append(time.perf_counter() - start)
+            results[label] = latencies
+        semantic_cache.threshold = threshold
+        hits, saved = semantic_cache.hits - hits, semantic_cache.saved_seconds - saved
+
+    for label, latencies in results.items():
+        p50 = statistics.median(latencies) * 1000
+        p95 = statistics.quantiles(latencies, n=20)[-1] * 1000
+        print(f"{label:<18} total {sum(latencies):6.2f}s  p50 {p50:6.2f}ms  p95 {p95:6.2f}ms")
+    print(f"hit rate {hits / len(queries):.1%} ({hits} hits), estimated latency saved {saved:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""Measure search latency as the vector store is split into more shards.
+
+Every shard is a matrix store searched exactly. Reports the median and p95
+latency of a search fanned out over every shard, and of a search routed by
+a ``source`` filter to the one shard holding that document, together with
+recall@k of the fanned-out search against an unsharded exact search. The
+first search with a new filter also looks up the matching rows in the
+shard's metadata index, which are cached; routed latencies are measured once
+every lookup is done and reported separately as a cold pass. Run with::
+
+    python -m benchmarks.bench_sharding --size 200000 --shards 1 2 4 8
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from typing import Callable, Dict, List
+
+from benchmarks.bench_vector_backends import exact_neighbours, make_queries, make_vectors
+
+import numpy as np
+from langchain_core.documents import Document
+
+from rag_app.utils.vectorstores import MatrixVectorStore, ShardedVectorStore
+
+
+def latencies(search: Callable[[int], List[int]], n: int) -> Dict[str, float]:
+    search(0)  # Open memory maps outside the timed loop
+    times = []
+    for i in range(n):
+        start = time.perf_counter()
+        search(i)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {"p50": statistics.median(times) * 1000, "p95": times[int(0.95 * (len(times) - 1))] * 1000}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=200_000)
+    parser.add_argument("--sources", type=int, default=64, help="Documents the chunks belong to")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--by", choices=["source", "hash"], default="source")
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore")
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.size, rng)
+    queries = make_queries(vectors, args.queries, rng)
+    truth = exact_neighbours(vectors, queries, args.k)
+    sources = [f"doc-{i % args.sources}.pdf" for i in range(args.size)]
+    chunks = [Document(page_content="", metadata={"source": s, "page": i}) for i, s in enumerate(sources)]
+    ids = [str(i) for i in range(args.size)]
+    # Each query is routed to the document of its nearest neighbour
+    filters = [{"source": sources[min(expected)]} for expected in truth]
+
+    print(f"{args.size} rows in {args.sources} documents, {args.queries} queries, k={args.k}, {os.cpu_count()} CPUs")
+    print(
+        f"{'shards':>6} {'fan-out p50 ms':>15} {'p95 ms':>8} {'recall@' + str(args.k):>9} "
+        f"{'routed p50 ms':>14} {'p95 ms':>8} {'cold p50 ms':>12}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.shards:
+            directory = os.path.join(tmp, f"{count}-shards")
+            store = ShardedVectorStore(
+                os.path.join(directory, "shards.json"),
+                lambda i: MatrixVectorStore(os.path.join(directory, f"shard-{i}"), None, index="exact"),
+                None,
+                count=count,
+                strategy=args.by,
+            )
+            for start in range(0, args.size, 50_000):
+                end = start + 50_000
+                store.add_embedded(chunks[start:end], ids[start:end], vectors[start:end])
+
+            def fan_out(i: int) -> List[int]:
+                hits = store.similarity_search_by_vector_with_score(queries[i], k=args.k)
+                return [doc.metadata["page"] for doc, _ in hits]
+
+            def routed(i: int) -> List[int]:
+                hits = store.similarity_search_by_vector_with_score(queries[i], k=args.k, filter=filters[i])
+                return [doc.metadata["page"] for doc, _ in hits]
+
+            recall = sum(len(set(fan_out(i)) & truth[i]) for i in range(args.queries)) / (args.k * args.queries)
+            full = latencies(fan_out, args.queries)
+            cold = latencies(routed, args.queries)
+            narrow = latencies(routed, args.queries)
+            print(
+                f"{count:>6} {full['p50']:>15.2f} {full['p95']:>8.2f} {recall:>9.3f} "
+                f"{narrow['p50']:>14.2f} {narrow['p95']:>8.2f} {cold['p50']:>12.2f}"
+            )
+            store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""Check that streaming PDF ingest keeps peak memory flat as the page count grows.
+
+Each measurement runs in a fresh interpreter and reports the growth of peak
+RSS over the baseline taken right before ingest starts. Run with::
+
+    python -m benchmarks.bench_streaming_memory --pages 250 1000 2000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+from benchmarks.synthetic import NullVectorStore, make_pages, make_pdf
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_child(pdf_path: str, mode: str, batch_size: int) -> Dict:
+    """Ingest one PDF in this process and report the peak RSS growth."""
+    from rag_app.utils.tools import add_new_chunks, ingest_pdf_stream, load_pdf_from_path, split_documents
+
+    store = NullVectorStore()
+    baseline = _peak_rss_mb()
+    if mode == "stream":
+        ingest_pdf_stream(store, pdf_path, batch_size=batch_size)
+    else:
+        add_new_chunks(store, split_documents(load_pdf_from_path(pdf_path)))
+    return {"mode": mode, "chunks": store.count, "growth_mb": _peak_rss_mb() - baseline}
+
+
+def measure(pdf_path: str, mode: str, batch_size: int) -> Dict:
+    """Run ``run_child`` in a fresh interpreter."""
+    # Ingest bumps the collection version stored in the persist directory, so point that at the PDF's directory
+    env = {**os.environ, "RAG_PERSIST_DIRECTORY": os.path.dirname(pdf_path)}
+    output = subprocess.check_output(
+        [sys.executable, "-m", "benchmarks.bench_streaming_memory", "--child", pdf_path, mode, str(batch_size)],
+        text=True,
+        env=env,
+    )
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[250, 1000, 2000])
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--tolerance-mb", type=float, default=32.0, help="Allowed growth of the streaming peak")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        pdf_path, mode, batch_size = args.child
+        print(json.dumps(run_child(pdf_path, mode, int(batch_size))))
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_pages in args.pages:
+            pdf_path = make_pdf(os.path.join(tmp, f"{n_pages}.pdf"), make_pages(n_pages))
+            for mode in ("eager", "stream"):
+                result = measure(pdf_path, mode, args.batch_size)
+                result["pages"] = n_pages
+                results.append(result)
+                print(f"{n_pages:>6} pages  {mode:<6}  {result['chunks']:>7} chunks  peak +{result['growth_mb']:.1f} MB")
+
+    streamed = [r["growth_mb"] for r in results if r["mode"] == "stream"]
+    growth = max(streamed) - min(streamed)
+    if growth > args.tolerance_mb:
+        print(f"FAIL: streaming peak grew by {growth:.1f} MB across page counts (limit {args.tolerance_mb} MB)")
+        return 1
+    print(f"OK: streaming peak varied by {growth:.1f} MB across page counts")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
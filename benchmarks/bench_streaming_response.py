@@ -0,0 +1,76 @@
+"""Measure time to first byte of streamed responses against a blocking invoke.
+
+Run with::
+
+    python -m benchmarks.bench_streaming_response --queries 100 --words-per-page 2000
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from typing import List
+
+from benchmarks.synthetic import LatencyEmbeddings, make_documents, random_text
+from rag_app.utils import resources
+
+
+def percentile(values: List[float], q: int) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--words-per-page", type=int, default=2000)
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore")
+
+    rng = random.Random(2)
+    queries = [random_text(8, rng) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        resources.configure(embeddings=LatencyEmbeddings(size=384), persist_directory=tmp)
+        from rag_app.agent import ingest_documents, process_query, stream_query
+        from rag_app.utils.nodes import clear_query_caches
+
+        ingest_documents(make_documents(args.pages, args.words_per_page))
+
+        invoke_total, stream_first, stream_total = [], [], []
+        for query in queries:
+            clear_query_caches()
+            start = time.perf_counter()
+            expected = process_query(query)
+            invoke_total.append(time.perf_counter() - start)
+
+            clear_query_caches()
+            chunks = []
+            start = time.perf_counter()
+            for chunk in stream_query(query):
+                if not chunks:
+                    stream_first.append(time.perf_counter() - start)
+                chunks.append(chunk)
+            stream_total.append(time.perf_counter() - start)
+
+            if "".join(chunks) != expected:
+                print(f"FAIL: streamed response differs for {query!r}")
+                return 1
+
+    print(f"{'mode':<8} {'TTFB p50 ms':>12} {'TTFB p95 ms':>12} {'total p50 ms':>13}")
+    print(
+        f"{'invoke':<8} {percentile(invoke_total, 50) * 1000:>12.2f} {percentile(invoke_total, 95) * 1000:>12.2f} "
+        f"{percentile(invoke_total, 50) * 1000:>13.2f}"
+    )
+    print(
+        f"{'stream':<8} {percentile(stream_first, 50) * 1000:>12.2f} {percentile(stream_first, 95) * 1000:>12.2f} "
+        f"{percentile(stream_total, 50) * 1000:>13.2f}"
+    )
+    print("OK: streamed responses match invoke")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
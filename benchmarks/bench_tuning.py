@@ -0,0 +1,63 @@
+"""Run the tuning harness on a synthetic labeled corpus.
+
+Writes PDFs of random pages and one labeled query per sampled page, made of
+a sentence taken from that page, then reports chunks, index size, ingest
+time, query latency and recall for every chunk size, overlap and ``k``
+with the offline bag-of-words embeddings. Run with::
+
+    python -m benchmarks.bench_tuning --pdfs 4 --pages 25 --chunk-sizes 500 1000 --ks 1 3 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from typing import List
+
+from benchmarks.synthetic import BagOfWordsEmbeddings, make_pages, make_pdf
+
+from rag_app.utils.tuning import cheapest, format_results, run_grid
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdfs", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=25, help="Pages per PDF")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[500, 1000, 2000])
+    parser.add_argument("--chunk-overlaps", type=int, nargs="+", default=[0, 200])
+    parser.add_argument("--ks", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, "corpus")
+        os.makedirs(corpus)
+        pages = {}
+        for i in range(args.pdfs):
+            name = f"manual-{i}.pdf"
+            pages[name] = make_pages(args.pages, seed=i)
+            make_pdf(os.path.join(corpus, name), pages[name])
+        labels = []
+        for _ in range(args.queries):
+            name = rng.choice(sorted(pages))
+            page = rng.randrange(args.pages)
+            sentences = [s for s in pages[name][page].split(". ") if len(s.split()) >= 8]
+            labels.append({"query": rng.choice(sentences), "source": name, "page": page})
+
+        results = run_grid(
+            [corpus], labels, BagOfWordsEmbeddings(size=256), args.chunk_sizes, args.chunk_overlaps, args.ks, workers=1
+        )
+    print(f"{args.pdfs} PDFs of {args.pages} pages, {len(labels)} labeled queries")
+    print(format_results(results))
+    best = cheapest(results, args.min_recall)
+    if best:
+        print(f"Cheapest with recall >= {args.min_recall}: size={best.chunk_size} overlap={best.chunk_overlap} k={best.k}")
+    else:
+        print(f"No configuration reached recall {args.min_recall}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
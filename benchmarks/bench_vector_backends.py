@@ -0,0 +1,130 @@
+"""Compare QPS and recall of Chroma with the exact and HNSW matrix vector stores.
+
+Vectors are random unit vectors with the dimension of all-MiniLM-L6-v2, and
+queries are noisy copies of stored vectors. Recall@k is measured against an
+exact float32 search. Chroma is skipped above ``--chroma-max`` rows because
+loading it dominates the run time. Run with::
+
+    python -m benchmarks.bench_vector_backends --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from rag_app.utils.vectorstores import MatrixVectorStore
+
+DIM = 384
+
+
+def make_vectors(n: int, rng: np.random.Generator) -> np.ndarray:
+    vectors = rng.standard_normal((n, DIM), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(vectors: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    picks = vectors[rng.integers(0, len(vectors), n)]
+    queries = picks + 0.5 * rng.standard_normal(picks.shape, dtype=np.float32) / np.sqrt(DIM)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    scores = queries @ vectors.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def load_matrix_store(directory: str, vectors: np.ndarray, **kwargs) -> MatrixVectorStore:
+    store = MatrixVectorStore(directory, embedding_function=None, **kwargs)
+    for start in range(0, len(vectors), 50_000):
+        block = vectors[start:start + 50_000]
+        store.add_embeddings(
+            [("", v) for v in block],
+            metadatas=[{"row": start + i} for i in range(len(block))],
+            ids=[str(start + i) for i in range(len(block))],
+        )
+    return store
+
+
+def load_chroma(directory: str, vectors: np.ndarray):
+    from langchain_community.vectorstores import Chroma
+
+    store = Chroma(persist_directory=directory, embedding_function=None, collection_metadata={"hnsw:space": "ip"})
+    for start in range(0, len(vectors), 5000):
+        block = vectors[start:start + 5000]
+        store._collection.add(
+            ids=[str(start + i) for i in range(len(block))],
+            embeddings=block.tolist(),
+            metadatas=[{"row": start + i} for i in range(len(block))],
+            documents=[""] * len(block),
+        )
+    return store
+
+
+def measure(search: Callable[[np.ndarray], List[int]], queries: np.ndarray, truth: List[set], k: int) -> Dict:
+    search(queries[0])  # Build lazily created indexes outside the timed loop
+    found = 0
+    start = time.perf_counter()
+    for query, expected in zip(queries, truth):
+        found += len(expected & set(search(query)))
+    elapsed = time.perf_counter() - start
+    return {"qps": len(queries) / elapsed, "recall": found / (k * len(queries))}
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--chroma-max", type=int, default=100_000, help="Largest size also loaded into Chroma")
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore")
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>9} {'backend':<16} {'load s':>8} {'QPS':>9} {'recall@' + str(args.k):>9} {'disk MB':>8}")
+    for size in args.sizes:
+        vectors = make_vectors(size, rng)
+        queries = make_queries(vectors, args.queries, rng)
+        truth = exact_neighbours(vectors, queries, args.k)
+
+        backends = {
+            "exact-float32": dict(dtype="float32", index="exact"),
+            "exact-float16": dict(dtype="float16", index="exact"),
+            "hnsw-float32": dict(dtype="float32", index="hnsw"),
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, kwargs in backends.items():
+                directory = os.path.join(tmp, name)
+                start = time.perf_counter()
+                store = load_matrix_store(directory, vectors, **kwargs)
+                load = time.perf_counter() - start
+
+                def search(query, store=store):
+                    hits = store.similarity_search_by_vector_with_score(query, k=args.k)
+                    return [doc.metadata["row"] for doc, _ in hits]
+
+                result = measure(search, queries, truth, args.k)
+                store.persist()
+                disk = sum(e.stat().st_size for e in os.scandir(directory)) / 1e6
+                print(f"{size:>9} {name:<16} {load:>8.2f} {result['qps']:>9.0f} {result['recall']:>9.3f} {disk:>8.1f}")
+
+            if size <= args.chroma_max:
+                start = time.perf_counter()
+                chroma = load_chroma(os.path.join(tmp, "chroma"), vectors)
+                load = time.perf_counter() - start
+
+                def search(query):
+                    result = chroma._collection.query(query_embeddings=[query.tolist()], n_results=args.k, include=["metadatas"])
+                    return [m["row"] for m in result["metadatas"][0]]
+
+                result = measure(search, queries, truth, args.k)
+                print(f"{size:>9} {'chroma':<16} {load:>8.2f} {result['qps']:>9.0f} {result['recall']:>9.3f} {'':>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
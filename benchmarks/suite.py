@@ -0,0 +1,225 @@
+"""Run the ingest and query hot-path benchmarks and compare them with a baseline.
+
+Every case runs on a seeded synthetic corpus, offline, with a stub embedding
+model unless ``--model`` names a locally available sentence-transformers
+model. Each case is repeated and its median and p95 wall time are saved as
+JSON. With ``--baseline``, a case whose median is more than ``--threshold``
+slower than in the baseline is reported as a regression and the exit status
+is 1. Run with::
+
+    python -m benchmarks.suite --size small --output results.json
+    python -m benchmarks.suite --baseline results.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.synthetic import BagOfWordsEmbeddings, make_pages, make_pdf, random_text
+from rag_app.utils import resources
+
+# Pages, words per page and queries of each preset
+SIZES = {
+    "small": (50, 450, 50),
+    "medium": (300, 450, 200),
+    "large": (2000, 450, 500),
+}
+
+
+def measure(fn: Callable[[], Optional[int]], repeat: int, unit: str) -> Dict[str, float]:
+    """Time ``fn`` ``repeat`` times after one warm-up call.
+
+    ``fn`` returns how many ``unit`` items it processed, which gives the
+    throughput of the median run.
+    """
+    fn()
+    timings, items = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = fn() or 0
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    return {
+        "median_s": median,
+        "p95_s": sorted(timings)[min(len(timings) - 1, int(0.95 * len(timings)))],
+        "min_s": min(timings),
+        "repeat": repeat,
+        "throughput": items / median if median else 0.0,
+        "unit": unit,
+    }
+
+
+def measure_each(fn: Callable[[str], None], inputs: List[str], unit: str) -> Dict[str, float]:
+    """Time ``fn`` once per input, after one warm-up call, and report per-call latency."""
+    fn(inputs[0])
+    timings = []
+    for item in inputs:
+        start = time.perf_counter()
+        fn(item)
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    return {
+        "median_s": median,
+        "p95_s": statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else median,
+        "min_s": min(timings),
+        "repeat": len(timings),
+        "throughput": 1.0 / median if median else 0.0,
+        "unit": unit,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(pages: int, words: int, n_queries: int, repeat: int, model: Optional[str]) -> Dict[str, Dict]:
+    from rag_app.utils.tools import load_pdf_from_path, split_documents
+
+    if model:
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+
+        embeddings = HuggingFaceEmbeddings(model_name=model)
+    else:
+        embeddings = BagOfWordsEmbeddings(size=384)
+
+    rng = random.Random(11)
+    queries = [random_text(10, rng) for _ in range(n_queries)]
+    results: Dict[str, Dict] = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_pdf(os.path.join(tmp, "corpus.pdf"), make_pages(pages, words))
+
+        results["load_pdf_from_path"] = measure(lambda: len(load_pdf_from_path(pdf_path)), repeat, "pages/s")
+        documents = load_pdf_from_path(pdf_path)
+        results["split_documents"] = measure(lambda: len(split_documents(documents)), repeat, "pages/s")
+        chunks = split_documents(documents)
+        texts = [chunk.page_content for chunk in chunks]
+        results["embed_documents"] = measure(lambda: len(embeddings.embed_documents(texts)), repeat, "chunks/s")
+
+        from langchain_community.vectorstores import Chroma
+        from rag_app.utils.tools import chunk_id
+
+        ids = [chunk_id(chunk) for chunk in chunks]
+        runs = iter(range(repeat + 1))
+
+        def add_documents() -> int:
+            # A fresh collection each run, so every run writes the same chunks
+            store = Chroma(persist_directory=os.path.join(tmp, f"add-{next(runs)}"), embedding_function=embeddings)
+            store.add_documents(chunks, ids=ids)
+            return len(chunks)
+
+        results["add_documents"] = measure(add_documents, repeat, "chunks/s")
+
+        resources.configure(embeddings=embeddings, persist_directory=os.path.join(tmp, "store"))
+        from rag_app.agent import ingest_documents, process_query
+        from rag_app.utils.nodes import clear_query_caches, retrieve
+
+        ingest_documents(documents)
+        vectorstore = resources.get_vectorstore()
+
+        def retrieve_cold(query: str) -> None:
+            clear_query_caches()
+            state = {"query": query, "query_embedding": None, "context_ids": None, "response": None}
+            retrieve(state, vectorstore)
+
+        def process_query_cold(query: str) -> None:
+            clear_query_caches()
+            process_query(query)
+
+        results["retrieve"] = measure_each(retrieve_cold, queries, "queries/s")
+        results["process_query"] = measure_each(process_query_cold, queries, "queries/s")
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Print a comparison table and return the names of regressed cases."""
+    regressions = []
+    print(f"\n{'case':<20} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for name, current in results.items():
+        if name not in baseline:
+            print(f"{name:<20} {'-':>12} {current['median_s'] * 1000:>12.3f} {'new':>8}")
+            continue
+        before = baseline[name]["median_s"]
+        change = current["median_s"] / before - 1.0 if before else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<20} {before * 1000:>12.3f} {current['median_s'] * 1000:>12.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", choices=sorted(SIZES), default="small", help="Corpus size preset")
+    parser.add_argument("--pages", type=int, help="Override the number of pages of the preset")
+    parser.add_argument("--queries", type=int, help="Override the number of queries of the preset")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per ingest case")
+    parser.add_argument("--model", help="Local sentence-transformers model instead of the stub embeddings")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=0.25, help="Allowed relative slowdown of a median before failing"
+    )
+    args = parser.parse_args(argv)
+    warnings.filterwarnings("ignore")
+
+    pages, words, n_queries = SIZES[args.size]
+    pages = args.pages or pages
+    n_queries = args.queries or n_queries
+
+    results = run_suite(pages, words, n_queries, args.repeat, args.model)
+
+    print(f"{'case':<20} {'median ms':>10} {'p95 ms':>10} {'throughput':>12}")
+    for name, result in results.items():
+        print(
+            f"{name:<20} {result['median_s'] * 1000:>10.3f} {result['p95_s'] * 1000:>10.3f} "
+            f"{result['throughput']:>12.1f} {result['unit']}"
+        )
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "size": args.size,
+            "pages": pages,
+            "words_per_page": words,
+            "queries": n_queries,
+            "model": args.model or "stub",
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("pages") != pages or baseline["meta"].get("model") != report["meta"]["model"]:
+            print("Warning: the baseline was recorded with a different corpus size or model")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"FAIL: {len(regressions)} case(s) regressed by more than {args.threshold:.0%}")
+            return 1
+        print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
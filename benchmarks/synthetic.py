@@ -0,0 +1,194 @@
+"""Synthetic corpora and offline stand-ins used by the benchmarks."""
+import hashlib
+import itertools
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+WORDS = (
+    "system engineering requirement design interface module component analysis "
+    "verification validation lifecycle stakeholder architecture function performance "
+    "safety reliability model process integration test operation maintenance risk "
+    "schedule budget specification review baseline configuration control quality"
+).split()
+
+
+def _make_vocabulary(size: int, seed: int = 7) -> List[str]:
+    """Return ``WORDS`` followed by pronounceable pseudo-words, most frequent first."""
+    rng = random.Random(seed)
+    syllables = [c + v for c in "bcdfghklmnprstvz" for v in "aeiou"]
+    words = list(WORDS)
+    seen = set(words)
+    while len(words) < size:
+        word = "".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+VOCABULARY = _make_vocabulary(5000)
+# Zipf-like word frequencies, as in natural text
+_CUMULATIVE_WEIGHTS = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(VOCABULARY))))
+
+
+def random_text(n_words: int, rng: random.Random) -> str:
+    """Return ``n_words`` of pseudo-random prose split into sentences."""
+    words = rng.choices(VOCABULARY, cum_weights=_CUMULATIVE_WEIGHTS, k=n_words)
+    for i in range(11, n_words, 12):
+        words[i] += "."
+    return " ".join(words).capitalize() + "."
+
+
+def make_pages(n_pages: int, words_per_page: int = 450, seed: int = 0) -> List[str]:
+    """Return the text of ``n_pages`` synthetic pages."""
+    rng = random.Random(seed)
+    return [f"Page {i}. " + random_text(words_per_page, rng) for i in range(n_pages)]
+
+
+def make_documents(n_pages: int, words_per_page: int = 450, source: str = "synthetic.pdf", seed: int = 0) -> List[Document]:
+    """Return synthetic page documents with PyPDFLoader-style metadata."""
+    return [
+        Document(page_content=text, metadata={"source": source, "page": i})
+        for i, text in enumerate(make_pages(n_pages, words_per_page, seed))
+    ]
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(path: str, pages: List[str], line_width: int = 90) -> str:
+    """Write a minimal text PDF with one page per entry of ``pages``."""
+    font_id = 3 + 2 * len(pages)
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>",
+    ]
+    for i, text in enumerate(pages):
+        lines = [text[j:j + line_width] for j in range(0, len(text), line_width)]
+        stream = "BT /F1 9 Tf 36 806 Td 11 TL " + " ".join(f"({_escape(line)}) '" for line in lines) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+
+    with open(path, "wb") as f:
+        f.write(out)
+    return path
+
+
+def stub_embeddings(size: int = 384) -> DeterministicFakeEmbedding:
+    """Return an offline embedding model with MiniLM's dimensionality."""
+    return DeterministicFakeEmbedding(size=size)
+
+
+class NullVectorStore:
+    """Vector store stand-in that embeds chunks and then discards them."""
+
+    def __init__(self, embeddings=None):
+        self.embeddings = embeddings or stub_embeddings()
+        self.count = 0
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None) -> Dict:
+        return {"ids": []}
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        self.embeddings.embed_documents([d.page_content for d in documents])
+        self.count += len(documents)
+        return ids or []
+
+
+class LatencyEmbeddings(DeterministicFakeEmbedding):
+    """Stub embedding model with a fixed cost per call and a smaller cost per text.
+
+    This models the shape of a transformer forward pass, where batching many
+    texts into one call amortizes the per-call overhead.
+    """
+
+    call_latency: float = 0.004
+    text_latency: float = 0.0003
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.call_latency + self.text_latency * len(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.call_latency + self.text_latency)
+        return super().embed_query(text)
+
+
+class BagOfWordsEmbeddings(Embeddings):
+    """Offline embedding model that hashes the set of words into a fixed-size vector.
+
+    Unlike ``DeterministicFakeEmbedding`` texts that share words get similar
+    vectors, which makes retrieval quality and paraphrase matching measurable
+    without downloading a model.
+    """
+
+    def __init__(self, size: int = 384):
+        self.size = size
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        # Word presence rather than counts, so frequent words do not dominate
+        for word in {w.strip(".,;:!?'\"()") for w in text.lower().split()}:
+            if word:
+                digest = hashlib.md5(word.encode("utf-8")).digest()
+                vector[int.from_bytes(digest[:4], "little") % self.size] = 1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class BigramCrossEncoder:
+    """Stub cross-encoder that rewards query word pairs found in order in the passage.
+
+    Word order is what a bag-of-words retriever cannot see, so reranking with
+    it measurably improves precision. Each call costs a fixed latency plus a
+    smaller latency per pair, like a batched transformer forward pass.
+    """
+
+    def __init__(self, call_latency: float = 0.004, pair_latency: float = 0.002):
+        self.call_latency = call_latency
+        self.pair_latency = pair_latency
+        self.calls = 0
+
+    @staticmethod
+    def _words(text: str) -> List[str]:
+        return [w for w in (w.strip(".,;:!?'\"()") for w in text.lower().split()) if w]
+
+    def __call__(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        self.calls += 1
+        time.sleep(self.call_latency + self.pair_latency * len(pairs))
+        scores = []
+        for query, passage in pairs:
+            query_words, passage_words = self._words(query), self._words(passage)
+            bigrams = set(zip(passage_words, passage_words[1:]))
+            present = set(passage_words)
+            scores.append(
+                sum(pair in bigrams for pair in zip(query_words, query_words[1:]))
+                + 0.1 * sum(word in present for word in query_words)
+            )
+        return scores
@@ -1,40 +1,34 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List
 from langchain_core.documents import Document
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langgraph.graph import StateGraph
 import os
 from dotenv import load_dotenv
 
+from rag_app.utils.resources import get_chunk_store, get_lexical_index, get_vectorstore, save_indexes
+from rag_app.utils.settings import DEFAULT_TOP_K
+from rag_app.utils.tools import add_new_chunks, chunk_settings
+
 # Set environment variable to avoid tokenizer warnings
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 # Load environment variables
 load_dotenv()
 
-# Initialize embeddings
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
-
-# Initialize text splitter
+# Initialize text splitter with RAG_CHUNK_SIZE and RAG_CHUNK_OVERLAP
+chunk_size, chunk_overlap = chunk_settings()
 text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200,
+    chunk_size=chunk_size,
+    chunk_overlap=chunk_overlap,
     length_function=len
 )
 
-# Initialize vector store
-vectorstore = Chroma(
-    persist_directory="./data",
-    embedding_function=embeddings
-)
+# The embeddings and vector store are shared with rag_app and created on first use
 
 def retrieve(state: Dict) -> Dict:
     """Retrieve relevant documents based on the query."""
     query = state["query"]
-    docs = vectorstore.similarity_search(query, k=3)
+    docs = get_vectorstore().similarity_search(query, k=int(os.getenv("RAG_TOP_K", DEFAULT_TOP_K)))
     state["context"] = docs
     return state
 
@@ -88,8 +82,9 @@ def ingest_documents(documents: List[Document]) -> None:
     # Split documents into chunks
     chunks = text_splitter.split_documents(documents)
     
-    # Add chunks to vector store
-    vectorstore.add_documents(chunks)
+    # Add chunks that are not stored yet to the vector store, the BM25 index and the chunk store
+    add_new_chunks(get_vectorstore(), chunks, get_lexical_index(), get_chunk_store())
+    save_indexes()
     # No need to call persist() as Chroma 0.4.x automatically persists
 
 def process_query(query: str) -> str:
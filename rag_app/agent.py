@@ -1,15 +1,47 @@
 """RAG agent implementation using LangGraph."""
+import asyncio
 import os
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional
 from langchain_core.documents import Document
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph
 from dotenv import load_dotenv
 
+from rag_app.utils.settings import DEFAULT_TOP_K
 from rag_app.utils.state import RAGState
-from rag_app.utils.nodes import retrieve, generate
-from rag_app.utils.tools import split_documents
+from rag_app.utils.nodes import (
+    retrieve,
+    aretrieve,
+    generate,
+    agenerate,
+    rerank,
+    arerank,
+    embed_queries_cached,
+    semantic_cache,
+    check_semantic_cache,
+    acheck_semantic_cache,
+    route_semantic_cache,
+    update_semantic_cache,
+    recall_session_context,
+    arecall_session_context,
+    route_session_context,
+    remember_session_context,
+)
+from rag_app.utils.metrics import instrument_node, observe_batch, start_metrics_server
+from rag_app.utils.tools import DEFAULT_BATCH_SIZE, split_documents, add_new_chunks
+from rag_app.utils.manifest import SyncStats, sync_paths, sync_pdf
+from rag_app.utils.resources import (
+    get_checkpointer,
+    get_chunk_store,
+    get_embeddings,
+    get_job_store,
+    get_vectorstore,
+    get_lexical_index,
+    get_manifest,
+    get_reranker,
+    save_indexes,
+    warmup,
+)
 
 # Set environment variable to avoid tokenizer warnings
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -17,31 +49,140 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 # Load environment variables
 load_dotenv()
 
-# Initialize embeddings
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
+# Retrieval mode: "dense" (vector search), "lexical" (BM25) or "hybrid" (both, fused)
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "dense")
 
-# Initialize vector store
-vectorstore = Chroma(
-    persist_directory="./data",
-    embedding_function=embeddings
-)
+# Chunks passed to generate per query
+TOP_K = int(os.getenv("RAG_TOP_K", DEFAULT_TOP_K))
+
+# Set RAG_RERANK=1 to retrieve RAG_RERANK_CANDIDATES chunks and keep the best TOP_K by cross-encoder score
+RERANK = os.getenv("RAG_RERANK", "").lower() in ("1", "true", "yes")
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", 20))
+
+# In a session, a query whose embedding is this similar to an earlier turn's reuses that turn's chunks
+SESSION_REUSE_THRESHOLD = float(os.getenv("RAG_SESSION_REUSE_THRESHOLD", 0.8))
+SESSION_TURNS = int(os.getenv("RAG_SESSION_TURNS", 8))
+
+# Embeddings and the vector store are created lazily on first use.
+# Set RAG_WARMUP=1 to load them while the module is imported, e.g. at server boot.
+if os.getenv("RAG_WARMUP", "").lower() in ("1", "true", "yes"):
+    warmup()
+
+# Set RAG_METRICS_PORT to serve /metrics (Prometheus) and /metrics.json from this process
+if os.getenv("RAG_METRICS_PORT"):
+    start_metrics_server(int(os.environ["RAG_METRICS_PORT"]))
+
+
+def __getattr__(name: str):
+    """Keep ``embeddings`` and ``vectorstore`` importable as module attributes."""
+    if name == "embeddings":
+        return get_embeddings()
+    if name == "vectorstore":
+        return get_vectorstore()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def retrieve_node(state: RAGState) -> RAGState:
+    """Run the retrieve node with the configured retrieval mode."""
+    lexical_index = get_lexical_index() if RETRIEVAL_MODE != "dense" else None
+    k = RERANK_CANDIDATES if RERANK else TOP_K
+    return retrieve(state, get_vectorstore(), k=k, mode=RETRIEVAL_MODE, lexical_index=lexical_index)
+
+async def aretrieve_node(state: RAGState) -> RAGState:
+    """Async ``retrieve_node``, used by ``ainvoke`` and ``astream``."""
+    lexical_index = get_lexical_index() if RETRIEVAL_MODE != "dense" else None
+    k = RERANK_CANDIDATES if RERANK else TOP_K
+    return await aretrieve(state, get_vectorstore(), k=k, mode=RETRIEVAL_MODE, lexical_index=lexical_index)
+
+def rerank_node(state: RAGState) -> RAGState:
+    """Keep the best retrieved candidates by cross-encoder score."""
+    return rerank(state, get_reranker(), get_chunk_store(), get_vectorstore(), k=TOP_K)
+
+async def arerank_node(state: RAGState) -> RAGState:
+    """Async ``rerank_node``."""
+    return await arerank(state, get_reranker(), get_chunk_store(), get_vectorstore(), k=TOP_K)
+
+def generate_node(state: RAGState) -> RAGState:
+    """Build the response, reading the retrieved chunks' text from the chunk store."""
+    return generate(state, get_chunk_store(), get_vectorstore())
+
+async def agenerate_node(state: RAGState) -> RAGState:
+    """Async ``generate_node``."""
+    return await agenerate(state, get_chunk_store(), get_vectorstore())
+
+def _node(name: str, func: Callable, afunc: Callable) -> RunnableLambda:
+    """Build a node that runs ``func`` under invoke/stream and ``afunc`` under ainvoke/astream."""
+    return RunnableLambda(instrument_node(name, func), afunc=instrument_node(name, afunc), name=name)
+
+def create_graph(sessions: bool = False) -> StateGraph:
+    """Create the RAG graph.
 
-def create_graph() -> StateGraph:
-    """Create the RAG graph."""
+    With ``sessions`` the graph reuses the context retrieved for similar
+    earlier queries of the same session; compile it with a checkpointer and
+    pass a ``thread_id`` to keep the session between calls.
+    """
     # Create the graph
     workflow = StateGraph(RAGState)
 
     # Add nodes
-    workflow.add_node("retrieve", lambda state: retrieve(state, vectorstore))
-    workflow.add_node("generate", generate)
+    workflow.add_node("retrieve", _node("retrieve", retrieve_node, aretrieve_node))
+    workflow.add_node("generate", _node("generate", generate_node, agenerate_node))
 
     # Add edges
-    workflow.add_edge("retrieve", "generate")
+    retrieved = "retrieve"
+    if RERANK:
+        workflow.add_node("rerank", _node("rerank", rerank_node, arerank_node))
+        workflow.add_edge("retrieve", "rerank")
+        retrieved = "rerank"
+
+    entry = "retrieve"
+    if sessions:
+        async def arecall_context(state: RAGState) -> RAGState:
+            return await arecall_session_context(state, get_embeddings(), SESSION_REUSE_THRESHOLD)
+
+        workflow.add_node(
+            "recall_context",
+            _node(
+                "recall_context",
+                lambda state: recall_session_context(state, get_embeddings(), SESSION_REUSE_THRESHOLD),
+                arecall_context,
+            ),
+        )
+        workflow.add_node(
+            "remember_context",
+            instrument_node("remember_context", lambda state: remember_session_context(state, SESSION_TURNS)),
+        )
+        workflow.add_conditional_edges(
+            "recall_context", route_session_context, {"reuse": "generate", "retrieve": "retrieve"}
+        )
+        after_retrieval = "remember_context"
+        workflow.add_edge("remember_context", "generate")
+        entry = "recall_context"
+    else:
+        after_retrieval = "generate"
+
+    if semantic_cache is None:
+        workflow.add_edge(retrieved, after_retrieval)
+        # Set entry point
+        workflow.set_entry_point(entry)
+        return workflow
+
+    # Paraphrases of recent queries reuse their retrieved chunks; generate still answers the new query
+    async def acheck_cache(state: RAGState) -> RAGState:
+        return await acheck_semantic_cache(state, get_embeddings(), semantic_cache)
+
+    workflow.add_node(
+        "check_cache",
+        _node("check_cache", lambda state: check_semantic_cache(state, get_embeddings(), semantic_cache), acheck_cache),
+    )
+    workflow.add_node(
+        "update_cache", instrument_node("update_cache", lambda state: update_semantic_cache(state, semantic_cache))
+    )
+    workflow.add_conditional_edges("check_cache", route_semantic_cache, {"hit": after_retrieval, "miss": entry})
+    workflow.add_edge(retrieved, "update_cache")
+    workflow.add_edge("update_cache", after_retrieval)
 
     # Set entry point
-    workflow.set_entry_point("retrieve")
+    workflow.set_entry_point("check_cache")
 
     return workflow
 
@@ -49,17 +190,129 @@ def create_graph() -> StateGraph:
 graph = create_graph()
 app = graph.compile()
 
+_session_app = None
+
+def get_session_app():
+    """Return the session graph compiled with the configured checkpointer, compiling it on first use."""
+    global _session_app
+    if _session_app is None:
+        _session_app = create_graph(sessions=True).compile(checkpointer=get_checkpointer())
+    return _session_app
+
+def _runner(session_id: Optional[str]):
+    """Return the compiled graph and run config for a one-off query or a turn of a session."""
+    if session_id is None:
+        return app, None
+    return get_session_app(), {"configurable": {"thread_id": session_id}}
+
 def ingest_documents(documents: List[Document]) -> None:
     """Ingest documents into the vector store."""
     # Split documents into chunks
     chunks = split_documents(documents)
     
-    # Add chunks to vector store
-    vectorstore.add_documents(chunks)
+    # Add chunks that are not stored yet to the vector store and the BM25 index
+    add_new_chunks(get_vectorstore(), chunks, get_lexical_index(), get_chunk_store())
+    save_indexes()
     # No need to call persist() as Chroma 0.4.x automatically persists
 
-def process_query(query: str) -> str:
-    """Process a query through the RAG pipeline."""
-    state: RAGState = {"query": query, "context": None, "response": None}
-    final_state = app.invoke(state)
-    return final_state["response"] 
\ No newline at end of file
+def ingest_pdf(pdf_path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Stream a PDF into the vector store page by page and return the number of pages.
+
+    Only new or changed pages are embedded, chunks of changed or removed pages
+    are deleted, and a PDF that has not changed since it was last ingested is
+    skipped.
+    """
+    manifest = get_manifest()
+    result = sync_pdf(
+        get_vectorstore(),
+        pdf_path,
+        manifest,
+        batch_size=batch_size,
+        lexical_index=get_lexical_index(),
+        chunk_store=get_chunk_store(),
+        jobs=get_job_store(),
+    )
+    manifest.save()
+    save_indexes()
+    return result.pages
+
+def sync_directory(inputs: List[str], batch_size: int = DEFAULT_BATCH_SIZE) -> SyncStats:
+    """Bring the vector store in line with the PDFs under ``inputs``, including deleted files."""
+    stats = sync_paths(
+        inputs,
+        get_vectorstore(),
+        get_manifest(),
+        batch_size=batch_size,
+        lexical_index=get_lexical_index(),
+        chunk_store=get_chunk_store(),
+        jobs=get_job_store(),
+    )
+    save_indexes()
+    return stats
+
+def process_query(
+    query: str, session_id: Optional[str] = None, filter: Optional[Dict[str, Any]] = None
+) -> str:
+    """Process a query through the RAG pipeline, as a turn of ``session_id`` if one is given.
+
+    ``filter`` restricts retrieval to matching chunks, e.g.
+    ``metadata_filter(source="manual.pdf", pages=(10, 20))``.
+    """
+    state: RAGState = {
+        "query": query, "query_embedding": None, "context_ids": None, "response": None, "started_at": None,
+        "filter": filter,
+    }
+    runner, config = _runner(session_id)
+    final_state = runner.invoke(state, config)
+    return final_state["response"]
+
+def stream_query(
+    query: str,
+    query_embedding: Optional[List[float]] = None,
+    session_id: Optional[str] = None,
+    filter: Optional[Dict[str, Any]] = None,
+) -> Iterator[str]:
+    """Process a query and yield pieces of the response as the generate node produces them."""
+    state: RAGState = {
+        "query": query, "query_embedding": query_embedding, "context_ids": None, "response": None, "started_at": None,
+        "filter": filter,
+    }
+    runner, config = _runner(session_id)
+    for payload in runner.stream(state, config, stream_mode="custom"):
+        yield payload["chunk"]
+
+def process_queries(queries: List[str], filter: Optional[Dict[str, Any]] = None) -> List[str]:
+    """Process many queries through the RAG pipeline, returning responses in order.
+
+    All queries without a cached embedding are embedded in a single batched
+    model call and then run through the graph's ``batch`` path, which
+    searches with the precomputed vectors.
+    """
+    observe_batch("process_queries", len(queries))
+    vectors = embed_queries_cached(get_embeddings(), queries)
+    states: List[RAGState] = [
+        {
+            "query": query, "query_embedding": vector, "context_ids": None, "response": None, "started_at": None,
+            "filter": filter,
+        }
+        for query, vector in zip(queries, vectors)
+    ]
+    final_states = app.batch(states)
+    return [final_state["response"] for final_state in final_states] 
+
+async def aprocess_query(query: str, filter: Optional[Dict[str, Any]] = None) -> str:
+    """Process a query through the RAG pipeline without blocking the event loop.
+
+    Embedding runs in the embedding pool, batched with queries from
+    concurrent calls, and the vector search runs in the search pool.
+    """
+    state: RAGState = {
+        "query": query, "query_embedding": None, "context_ids": None, "response": None, "started_at": None,
+        "filter": filter,
+    }
+    final_state = await app.ainvoke(state)
+    return final_state["response"]
+
+async def aprocess_queries(queries: List[str], filter: Optional[Dict[str, Any]] = None) -> List[str]:
+    """Process queries concurrently, returning responses in order."""
+    return list(await asyncio.gather(*(aprocess_query(query, filter) for query in queries)))
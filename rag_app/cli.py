@@ -2,78 +2,517 @@
 import os
 import sys
 import argparse
-from typing import List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
 
-from rag_app.agent import ingest_documents, process_query
-from rag_app.utils.tools import load_pdf_from_path, load_pdf_from_url
+from rag_app.utils.settings import DEFAULT_BATCH_SIZE, DEFAULT_EMBEDDING_SERVER
 
+if TYPE_CHECKING:
+    from rag_app.utils.download import DownloadResult
 
-def process_pdf(pdf_path: str, is_url: bool = False, query: Optional[str] = None) -> None:
-    """Process a PDF file and run queries against it."""
+# The agent, loaders and downloader are imported inside the commands that use
+# them so that `--help` and argument errors do not pay their import cost.
+
+
+def parse_page_range(value: str) -> Tuple[Optional[int], Optional[int]]:
+    """Parse ``FIRST-LAST``, ``FIRST-``, ``-LAST`` or ``PAGE`` into an inclusive page range."""
+    first, sep, last = value.partition("-")
     try:
-        # Load documents
-        if is_url:
-            print(f"Loading PDF from URL: {pdf_path}")
-            documents = load_pdf_from_url(pdf_path)
+        if not sep:
+            return int(first), int(first)
+        return (int(first) if first else None), (int(last) if last else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected a page range like 10-20, got {value!r}")
+
+
+def run_queries(
+    query: Optional[str] = None, session_id: Optional[str] = None, filter: Optional[Dict[str, Any]] = None
+) -> None:
+    """Run a custom query, or the default example queries, and print the responses as they stream.
+
+    With ``session_id`` the queries are turns of that session, which reuse
+    the context retrieved for similar earlier turns, also in earlier runs.
+    ``filter`` restricts retrieval to matching chunks.
+    """
+    from rag_app.agent import embed_queries_cached, get_embeddings, stream_query
+
+    if query:
+        queries = [query]
+    else:
+        # Default example queries
+        queries = [
+            "Summarize the key points from this document",
+            "What are the main topics covered in this document?",
+            "What are the most important concepts in this document?"
+        ]
+    
+    try:
+        # Embed every query in one batched model call before streaming the answers
+        vectors = embed_queries_cached(get_embeddings(), queries)
+        for q, vector in zip(queries, vectors):
+            print(f"\nQuery: {q}")
+            print("Response: ", end="", flush=True)
+            for chunk in stream_query(q, query_embedding=vector, session_id=session_id, filter=filter):
+                print(chunk, end="", flush=True)
+            print()
+    except Exception as e:
+        print(f"\nError processing queries: {e}")
+
+
+def download_urls(urls: List[str]) -> List["DownloadResult"]:
+    """Fetch URLs concurrently through the shared downloader and report each result."""
+    from rag_app.utils.download import get_downloader
+
+    print(f"Downloading {len(urls)} PDF(s)...")
+    results = get_downloader().fetch_many(urls)
+    for result in results:
+        if not result.ok:
+            print(f"Error downloading {result.url}: {result.error}")
+        elif result.changed:
+            print(f"Downloaded {result.url}")
         else:
-            print(f"Loading PDF from file: {pdf_path}")
-            documents = load_pdf_from_path(pdf_path)
+            print(f"Unchanged since last download: {result.url}")
+    return results
+
+
+def process_pdf(
+    pdf_path: str,
+    is_url: bool = False,
+    query: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    session_id: Optional[str] = None,
+    filter: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Process a PDF file and run queries against it.
+
+    Ingest is checkpointed after every batch, so running the command again
+    after an interruption resumes where it stopped.
+    """
+    if is_url:
+        process_urls([pdf_path], query=query, batch_size=batch_size, session_id=session_id, filter=filter)
+        return
+
+    from rag_app.agent import ingest_pdf
+
+    try:
+        print(f"Loading PDF from file: {pdf_path}")
+        
+        # Stream pages into the vector store
+        print(f"Ingesting pages in batches of {batch_size} chunks...")
+        pages = ingest_pdf(pdf_path, batch_size=batch_size)
+        print(f"Ingested {pages} pages successfully!")
         
-        print(f"Loaded {len(documents)} pages")
+        run_queries(query, session_id=session_id, filter=filter)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+def process_urls(
+    urls: List[str],
+    query: Optional[str] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    session_id: Optional[str] = None,
+    filter: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Download PDFs concurrently, ingest the ones that changed and run queries against them."""
+    from rag_app.agent import ingest_pdf
+    from rag_app.utils.download import get_downloader
+
+    try:
+        results = download_urls(urls)
+        if not any(result.ok for result in results):
+            raise ValueError("Failed to download any PDF")
         
-        # Ingest documents
-        print(f"Ingesting {len(documents)} documents...")
-        ingest_documents(documents)
-        print("Documents ingested successfully!")
+        downloader = get_downloader()
+        for result in results:
+            if not result.ok:
+                continue
+            if result.ingested:
+                print(f"Skipping ingest of unchanged PDF: {result.url}")
+                continue
+            print(f"Ingesting {result.url} in batches of {batch_size} chunks...")
+            pages = ingest_pdf(result.path, batch_size=batch_size)
+            downloader.mark_ingested(result.url)
+            print(f"Ingested {pages} pages successfully!")
         
-        # Process queries
-        if query:
-            queries = [query]
-        else:
-            # Default example queries
-            queries = [
-                "Summarize the key points from this document",
-                "What are the main topics covered in this document?",
-                "What are the most important concepts in this document?"
-            ]
+        run_queries(query, session_id=session_id, filter=filter)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+def ingest_inputs(inputs: List[str], workers: Optional[int] = None, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+    """Ingest PDFs from URLs, directories, globs or manifest files in parallel."""
+    from rag_app.utils.download import get_downloader, is_url
+    from rag_app.utils.ingest import ingest_paths
+    from rag_app.utils.resources import (
+        get_chunk_store,
+        get_job_store,
+        get_lexical_index,
+        get_manifest,
+        get_vectorstore,
+        save_indexes,
+    )
+
+    urls = [item for item in inputs if is_url(item)]
+    paths = [item for item in inputs if not is_url(item)]
+    try:
+        results = download_urls(urls) if urls else []
+        pending = [result for result in results if result.ok and not result.ingested]
+        paths.extend(result.path for result in pending)
         
-        for q in queries:
-            print(f"\nQuery: {q}")
-            try:
-                response = process_query(q)
-                print(f"Response: {response}")
-            except Exception as e:
-                print(f"Error processing query: {e}")
-                
+        stats = ingest_paths(
+            paths,
+            get_vectorstore(),
+            get_manifest(),
+            workers=workers,
+            batch_size=batch_size,
+            lexical_index=get_lexical_index(),
+            chunk_store=get_chunk_store(),
+            jobs=get_job_store(),
+        )
+        save_indexes()
+        downloader = get_downloader()
+        for result in pending:
+            if result.path not in stats.failed:
+                downloader.mark_ingested(result.url)
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
 
+    for path, error in stats.errors.items():
+        print(f"Error loading {path}: {error}")
+    print(stats.summary())
+    if stats.failed or any(not result.ok for result in results):
+        sys.exit(1)
+
+
+def sync_inputs(inputs: List[str], batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+    """Re-index only the PDFs that changed and delete the chunks of removed ones."""
+    from rag_app.agent import sync_directory
+
+    try:
+        stats = sync_directory(inputs, batch_size=batch_size)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    
+    for result in stats.results:
+        if result.status != "unchanged":
+            print(
+                f"{result.status.capitalize()}: {result.source} ({result.changed_pages} changed pages, "
+                f"+{result.added_chunks}/-{result.deleted_chunks} chunks)"
+            )
+    print(stats.summary())
+    if stats.count("failed"):
+        sys.exit(1)
+
+
+def import_chroma(dtype: str = "float32", quantization: str = "none") -> None:
+    """Copy the Chroma collection into the in-process matrix vector store."""
+    from rag_app.utils.resources import get_persist_directory, open_chroma
+    from rag_app.utils.vectorstores import MatrixVectorStore
+
+    directory = os.path.join(get_persist_directory(), "matrix")
+    if os.path.exists(os.path.join(directory, "docs.jsonl")):
+        print(f"Error: {directory} already contains a matrix store")
+        sys.exit(1)
+    
+    print(f"Importing Chroma collection from {get_persist_directory()} into {directory} ({dtype})...")
+    store = MatrixVectorStore.from_chroma(open_chroma(), directory, dtype=dtype, quantization=quantization)
+    print(f"Imported {len(store)} chunks. Set RAG_VECTOR_BACKEND=matrix to use them.")
+
+
+def rebalance_shards(count: Optional[int] = None, strategy: Optional[str] = None) -> None:
+    """Shard the vector store, or change its shard count or strategy, moving chunks as needed."""
+    from rag_app.utils.resources import open_sharded_store, open_unsharded_store
+
+    store = open_sharded_store(count=count, strategy=strategy)
+    print(f"Rebalancing into {count or store.count} shards by {strategy or store.strategy}...")
+    moved = store.rebalance(count=count, strategy=strategy)
+    legacy = open_unsharded_store()
+    imported = store.import_store(legacy) if len(legacy.get(include=[], limit=1)["ids"]) else 0
+    if imported:
+        print(f"Moved {imported} chunks from the unsharded store into the shards.")
+    print(f"Moved {moved} chunks between shards. The store now has {store.count} shards by {store.strategy}.")
+    store.close()
+
+
+def serve_embeddings(address: str, max_batch: int, max_wait_ms: float) -> None:
+    """Keep the embedding model resident and serve it to other processes."""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    from rag_app.utils.embedding_server import EmbeddingServer
+    from rag_app.utils.resources import get_model_name
+
+    model_name = get_model_name()
+    print(f"Loading {model_name}...")
+    server = EmbeddingServer(
+        HuggingFaceEmbeddings(model_name=model_name),
+        address,
+        model_name=model_name,
+        max_batch=max_batch,
+        max_wait=max_wait_ms / 1000,
+    )
+    print(f"Serving embeddings on {address}. Set RAG_EMBEDDING_SERVER={address} in clients.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+def tune(
+    inputs: List[str],
+    labels_path: str,
+    chunk_sizes: List[int],
+    chunk_overlaps: List[int],
+    ks: List[int],
+    min_recall: float,
+    workers: Optional[int] = None,
+    output: Optional[str] = None,
+) -> None:
+    """Re-ingest a labeled corpus for every combination of settings and report cost and recall."""
+    from rag_app.utils.resources import load_embedding_model
+    from rag_app.utils.tuning import cheapest, format_results, load_labels, run_grid, save_results
+
+    labels = load_labels(labels_path)
+    mode = os.getenv("RAG_RETRIEVAL_MODE", "dense")
+    print(f"Tuning on {len(labels)} labeled queries ({mode} retrieval)...")
+    results = run_grid(
+        inputs, labels, load_embedding_model(), chunk_sizes, chunk_overlaps, ks, mode=mode, workers=workers
+    )
+    print(format_results(results))
+    if output:
+        save_results(results, output)
+        print(f"Results written to {output}")
+    best = cheapest(results, min_recall)
+    if best is None:
+        print(f"No configuration reached recall {min_recall}.")
+    else:
+        print(
+            f"Cheapest with recall >= {min_recall}: RAG_CHUNK_SIZE={best.chunk_size} "
+            f"RAG_CHUNK_OVERLAP={best.chunk_overlap} RAG_TOP_K={best.k}"
+        )
+
+
+def list_jobs(unfinished: bool = False) -> None:
+    """Print recent ingest jobs and how far each got."""
+    from rag_app.utils.resources import get_job_store
+
+    jobs = get_job_store().jobs(unfinished=unfinished)
+    if not jobs:
+        print("No ingest jobs.")
+        return
+    print(f"{'id':>5} {'status':<10} {'pages':>6} {'batches':>8} {'chunks':>8}  source")
+    for job in jobs:
+        print(
+            f"{job['id']:>5} {job['status']:<10} {job['next_page']:>6} {job['batches']:>8} {job['chunks']:>8}  "
+            f"{job['source']}"
+        )
+        if job["error"]:
+            print(f"      {job['error']}")
+
+
+def write_metrics(fmt: str, path: Optional[str] = None) -> None:
+    """Print the recorded latency histograms and counters, or write them to ``path``."""
+    from rag_app.utils.metrics import REGISTRY
+
+    text = REGISTRY.to_json() + "\n" if fmt == "json" else REGISTRY.to_prometheus()
+    if path:
+        with open(path, "w") as f:
+            f.write(text)
+        print(f"Metrics written to {path}")
+    else:
+        print(text, end="")
+
 
 def main() -> None:
     """Main entry point for the CLI."""
     parser = argparse.ArgumentParser(description="RAG application for PDF documents")
+    parser.add_argument(
+        "--metrics", choices=["prometheus", "json"], help="Print per-node and ingest stage metrics after the command"
+    )
+    parser.add_argument("--metrics-file", help="Write the metrics to this file instead of stdout")
+    parser.add_argument("--chunk-size", type=int, help="Chunk size when splitting PDFs (RAG_CHUNK_SIZE)")
+    parser.add_argument(
+        "--chunk-overlap", type=int, help="Overlap of neighbouring chunks (RAG_CHUNK_OVERLAP)"
+    )
+    parser.add_argument("--top-k", "-k", type=int, help="Chunks retrieved per query (RAG_TOP_K)")
     subparsers = parser.add_subparsers(dest="command", help="Command to run")
     
     # File command
     file_parser = subparsers.add_parser("file", help="Process a local PDF file")
     file_parser.add_argument("path", help="Path to the PDF file")
     file_parser.add_argument("--query", "-q", help="Custom query to run")
+    file_parser.add_argument("--session", "-s", help="Run the queries as turns of this session")
+    file_parser.add_argument(
+        "--source", nargs="+", help="Only retrieve chunks of these sources, as stored in the chunks' metadata"
+    )
+    file_parser.add_argument(
+        "--pages", type=parse_page_range, help="Only retrieve chunks of these pages (0-based), e.g. 10-20 or 10-"
+    )
+    file_parser.add_argument(
+        "--batch-size", "-b", type=int, default=DEFAULT_BATCH_SIZE, help="Chunks per write batch"
+    )
     
     # URL command
-    url_parser = subparsers.add_parser("url", help="Process a PDF from a URL")
-    url_parser.add_argument("url", help="URL of the PDF file")
+    url_parser = subparsers.add_parser("url", help="Process PDFs from one or more URLs")
+    url_parser.add_argument("urls", nargs="+", help="URLs of the PDF files")
     url_parser.add_argument("--query", "-q", help="Custom query to run")
+    url_parser.add_argument("--session", "-s", help="Run the queries as turns of this session")
+    url_parser.add_argument(
+        "--source", nargs="+", help="Only retrieve chunks of these sources, as stored in the chunks' metadata"
+    )
+    url_parser.add_argument(
+        "--pages", type=parse_page_range, help="Only retrieve chunks of these pages (0-based), e.g. 10-20 or 10-"
+    )
+    url_parser.add_argument(
+        "--batch-size", "-b", type=int, default=DEFAULT_BATCH_SIZE, help="Chunks per write batch"
+    )
+    
+    # Ingest command
+    ingest_parser = subparsers.add_parser(
+        "ingest", help="Sync PDFs from directories, glob patterns or manifest files, parsing them in parallel"
+    )
+    ingest_parser.add_argument("inputs", nargs="+", help="Directories, globs, PDF paths, URLs or manifest files")
+    ingest_parser.add_argument("--workers", "-w", type=int, help="Number of PDF parsing processes")
+    ingest_parser.add_argument(
+        "--batch-size", "-b", type=int, default=DEFAULT_BATCH_SIZE, help="Chunks per embedding batch"
+    )
+    
+    # Sync command
+    sync_parser = subparsers.add_parser(
+        "sync", help="Re-index changed PDFs and remove deleted ones using the document manifest"
+    )
+    sync_parser.add_argument("inputs", nargs="+", help="Directories, globs, PDF paths or manifest files")
+    sync_parser.add_argument(
+        "--batch-size", "-b", type=int, default=DEFAULT_BATCH_SIZE, help="Chunks per embedding batch"
+    )
+    
+    # Import command
+    import_parser = subparsers.add_parser(
+        "import-chroma", help="Copy the Chroma collection into the in-process matrix vector store"
+    )
+    import_parser.add_argument(
+        "--dtype",
+        choices=["float32", "float16"],
+        default="float32",
+        help="Storage precision of the vectors; float16 halves their size but makes exact search about 3x slower",
+    )
+    import_parser.add_argument(
+        "--quantization",
+        choices=["none", "int8", "float16"],
+        default="none",
+        help=(
+            "Also keep quantized vectors in memory for the first search pass; int8 uses a quarter of the memory, "
+            "float16 half but scans about 3x slower than int8"
+        ),
+    )
+    
+    # Rebalance command
+    rebalance_parser = subparsers.add_parser(
+        "rebalance", help="Split the vector store into shards or change their count or strategy"
+    )
+    rebalance_parser.add_argument("--shards", "-n", type=int, help="Number of shards")
+    rebalance_parser.add_argument(
+        "--by", choices=["source", "hash"], help="Keep each document in one shard, or spread chunks by ID hash"
+    )
+    
+    # Embedding server command
+    serve_parser = subparsers.add_parser(
+        "serve-embeddings", help="Serve one shared embedding model to CLI runs, scripts and graph workers"
+    )
+    serve_parser.add_argument(
+        "--address",
+        default=os.getenv("RAG_EMBEDDING_SERVER", DEFAULT_EMBEDDING_SERVER),
+        help="unix:/path/to/socket or host:port",
+    )
+    serve_parser.add_argument("--max-batch", type=int, default=256, help="Most texts embedded in one model call")
+    serve_parser.add_argument(
+        "--max-wait-ms", type=float, default=5.0, help="How long to wait for other clients' texts before a call"
+    )
+    
+    # Jobs command
+    jobs_parser = subparsers.add_parser("jobs", help="List resumable ingest jobs and their progress")
+    jobs_parser.add_argument("--unfinished", action="store_true", help="Only list jobs that can be resumed")
+    
+    # Tune command
+    tune_parser = subparsers.add_parser(
+        "tune", help="Find the cheapest chunk size, overlap and k that meet a recall target on labeled queries"
+    )
+    tune_parser.add_argument("inputs", nargs="+", help="Directories, globs, PDF paths or manifest files")
+    tune_parser.add_argument(
+        "--labels", "-l", required=True, help="JSON lines of {\"query\", \"source\", optional \"page\"}"
+    )
+    tune_parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[500, 1000, 1500])
+    tune_parser.add_argument("--chunk-overlaps", type=int, nargs="+", default=[0, 100, 200])
+    tune_parser.add_argument("--ks", type=int, nargs="+", default=[1, 3, 5])
+    tune_parser.add_argument("--min-recall", type=float, default=0.9, help="Recall the chosen settings must reach")
+    tune_parser.add_argument("--workers", "-w", type=int, help="Number of PDF parsing processes")
+    tune_parser.add_argument("--output", "-o", help="Also write the results to this JSON file")
     
     args = parser.parse_args()
     
-    if args.command == "file":
-        process_pdf(args.path, is_url=False, query=args.query)
-    elif args.command == "url":
-        process_pdf(args.url, is_url=True, query=args.query)
-    else:
+    # Load environment variables
+    load_dotenv()
+    # Set before the agent is imported, which reads them once
+    for name, value in (
+        ("RAG_CHUNK_SIZE", args.chunk_size), ("RAG_CHUNK_OVERLAP", args.chunk_overlap), ("RAG_TOP_K", args.top_k)
+    ):
+        if value is not None:
+            os.environ[name] = str(value)
+    
+    if args.command is None:
         parser.print_help()
         sys.exit(1)
+    
+    try:
+        if args.command in ("file", "url"):
+            from rag_app.utils.filters import metadata_filter
+
+            filter = metadata_filter(source=args.source, pages=args.pages)
+        if args.command == "file":
+            process_pdf(
+                args.path,
+                is_url=False,
+                query=args.query,
+                batch_size=args.batch_size,
+                session_id=args.session,
+                filter=filter,
+            )
+        elif args.command == "url":
+            process_urls(
+                args.urls, query=args.query, batch_size=args.batch_size, session_id=args.session, filter=filter
+            )
+        elif args.command == "ingest":
+            ingest_inputs(args.inputs, workers=args.workers, batch_size=args.batch_size)
+        elif args.command == "sync":
+            sync_inputs(args.inputs, batch_size=args.batch_size)
+        elif args.command == "import-chroma":
+            import_chroma(dtype=args.dtype, quantization=args.quantization)
+        elif args.command == "rebalance":
+            rebalance_shards(count=args.shards, strategy=args.by)
+        elif args.command == "serve-embeddings":
+            serve_embeddings(args.address, args.max_batch, args.max_wait_ms)
+        elif args.command == "jobs":
+            list_jobs(unfinished=args.unfinished)
+        elif args.command == "tune":
+            tune(
+                args.inputs,
+                args.labels,
+                args.chunk_sizes,
+                args.chunk_overlaps,
+                args.ks,
+                args.min_recall,
+                workers=args.workers,
+                output=args.output,
+            )
+    finally:
+        # Also report metrics of commands that failed part way
+        if args.metrics or args.metrics_file:
+            write_metrics(args.metrics or "json", args.metrics_file)
 
 
 if __name__ == "__main__":
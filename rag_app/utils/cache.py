@@ -0,0 +1,237 @@
+"""In-memory caches for the RAG application."""
+import fcntl
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_MISSING = object()
+
+# Counter next to the indexes that every ingest, sync or delete increments, so
+# processes sharing a persist directory see each other's changes
+VERSION_FILE = "collection.version"
+_VERSION_WIDTH = 20
+
+_version_lock = threading.Lock()
+# Bumped when this process switches to other resources, e.g. a different persist directory
+_generation = 0
+
+
+def _version_path() -> str:
+    # Imported here because resources imports this module
+    from .resources import get_persist_directory
+
+    return os.path.join(get_persist_directory(), VERSION_FILE)
+
+
+def collection_version() -> Tuple[int, str, int]:
+    """Return the current version of the collection, read from the counter stored next to the indexes."""
+    path = _version_path()
+    try:
+        # Read on every cache lookup, so without the overhead of a file object
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            stored = int(os.read(fd, _VERSION_WIDTH) or 0)
+        finally:
+            os.close(fd)
+    except (FileNotFoundError, ValueError):
+        stored = 0
+    return _generation, path, stored
+
+
+def bump_collection_version(persist: bool = True) -> Tuple[int, str, int]:
+    """Mark the collection as changed so cached results are no longer used, in any process.
+
+    With ``persist=False`` only this process's caches are invalidated.
+    """
+    global _generation
+    with _version_lock:
+        if not persist:
+            _generation += 1
+            return collection_version()
+        path = _version_path()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                stored = int(os.read(fd, _VERSION_WIDTH) or 0) + 1
+            except ValueError:
+                stored = 1
+            # Fixed width and written in place, so a concurrent reader never sees a shorter number
+            os.pwrite(fd, str(stored).zfill(_VERSION_WIDTH).encode(), 0)
+        finally:
+            os.close(fd)
+        return _generation, path, stored
+
+
+class LRUCache:
+    """Thread-safe bounded mapping with LRU eviction, an optional TTL and hit/miss counters."""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for ``key`` or ``default`` if missing or expired."""
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires = item
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store ``value`` under ``key``, evicting the least recently used entry if full."""
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every entry but keep the counters."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, float]:
+        """Return size and hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SemanticCache:
+    """Bounded cache that matches queries by cosine similarity of their embeddings.
+
+    Embeddings of cached queries are kept L2-normalized in one float32 matrix
+    so a lookup is a single matrix-vector product. Entries belong to the
+    collection version they were created under and are dropped when the
+    collection changes, in this process or another one, or after ``ttl``
+    seconds. When full, the least recently used entry is replaced.
+    """
+
+    def __init__(self, capacity: int = 2048, threshold: float = 0.95, ttl: Optional[float] = None):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._miss_seconds = 0.0
+        self._stored = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._values: List[Any] = [None] * capacity
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._expires = np.full(capacity, np.inf)
+        self._size = 0
+        self._tick = 0
+        self._version: Optional[Tuple[int, str, int]] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _check_version(self) -> None:
+        """Forget every entry if the collection changed since they were stored."""
+        version = collection_version()
+        if version != self._version:
+            self._version = version
+            self._size = 0
+            self._values = [None] * self.capacity
+
+    def lookup(self, embedding: Sequence[float]) -> Optional[Tuple[Any, float]]:
+        """Return ``(value, similarity)`` of the closest cached query above the threshold."""
+        query = self._normalize(embedding)
+        with self._lock:
+            self._check_version()
+            if self._size:
+                similarities = self._matrix[:self._size] @ query
+                similarities[self._expires[:self._size] <= time.monotonic()] = -np.inf
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._tick += 1
+                    self._last_used[best] = self._tick
+                    self.hits += 1
+                    # Each hit saves roughly the average cost of a miss
+                    if self._stored:
+                        self.saved_seconds += self._miss_seconds / self._stored
+                    return self._values[best], float(similarities[best])
+            self.misses += 1
+            return None
+
+    def put(self, embedding: Sequence[float], value: Any, latency: Optional[float] = None) -> None:
+        """Cache ``value`` for a query embedding; ``latency`` is what computing it cost."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version()
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+                self._size = 0
+            now = time.monotonic()
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            elif (self._expires <= now).any():
+                slot = int(np.argmax(self._expires <= now))
+            else:
+                slot = int(np.argmin(self._last_used))
+            self._matrix[slot] = vector
+            self._values[slot] = value
+            self._expires[slot] = now + self.ttl if self.ttl else np.inf
+            self._tick += 1
+            self._last_used[slot] = self._tick
+            if latency is not None:
+                self._miss_seconds += latency
+                self._stored += 1
+
+    def clear(self) -> None:
+        """Drop every entry but keep the counters."""
+        with self._lock:
+            self._size = 0
+            self._values = [None] * self.capacity
+
+    def __len__(self) -> int:
+        return self._size
+
+    def stats(self) -> Dict[str, float]:
+        """Return size, hit rate and the latency saved by hits."""
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "ttl": self.ttl or 0.0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_miss_seconds": self._miss_seconds / self._stored if self._stored else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
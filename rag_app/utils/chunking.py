@@ -0,0 +1,212 @@
+"""Offset-based recursive text chunker.
+
+``TextChunker`` produces the same chunks as LangChain's
+``RecursiveCharacterTextSplitter`` with its default settings, but works on
+``(start, end)`` offsets into the original text. Separators are located with
+``str.find`` and pieces are merged by bisecting their cumulative lengths, so
+the text is only copied once per emitted chunk.
+"""
+import re
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", " ", "")
+
+# all-MiniLM-L6-v2 truncates its input at 256 word pieces, including [CLS] and [SEP]
+MINILM_MAX_TOKENS = 256
+SPECIAL_TOKENS = 2
+
+Span = Tuple[int, int]
+# Returns the start offset of every token of a text, in increasing order
+TokenOffsets = Callable[[str], Sequence[int]]
+
+
+@lru_cache(maxsize=None)
+def _pattern(separator: str) -> "re.Pattern":
+    return re.compile(re.escape(separator))
+
+
+class TextChunker:
+    """Split text into chunks of at most ``chunk_size`` characters or tokens.
+
+    Lengths are counted in characters, or in tokens when ``token_offsets`` is
+    given. A token belongs to the piece its first character is in, so the
+    token counts of adjacent pieces add up exactly.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        separators: Sequence[str] = DEFAULT_SEPARATORS,
+        token_offsets: Optional[TokenOffsets] = None,
+    ):
+        if chunk_overlap > chunk_size:
+            raise ValueError(
+                f"Got a larger chunk overlap ({chunk_overlap}) than chunk size ({chunk_size}), should be smaller."
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = tuple(separators)
+        self.token_offsets = token_offsets
+
+    @classmethod
+    def from_tokenizer(
+        cls,
+        tokenizer: Any,
+        chunk_size: int = MINILM_MAX_TOKENS - SPECIAL_TOKENS,
+        chunk_overlap: int = 32,
+        **kwargs: Any,
+    ) -> "TextChunker":
+        """Count lengths with a Hugging Face fast tokenizer."""
+        def token_offsets(text: str) -> List[int]:
+            encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+            return [start for start, _ in encoding["offset_mapping"]]
+
+        return cls(chunk_size=chunk_size, chunk_overlap=chunk_overlap, token_offsets=token_offsets, **kwargs)
+
+    def _measure(self, text: str) -> Callable[[List[int]], List[int]]:
+        """Return a function mapping boundary offsets to cumulative lengths.
+
+        The length of the text between two boundaries is the difference of
+        their cumulative lengths: the offsets themselves when counting
+        characters, or the number of tokens starting before each offset.
+        """
+        if self.token_offsets is None:
+            return lambda boundaries: boundaries
+        starts = self.token_offsets(text)
+        return lambda boundaries: [bisect_left(starts, offset) for offset in boundaries]
+
+    def split_spans(self, text: str) -> List[Span]:
+        """Return the ``(start, end)`` offsets of the chunks of ``text``."""
+        spans: List[Span] = []
+        if text:
+            self._split(text, 0, len(text), 0, self._measure(text), spans)
+        return spans
+
+    def split_text(self, text: str) -> List[str]:
+        """Return the chunks of ``text``."""
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    @staticmethod
+    def _boundaries(text: str, start: int, end: int, separator: str) -> List[int]:
+        """Return piece boundaries of a range split before every occurrence of ``separator``.
+
+        Piece ``i`` spans ``boundaries[i]:boundaries[i + 1]``, so each piece
+        starts with the separator that preceded it. Empty pieces are dropped.
+        """
+        if not separator:
+            return list(range(start, end + 1))
+        boundaries = [start]
+        boundaries.extend(match.start() for match in _pattern(separator).finditer(text, start, end))
+        if len(boundaries) > 1 and boundaries[1] == start:
+            del boundaries[1]
+        boundaries.append(end)
+        return boundaries
+
+    def _split(
+        self, text: str, start: int, end: int, level: int, measure: Callable[[List[int]], List[int]], out: List[Span]
+    ) -> None:
+        separators = self.separators
+        separator = separators[-1]
+        next_level = len(separators)
+        for i in range(level, len(separators)):
+            if separators[i] == "":
+                separator = ""
+                break
+            if text.find(separators[i], start, end) != -1:
+                separator = separators[i]
+                next_level = i + 1
+                break
+
+        boundaries = self._boundaries(text, start, end, separator)
+        lengths = measure(boundaries)
+        size = self.chunk_size
+        pieces = len(boundaries) - 1
+        # Pieces that are too long are split further; the runs between them are merged
+        first = 0
+        for i in [i for i in range(pieces) if lengths[i + 1] - lengths[i] >= size]:
+            if i > first:
+                self._merge(text, boundaries, lengths, first, i, out)
+            if next_level >= len(separators):
+                out.append((boundaries[i], boundaries[i + 1]))
+            else:
+                self._split(text, boundaries[i], boundaries[i + 1], next_level, measure, out)
+            first = i + 1
+        if pieces > first:
+            self._merge(text, boundaries, lengths, first, pieces, out)
+
+    def _merge(
+        self, text: str, boundaries: List[int], lengths: List[int], first: int, last: int, out: List[Span]
+    ) -> None:
+        """Combine pieces ``first:last`` into chunks, keeping up to ``chunk_overlap`` between them.
+
+        The window of pieces ``a:b`` grows until the next piece would make it
+        longer than ``chunk_size``, which is found by bisection rather than
+        by adding pieces one at a time.
+        """
+        size, overlap = self.chunk_size, self.chunk_overlap
+        a = b = first
+        while b < last:
+            if a == b:
+                b += 1
+                continue
+            # First piece k >= b that no longer fits in the window a:k
+            k = bisect_right(lengths, lengths[a] + size, b + 1, last + 1) - 1
+            if k >= last:
+                break
+            self._emit(text, boundaries[a], boundaries[k], out)
+            # Drop pieces from the front until what is left fits the overlap and piece k fits after it
+            a = min(k, max(
+                bisect_left(lengths, lengths[k] - overlap, a, k),
+                bisect_left(lengths, lengths[k + 1] - size, a, k),
+            ))
+            b = k + 1
+        if last > a:
+            self._emit(text, boundaries[a], boundaries[last], out)
+
+    @staticmethod
+    def _emit(text: str, start: int, end: int, out: List[Span]) -> None:
+        """Append a chunk with surrounding whitespace trimmed, unless nothing is left."""
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            out.append((start, end))
+
+    def iter_split_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """Yield the chunks of each document with a copy of its metadata."""
+        for document in documents:
+            text = document.page_content
+            for start, end in self.split_spans(text):
+                yield Document(page_content=text[start:end], metadata=dict(document.metadata))
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        """Split documents into chunks."""
+        return list(self.iter_split_documents(documents))
+
+
+@lru_cache(maxsize=4)
+def load_tokenizer(model_name: str):
+    """Load the fast tokenizer of an embedding model."""
+    # Deferred because transformers is slow to import
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(model_name, use_fast=True)
+
+
+def token_chunker(
+    model_name: str,
+    chunk_size: int = MINILM_MAX_TOKENS - SPECIAL_TOKENS,
+    chunk_overlap: int = 32,
+    max_tokens: int = MINILM_MAX_TOKENS,
+) -> TextChunker:
+    """Return a chunker whose chunks fit within ``max_tokens`` of ``model_name``."""
+    chunk_size = min(chunk_size, max_tokens - SPECIAL_TOKENS)
+    return TextChunker.from_tokenizer(
+        load_tokenizer(model_name), chunk_size=chunk_size, chunk_overlap=min(chunk_overlap, chunk_size // 4)
+    )
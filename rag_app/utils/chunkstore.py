@@ -0,0 +1,431 @@
+"""Columnar store of chunk text, source and page.
+
+Retrieval only needs chunk IDs, and text is needed only when a response is
+generated (or candidates are reranked). Instead of one ``Document`` with a
+metadata dict per chunk, the store keeps fixed-width columns in NumPy
+arrays and the text of every chunk in one memory-mapped UTF-8 blob:
+
+- ``text.bin``: chunk texts, back to back
+- ``ends.bin``: int64 end offset of each chunk's text in ``text.bin``
+- ``sources.bin``: int32 index into ``sources.jsonl``, the distinct sources
+- ``pages.bin``: int32 page number, -1 when the chunk has none
+- ``ids.bin``: 32-byte key of each chunk ID (the SHA-256 digest of ``chunk_id``)
+- ``deleted.bin``: int64 rows of deleted chunks, which no longer resolve
+
+About 56 bytes per chunk stay in memory, plus whatever text the OS keeps
+cached. Only ``source`` and ``page`` metadata are kept. Files are
+append-only and ``ends.bin`` is written last, so rows left incomplete by a
+crash are truncated on load. ``compact`` rewrites the store without its
+deleted rows into a sibling directory and swaps it in.
+
+Several processes can share a store directory (a server answering queries
+while the CLI ingests): every operation holds an ``flock`` on the sibling
+``<directory>.lock`` file, shared for reads and exclusive for writes, and
+first picks up the rows, deletions or compaction written by other handles.
+"""
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+_KEY = np.dtype("S32")
+# Rows appended since the sorted key index was built are looked up in a dict until
+# there are this many, or a quarter of the sorted rows, so re-sorting stays amortized
+_UNSORTED_ROWS = 4096
+# save_indexes compacts a store once this share of its rows is deleted
+DEFAULT_COMPACT_FRACTION = 0.1
+
+
+def chunk_key(chunk_id: str) -> bytes:
+    """Return the 32-byte key of a chunk ID: the digest itself for SHA-256 hex IDs, else a hash of the ID."""
+    if len(chunk_id) == 64:
+        try:
+            return bytes.fromhex(chunk_id)
+        except ValueError:
+            pass
+    return hashlib.sha256(chunk_id.encode("utf-8")).digest()
+
+
+class ChunkStore:
+    """Append-only columnar store that materializes chunks by ID on demand."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._paths = {
+            name: os.path.join(directory, f"{name}.bin") for name in ("text", "ends", "sources", "pages", "ids")
+        }
+        self._deleted_path = os.path.join(directory, "deleted.bin")
+        self._sources_path = os.path.join(directory, "sources.jsonl")
+        self._columns = {"ends": np.int64, "sources": np.int32, "pages": np.int32, "ids": _KEY}
+        self._text: Optional[mmap.mmap] = None
+        self._lock_path = os.path.normpath(directory) + ".lock"
+        self._lock_file: Optional[Any] = None
+        self._lock_depth = 0
+        self._signature: Optional[Tuple[int, int]] = None
+        with self._locked(exclusive=True, refresh=False):
+            self._recover()
+            os.makedirs(directory, exist_ok=True)
+            self._refresh()
+
+    def _open(self) -> None:
+        self._close_text()
+        self._load_sources()
+        self._blocks: Dict[str, List[np.ndarray]] = {name: [self._load_column(name)] for name in self._columns}
+        self._repair()
+        self._deleted = self._load_deleted()
+        self._order: Optional[np.ndarray] = None
+        self._recent: Dict[bytes, int] = {}
+
+    # Locking
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False, refresh: bool = True) -> Iterator[None]:
+        """Hold the thread lock and the lock file, then catch up with writes made through other handles.
+
+        Nested calls reuse the outermost lock, so writers take it exclusively
+        before calling anything that reads.
+        """
+        with self._lock:
+            outermost = self._lock_depth == 0
+            if outermost:
+                if self._lock_file is None:
+                    self._lock_file = open(self._lock_path, "ab")
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._lock_depth += 1
+            try:
+                if outermost and refresh:
+                    self._refresh()
+                yield
+            finally:
+                self._lock_depth -= 1
+                if outermost:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """Reopen after a compaction, else load rows and deletions appended since this handle last looked."""
+        stat = os.stat(self.directory)
+        # A compaction swaps in a new directory; its ctime also changes when a file is first created in it
+        signature = (stat.st_ino, stat.st_ctime_ns)
+        if signature != self._signature:
+            self._open()
+            self._signature = signature
+            return
+        ends = self._paths["ends"]
+        size = os.path.getsize(ends) // 8 if os.path.exists(ends) else 0
+        if size > self._size():
+            self._load_rows(size)
+        deleted = os.path.getsize(self._deleted_path) if os.path.exists(self._deleted_path) else 0
+        if deleted != self._deleted_bytes:
+            self._deleted = self._load_deleted()
+            self._recent = {key: row for key, row in self._recent.items() if row not in self._deleted}
+
+    # Persistence
+
+    def _load_sources(self) -> None:
+        self._source_names: List[str] = []
+        self._source_ids: Dict[str, int] = {}
+        if os.path.exists(self._sources_path):
+            with open(self._sources_path) as f:
+                for line in f:
+                    self._add_source_name(json.loads(line))
+
+    def _load_rows(self, size: int) -> None:
+        """Append the rows another handle wrote, up to ``size``, to the in-memory columns."""
+        first = self._size()
+        self._load_sources()
+        for name, dtype in self._columns.items():
+            itemsize = np.dtype(dtype).itemsize
+            self._blocks[name].append(
+                np.fromfile(self._paths[name], dtype=dtype, count=size - first, offset=first * itemsize)
+            )
+        if self._order is not None:
+            # Keys are sliced from the raw bytes, since NumPy drops trailing NUL bytes from S32 items
+            raw = self._blocks["ids"][-1].tobytes()
+            self._recent.update((raw[i * 32:(i + 1) * 32], first + i) for i in range(size - first))
+
+    def _load_column(self, name: str) -> np.ndarray:
+        path = self._paths[name]
+        if not os.path.exists(path):
+            return np.zeros(0, dtype=self._columns[name])
+        return np.fromfile(path, dtype=self._columns[name])
+
+    def _repair(self) -> None:
+        """Drop rows that were only partly written when a previous run stopped."""
+        n = min(len(blocks[0]) for blocks in self._blocks.values())
+        for name in self._columns:
+            if len(self._blocks[name][0]) > n:
+                self._blocks[name] = [self._blocks[name][0][:n].copy()]
+        self._truncate()
+
+    def _truncate(self) -> None:
+        """Cut the files back to the rows this handle has loaded, dropping anything a crashed writer left."""
+        n = self._size()
+        for name, dtype in self._columns.items():
+            path = self._paths[name]
+            if os.path.exists(path) and os.path.getsize(path) > n * np.dtype(dtype).itemsize:
+                with open(path, "r+b") as f:
+                    f.truncate(n * np.dtype(dtype).itemsize)
+        end = int(self._blocks["ends"][-1][-1]) if n else 0
+        if os.path.exists(self._paths["text"]) and os.path.getsize(self._paths["text"]) > end:
+            with open(self._paths["text"], "r+b") as f:
+                f.truncate(end)
+
+    def _load_deleted(self) -> set:
+        self._deleted_bytes = 0
+        if not os.path.exists(self._deleted_path):
+            return set()
+        size = os.path.getsize(self._deleted_path)
+        if size % 8:
+            # A row number was only partly written; the chunk it named is still deleted by the next sync
+            with open(self._deleted_path, "r+b") as f:
+                f.truncate(size - size % 8)
+        self._deleted_bytes = size - size % 8
+        rows = np.fromfile(self._deleted_path, dtype=np.int64)
+        return set(rows[rows < self._size()].tolist())
+
+    def _compaction_paths(self) -> Tuple[str, str]:
+        base = os.path.normpath(self.directory)
+        return base + ".compact", base + ".old"
+
+    def _recover(self) -> None:
+        """Finish or discard a compaction that a previous run stopped in the middle of."""
+        compacted, old = self._compaction_paths()
+        if os.path.isdir(old):
+            if not os.path.isdir(self.directory):
+                # Stopped between the two renames, after the compacted copy was complete
+                os.rename(compacted, self.directory)
+            shutil.rmtree(old)
+        shutil.rmtree(compacted, ignore_errors=True)
+
+    def _add_source_name(self, name: str) -> int:
+        index = self._source_ids.get(name)
+        if index is None:
+            index = self._source_ids[name] = len(self._source_names)
+            self._source_names.append(name)
+        return index
+
+    def _column(self, name: str) -> np.ndarray:
+        with self._lock:
+            blocks = self._blocks[name]
+            if len(blocks) > 1:
+                blocks[:] = [np.concatenate(blocks)]
+            return blocks[0]
+
+    # Lookup
+
+    def _size(self) -> int:
+        """Return the number of rows, including deleted ones."""
+        return sum(len(block) for block in self._blocks["ends"])
+
+    def __len__(self) -> int:
+        with self._locked():
+            return self._size() - len(self._deleted)
+
+    def _sorted_index(self) -> Optional[np.ndarray]:
+        with self._lock:
+            if self._order is None or len(self._recent) > max(_UNSORTED_ROWS, len(self._order) // 4):
+                keys = self._column("ids")
+                self._order = np.argsort(keys, kind="stable") if len(keys) else None
+                self._recent = {}
+            return self._order
+
+    def row(self, chunk_id: str) -> Optional[int]:
+        """Return the row of a chunk ID, or None if it is not stored."""
+        return self.rows([chunk_id])[0]
+
+    def rows(self, ids: List[str]) -> List[Optional[int]]:
+        """Return the row of each chunk ID, or None for IDs that are not stored."""
+        keys = [chunk_key(i) for i in ids]
+        with self._locked():
+            order = self._sorted_index()
+            recent = dict(self._recent)
+            deleted = self._deleted
+            stored = self._column("ids")[:len(order) if order is not None else 0]
+            result: List[Optional[int]] = [recent.get(key) for key in keys]
+            lookup = [i for i, row in enumerate(result) if row is None]
+            if lookup and order is not None:
+                needles = np.array([keys[i] for i in lookup], dtype=_KEY)
+                positions = np.searchsorted(stored, needles, sorter=order)
+                for i, needle, position in zip(lookup, needles, positions):
+                    # A chunk deleted and added again has a deleted row before its live one
+                    while position < len(order) and stored[order[position]] == needle:
+                        if int(order[position]) not in deleted:
+                            result[i] = int(order[position])
+                            break
+                        position += 1
+        return result
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return self.row(chunk_id) is not None
+
+    # Writing
+
+    def add(self, ids: List[str], chunks: Iterable[Document]) -> int:
+        """Append chunks that are not stored yet and return how many were added."""
+        with self._locked(exclusive=True):
+            known = self.rows(ids)
+            new_keys: Dict[bytes, None] = {}
+            texts: List[bytes] = []
+            sources: List[int] = []
+            pages: List[int] = []
+            new_sources = len(self._source_names)
+            for chunk_id, chunk, row in zip(ids, chunks, known):
+                key = chunk_key(chunk_id)
+                if row is not None or key in new_keys:
+                    continue
+                new_keys[key] = None
+                texts.append(chunk.page_content.encode("utf-8"))
+                sources.append(self._add_source_name(str(chunk.metadata.get("source", ""))))
+                page = chunk.metadata.get("page")
+                pages.append(int(page) if isinstance(page, (int, np.integer)) else -1)
+            if not texts:
+                return 0
+
+            self._truncate()
+            first = self._size()
+            start = int(self._blocks["ends"][-1][-1]) if first else 0
+            ends = start + np.cumsum([len(text) for text in texts], dtype=np.int64)
+            if len(self._source_names) > new_sources:
+                with open(self._sources_path, "a") as f:
+                    for name in self._source_names[new_sources:]:
+                        f.write(json.dumps(name) + "\n")
+            with open(self._paths["text"], "ab") as f:
+                f.write(b"".join(texts))
+            columns = {
+                "sources": np.array(sources, dtype=np.int32),
+                "pages": np.array(pages, dtype=np.int32),
+                "ids": np.array(list(new_keys), dtype=_KEY),
+                # Written last: a row exists once its end offset does
+                "ends": ends,
+            }
+            for name, values in columns.items():
+                with open(self._paths[name], "ab") as f:
+                    f.write(values.tobytes())
+                self._blocks[name].append(values)
+            if self._order is not None:
+                self._recent.update((key, first + i) for i, key in enumerate(new_keys))
+            return len(texts)
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """Stop resolving the given chunks and return how many were stored.
+
+        Their rows are recorded in ``deleted.bin`` and stay in the other
+        files until ``compact`` rewrites them.
+        """
+        ids = list(ids)
+        with self._locked(exclusive=True):
+            rows = sorted({row for row in self.rows(ids) if row is not None})
+            if not rows:
+                return 0
+            with open(self._deleted_path, "ab") as f:
+                f.write(np.array(rows, dtype=np.int64).tobytes())
+            self._deleted_bytes += 8 * len(rows)
+            self._deleted.update(rows)
+            for key in map(chunk_key, ids):
+                if self._recent.get(key) in self._deleted:
+                    del self._recent[key]
+            return len(rows)
+
+    def compact(self, min_fraction: float = 0.0) -> int:
+        """Rewrite the store without its deleted rows if at least ``min_fraction`` of them are deleted.
+
+        The compacted copy is written next to the store and swapped in with
+        two renames; a run stopped in between is finished on the next open.
+        Handles in other processes reopen the store the next time they use it.
+        Returns the number of rows dropped.
+        """
+        with self._locked(exclusive=True):
+            total, dead = self._size(), len(self._deleted)
+            if not dead or dead < min_fraction * total:
+                return 0
+            live = np.setdiff1d(np.arange(total, dtype=np.int64), np.fromiter(self._deleted, np.int64, dead))
+            ends = self._column("ends")
+            starts = np.concatenate([[0], ends[:-1]])
+            compacted, old = self._compaction_paths()
+            shutil.rmtree(compacted, ignore_errors=True)
+            os.makedirs(compacted)
+
+            with open(os.path.join(compacted, "text.bin"), "wb") as f:
+                if len(live) and ends[-1]:
+                    text = self._text_map(int(ends[-1]))
+                    # Copy runs of consecutive live rows in one slice each
+                    for run in np.split(live, np.flatnonzero(np.diff(live) != 1) + 1):
+                        f.write(text[int(starts[run[0]]):int(ends[run[-1]])])
+            columns = {
+                "sources": self._column("sources")[live],
+                "pages": self._column("pages")[live],
+                "ids": self._column("ids")[live],
+                "ends": np.cumsum(ends[live] - starts[live], dtype=np.int64),
+            }
+            for name, values in columns.items():
+                values.tofile(os.path.join(compacted, f"{name}.bin"))
+            if os.path.exists(self._sources_path):
+                shutil.copyfile(self._sources_path, os.path.join(compacted, "sources.jsonl"))
+
+            self._close_text()
+            os.rename(self.directory, old)
+            os.rename(compacted, self.directory)
+            shutil.rmtree(old)
+            self._refresh()
+            return dead
+
+    # Reading
+
+    def _text_map(self, end: int) -> mmap.mmap:
+        with self._lock:
+            if self._text is None or len(self._text) < end:
+                if self._text is not None:
+                    self._text.close()
+                with open(self._paths["text"], "rb") as f:
+                    self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._text
+
+    def text(self, row: int) -> str:
+        ends = self._column("ends")
+        start = int(ends[row - 1]) if row else 0
+        end = int(ends[row])
+        if end == start:
+            return ""
+        return self._text_map(end)[start:end].decode("utf-8")
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        metadata: Dict[str, Any] = {"source": self._source_names[int(self._column("sources")[row])]}
+        page = int(self._column("pages")[row])
+        if page >= 0:
+            metadata["page"] = page
+        return metadata
+
+    def lookup(self, ids: List[str]) -> List[Optional[Document]]:
+        """Materialize chunks by ID, in the order given, with None for IDs that are not stored."""
+        # Rows are only valid until the next compaction, so they are read under the same lock
+        with self._locked():
+            return [
+                Document(page_content=self.text(row), metadata=self.metadata(row)) if row is not None else None
+                for row in self.rows(ids)
+            ]
+
+    def documents(self, ids: List[str]) -> List[Document]:
+        """Materialize chunks by ID, in the order given, skipping IDs that are not stored."""
+        return [doc for doc in self.lookup(ids) if doc is not None]
+
+    def _close_text(self) -> None:
+        with self._lock:
+            if self._text is not None:
+                self._text.close()
+                self._text = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_text()
+            if self._lock_file is not None and not self._lock_depth:
+                self._lock_file.close()
+                self._lock_file = None
@@ -0,0 +1,220 @@
+"""Worker pools and micro-batching for the async query path.
+
+Query embedding runs in a thread or process pool (``RAG_EMBED_EXECUTOR``)
+and vector search in a thread pool, so neither blocks the event loop of the
+LangGraph server. Queries that arrive within ``RAG_EMBED_BATCH_WAIT_MS`` of
+each other are embedded in one model call.
+"""
+import asyncio
+import functools
+import os
+import threading
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from .embeddings import embed_queries
+from .metrics import QUERY_STAGE_SECONDS, observe_batch, timed
+
+DEFAULT_EMBED_BATCH_SIZE = 64
+DEFAULT_EMBED_BATCH_WAIT_MS = 2.0
+
+_lock = threading.Lock()
+_embedding_executor: Optional[Executor] = None
+_search_executor: Optional[ThreadPoolExecutor] = None
+_batchers: Dict[int, Tuple[Embeddings, "MicroBatcher"]] = {}
+
+
+def _workers(variable: str) -> int:
+    return int(os.getenv(variable, 0)) or os.cpu_count() or 4
+
+
+def get_embedding_executor() -> Executor:
+    """Return the pool that runs query embedding, a process pool if ``RAG_EMBED_EXECUTOR=process``."""
+    global _embedding_executor
+    with _lock:
+        if _embedding_executor is None:
+            kind = os.getenv("RAG_EMBED_EXECUTOR", "thread")
+            workers = _workers("RAG_EMBED_WORKERS")
+            if kind == "process":
+                # Each worker process loads its own copy of the embedding model on first use
+                _embedding_executor = ProcessPoolExecutor(max_workers=workers)
+            elif kind == "thread":
+                _embedding_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-embed")
+            else:
+                raise ValueError(f"Unknown executor kind: {kind}")
+        return _embedding_executor
+
+
+def get_search_executor() -> ThreadPoolExecutor:
+    """Return the thread pool that runs vector and BM25 searches."""
+    global _search_executor
+    with _lock:
+        if _search_executor is None:
+            _search_executor = ThreadPoolExecutor(
+                max_workers=_workers("RAG_SEARCH_WORKERS"), thread_name_prefix="rag-search"
+            )
+        return _search_executor
+
+
+def shutdown_executors() -> None:
+    """Stop the worker pools; they are recreated on next use."""
+    global _embedding_executor, _search_executor
+    with _lock:
+        executors = [e for e in (_embedding_executor, _search_executor) if e is not None]
+        _embedding_executor = _search_executor = None
+    for executor in executors:
+        executor.shutdown(wait=True)
+
+
+async def run_in_search_pool(fn: Callable, *args: Any) -> Any:
+    """Run a blocking search function in the search thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_search_executor(), lambda: fn(*args))
+
+
+def _embed_batch(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    with timed(QUERY_STAGE_SECONDS, stage="embed_query"):
+        return embed_queries(embeddings, texts)
+
+
+def embed_with_shared_model(texts: List[str]) -> List[List[float]]:
+    """Embed queries with the shared model. Module level so a process pool can pickle it."""
+    from .resources import get_embeddings
+
+    return _embed_batch(get_embeddings(), texts)
+
+
+class _LoopQueue:
+    """Items waiting to be batched on one event loop."""
+
+    __slots__ = ("pending", "timer")
+
+    def __init__(self) -> None:
+        self.pending: List[Tuple[Any, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher:
+    """Coalesce concurrent ``submit`` calls into batched calls of ``fn`` in a worker pool.
+
+    A batch is sent when ``max_batch`` items are waiting or ``max_wait``
+    seconds after its first item arrived, whichever comes first. Each event
+    loop has its own queue, so loops running in different threads (e.g. one
+    ``asyncio.run`` per request) batch their own items and never drop each
+    other's.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], List[Any]],
+        executor: Callable[[], Executor],
+        max_batch: int = DEFAULT_EMBED_BATCH_SIZE,
+        max_wait: float = DEFAULT_EMBED_BATCH_WAIT_MS / 1000,
+        name: str = "micro_batch",
+    ):
+        self.fn = fn
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._lock = threading.Lock()
+        self._queues: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopQueue]" = weakref.WeakKeyDictionary()
+
+    async def submit(self, item: Any) -> Any:
+        """Queue ``item`` and wait for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = None
+        with self._lock:
+            queue = self._queues.get(loop)
+            if queue is None:
+                queue = self._queues[loop] = _LoopQueue()
+            queue.pending.append((item, future))
+            if len(queue.pending) >= self.max_batch:
+                batch = self._take(queue)
+            elif queue.timer is None:
+                queue.timer = loop.call_later(self.max_wait, self._flush, loop)
+        if batch:
+            self._send(loop, batch)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self._discard(loop, future)
+            raise
+
+    def _take(self, queue: _LoopQueue) -> List[Tuple[Any, asyncio.Future]]:
+        """Empty a queue and return its items. Callers must hold the lock."""
+        if queue.timer is not None:
+            queue.timer.cancel()
+            queue.timer = None
+        batch, queue.pending = queue.pending, []
+        if batch:
+            self.batches += 1
+            self.items += len(batch)
+        return batch
+
+    def _discard(self, loop: asyncio.AbstractEventLoop, future: asyncio.Future) -> None:
+        """Drop a cancelled item that has not been sent, so a closing loop leaves nothing queued."""
+        with self._lock:
+            queue = self._queues.get(loop)
+            if queue is None:
+                return
+            queue.pending = [(item, f) for item, f in queue.pending if f is not future]
+            if not queue.pending and queue.timer is not None:
+                queue.timer.cancel()
+                queue.timer = None
+
+    def _flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        with self._lock:
+            queue = self._queues.get(loop)
+            batch = self._take(queue) if queue is not None else []
+        if batch:
+            self._send(loop, batch)
+
+    def _send(self, loop: asyncio.AbstractEventLoop, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        """Run ``fn`` on a batch in the worker pool and resolve its futures on ``loop``."""
+        observe_batch(self.name, len(batch))
+        task = loop.run_in_executor(self.executor(), self.fn, [item for item, _ in batch])
+
+        def deliver(task: asyncio.Future) -> None:
+            try:
+                results = task.result()
+            except BaseException as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+        task.add_done_callback(deliver)
+
+
+def get_query_batcher(embeddings: Embeddings) -> MicroBatcher:
+    """Return the micro-batcher that embeds queries with ``embeddings``.
+
+    Process pool workers cannot receive a loaded model, so they embed with
+    the shared model from ``resources`` instead.
+    """
+    with _lock:
+        entry = _batchers.get(id(embeddings))
+        if entry is None or entry[0] is not embeddings:
+            if os.getenv("RAG_EMBED_EXECUTOR", "thread") == "process":
+                fn = embed_with_shared_model
+            else:
+                fn = functools.partial(_embed_batch, embeddings)
+            batcher = MicroBatcher(
+                fn,
+                get_embedding_executor,
+                max_batch=int(os.getenv("RAG_EMBED_BATCH_SIZE", DEFAULT_EMBED_BATCH_SIZE)),
+                max_wait=float(os.getenv("RAG_EMBED_BATCH_WAIT_MS", DEFAULT_EMBED_BATCH_WAIT_MS)) / 1000,
+                name="async_embed_queries",
+            )
+            entry = _batchers[id(embeddings)] = (embeddings, batcher)
+        return entry[1]
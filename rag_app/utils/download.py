@@ -0,0 +1,194 @@
+"""Concurrent PDF downloader with a pooled session and a conditional-request cache."""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_CACHE_DIR = "./data/downloads"
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_PER_HOST = 4
+DEFAULT_TIMEOUT = (10.0, 60.0)
+CHUNK_SIZE = 1 << 16
+
+
+@dataclass
+class DownloadResult:
+    """Outcome of fetching a single URL."""
+
+    url: str
+    path: Optional[str]
+    changed: bool = False
+    ingested: bool = False
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.path is not None and self.error is None
+
+
+def is_url(value: str) -> bool:
+    """Return True if the value looks like an HTTP(S) URL."""
+    return value.startswith(("http://", "https://"))
+
+
+def normalize_url(url: str) -> str:
+    """Quote special characters in URLs that were passed without shell quoting."""
+    if '!' in url and not url.startswith('http'):
+        url = quote(url, safe=':/?&=')
+    return url
+
+
+class Downloader:
+    """Fetch many URLs concurrently and keep unchanged files on disk.
+
+    Every URL maps to a file in ``cache_dir``. The ``ETag`` and
+    ``Last-Modified`` headers of the last response are kept in an index so
+    later fetches become conditional requests, and a ``304 Not Modified``
+    reuses the cached file without downloading it again.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        per_host: int = DEFAULT_PER_HOST,
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+        session: Optional[requests.Session] = None,
+    ):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.timeout = timeout
+        os.makedirs(cache_dir, exist_ok=True)
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._index: Dict[str, Dict] = self._load_index()
+        self._lock = threading.Lock()
+        self._host_limits: Dict[str, threading.BoundedSemaphore] = {}
+
+    def _load_index(self) -> Dict[str, Dict]:
+        if not os.path.exists(self._index_path):
+            return {}
+        try:
+            with open(self._index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self) -> None:
+        """Persist the index atomically. Callers must hold the lock."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._index_path)
+
+    def _host_limit(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_limits[host]
+
+    def cache_path(self, url: str) -> str:
+        """Return the local file used to cache ``url``."""
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".pdf")
+
+    def fetch(self, url: str) -> DownloadResult:
+        """Download ``url`` unless the cached copy is still current."""
+        url = normalize_url(url)
+        path = self.cache_path(url)
+        with self._lock:
+            entry = dict(self._index.get(url, {}))
+
+        headers = {}
+        if entry and os.path.exists(path):
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            with self._host_limit(url):
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code == 304:
+                        return DownloadResult(url, path, changed=False, ingested=entry.get("ingested", False))
+                    response.raise_for_status()
+
+                    # Check if the content is a PDF
+                    content_type = response.headers.get('Content-Type', '')
+                    if 'application/pdf' not in content_type and not url.lower().endswith('.pdf'):
+                        print(f"Warning: URL might not be a PDF. Content-Type: {content_type}")
+
+                    # Write to a temporary file first so readers never see a partial PDF
+                    digest = hashlib.sha256()
+                    fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+                    try:
+                        with os.fdopen(fd, "wb") as f:
+                            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                                digest.update(chunk)
+                                f.write(chunk)
+                        os.replace(tmp_path, path)
+                    except BaseException:
+                        os.remove(tmp_path)
+                        raise
+                    etag = response.headers.get("ETag")
+                    last_modified = response.headers.get("Last-Modified")
+        except Exception as e:
+            return DownloadResult(url, None, error=str(e))
+
+        sha256 = digest.hexdigest()
+        # A full response with identical bytes is still unchanged content
+        changed = sha256 != entry.get("sha256")
+        ingested = entry.get("ingested", False) and not changed
+        with self._lock:
+            self._index[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "sha256": sha256,
+                "ingested": ingested,
+            }
+            self._save_index()
+        return DownloadResult(url, path, changed=changed, ingested=ingested)
+
+    def fetch_many(self, urls: List[str]) -> List[DownloadResult]:
+        """Fetch URLs concurrently and return results in input order."""
+        if not urls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as pool:
+            return list(pool.map(self.fetch, urls))
+
+    def mark_ingested(self, url: str) -> None:
+        """Record that the cached copy of ``url`` has been ingested."""
+        url = normalize_url(url)
+        with self._lock:
+            if url in self._index:
+                self._index[url]["ingested"] = True
+                self._save_index()
+
+
+_default_downloader: Optional[Downloader] = None
+_default_lock = threading.Lock()
+
+
+def get_downloader() -> Downloader:
+    """Return the process-wide downloader so its connection pool is shared."""
+    global _default_downloader
+    with _default_lock:
+        if _default_downloader is None:
+            _default_downloader = Downloader(cache_dir=os.getenv("RAG_DOWNLOAD_CACHE", DEFAULT_CACHE_DIR))
+        return _default_downloader
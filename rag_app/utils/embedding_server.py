@@ -0,0 +1,339 @@
+"""Shared embedding model served over a unix socket or localhost TCP.
+
+One ``EmbeddingServer`` process keeps the model resident; CLI runs, scripts
+and graph workers use ``EmbeddingClient`` instead of loading their own copy.
+Requests from all connected clients go through one queue, and the model
+thread embeds whatever has arrived within ``max_wait`` seconds (up to
+``max_batch`` texts) in a single call.
+
+Messages are framed with a 4-byte big-endian length. Requests are JSON;
+responses are a JSON header followed by the vectors as raw float32.
+"""
+import errno
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .metrics import observe_batch
+
+DEFAULT_MAX_BATCH = 256
+DEFAULT_MAX_WAIT_MS = 5.0
+_HEADER = struct.Struct("!I")
+# Texts per request sent by the client, so one large ingest batch cannot starve other clients
+_CLIENT_BATCH = 256
+
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """Parse ``unix:/path``, ``/path`` or ``host:port`` into a socket family name and address."""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    if address.startswith("/") or address.startswith("."):
+        return "unix", address
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+def _send(sock: socket.socket, *parts: bytes) -> None:
+    sock.sendall(_HEADER.pack(sum(len(part) for part in parts)) + b"".join(parts))
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if not n:
+            raise ConnectionError("Connection closed")
+        received += n
+    return bytes(buffer)
+
+
+def _recv(sock: socket.socket) -> bytes:
+    (size,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return _recv_exactly(sock, size)
+
+
+class _Request:
+    __slots__ = ("texts", "done", "vectors", "error")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.done = threading.Event()
+        self.vectors: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+class DynamicBatcher:
+    """Embed requests from many threads in shared model calls on one model thread.
+
+    Every connection has at most one request in flight, so a batch is sent
+    without waiting further once each connected client has a request in it.
+    """
+
+    def __init__(
+        self, embeddings: Embeddings, max_batch: int = DEFAULT_MAX_BATCH, max_wait: float = DEFAULT_MAX_WAIT_MS / 1000
+    ):
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.texts = 0
+        self.clients = 0
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="rag-embedding-model", daemon=True)
+        self._thread.start()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, waiting for the batch they are part of."""
+        request = _Request(texts)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.vectors
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first: _Request) -> List[_Request]:
+        batch, size = [first], len(first.texts)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch and len(batch) < self.clients:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)  # Handle the stop signal after this batch
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            texts = [text for request in batch for text in request.texts]
+            self.batches += 1
+            self.texts += len(texts)
+            observe_batch("embedding_server", len(texts))
+            try:
+                vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32).reshape(len(texts), -1)
+            except BaseException as e:
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+                continue
+            start = 0
+            for request in batch:
+                request.vectors = vectors[start:start + len(request.texts)]
+                start += len(request.texts)
+                request.done.set()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    server: "_ServerMixin"
+
+    def setup(self) -> None:
+        if self.request.family != socket.AF_UNIX:
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.batcher.clients += 1
+
+    def finish(self) -> None:
+        with self.server.lock:
+            self.server.batcher.clients -= 1
+
+    def _send_error(self, error: str) -> None:
+        header = json.dumps({"error": error}).encode()
+        _send(self.request, _HEADER.pack(len(header)), header)
+
+    def handle(self) -> None:
+        while True:
+            try:
+                message = _recv(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                request = json.loads(message)
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                # Messages are length-framed, so the connection can carry on after a malformed one
+                self._send_error(f"Malformed request: {e}")
+                continue
+            try:
+                if request.get("op") == "info":
+                    _send(self.request, json.dumps(self.server.info()).encode())
+                    continue
+                vectors = self.server.batcher.embed(request["texts"])
+                header = json.dumps({"rows": int(vectors.shape[0]), "dim": int(vectors.shape[1])})
+                _send(self.request, _HEADER.pack(len(header)), header.encode(), vectors.tobytes())
+            except Exception as e:
+                self._send_error(f"{type(e).__name__}: {e}")
+
+
+class _ServerMixin:
+    daemon_threads = True
+    # Many workers may connect at once when a batch of jobs starts
+    request_queue_size = 128
+    batcher: DynamicBatcher
+    model_name: str
+    lock: threading.Lock
+
+    def info(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "batches": self.batcher.batches, "texts": self.batcher.texts}
+
+
+class _UnixServer(_ServerMixin, socketserver.ThreadingUnixStreamServer):
+    pass
+
+
+class _TCPServer(_ServerMixin, socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+
+
+def _remove_stale_socket(path: str, address: str) -> None:
+    """Remove a socket file left behind by a server that did not shut down cleanly.
+
+    Raises OSError with ``EADDRINUSE``, as binding a TCP port in use does,
+    if a server still answers on it.
+    """
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise OSError(errno.EADDRINUSE, f"An embedding server is already listening on {address}")
+
+
+class EmbeddingServer:
+    """Serve one embedding model to every local process."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        address: str,
+        model_name: str = "",
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_wait: float = DEFAULT_MAX_WAIT_MS / 1000,
+    ):
+        family, target = parse_address(address)
+        if family == "unix":
+            if os.path.exists(target):
+                _remove_stale_socket(target, address)
+            self._server = _UnixServer(target, _Handler)
+        else:
+            self._server = _TCPServer(target, _Handler)
+        self._server.batcher = DynamicBatcher(embeddings, max_batch=max_batch, max_wait=max_wait)
+        self._server.model_name = model_name or getattr(embeddings, "model_name", "")
+        self._server.lock = threading.Lock()
+        self.address = address
+        self._path = target if family == "unix" else None
+
+    @property
+    def batcher(self) -> DynamicBatcher:
+        return self._server.batcher
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def start(self) -> "EmbeddingServer":
+        """Serve from a background thread."""
+        threading.Thread(target=self.serve_forever, name="rag-embedding-server", daemon=True).start()
+        return self
+
+    def shutdown(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._server.batcher.close()
+        if self._path and os.path.exists(self._path):
+            os.unlink(self._path)
+
+
+class EmbeddingClient(Embeddings):
+    """``Embeddings`` that delegates to an ``EmbeddingServer``.
+
+    Each thread keeps its own connection, so concurrent graph workers send
+    requests in parallel and the server batches them together.
+    """
+
+    def __init__(self, address: str, timeout: Optional[float] = 60.0):
+        self.address = address
+        self.timeout = timeout
+        self._local = threading.local()
+        self.model_name = self._info().get("model_name", "")
+
+    def _connect(self) -> socket.socket:
+        family, target = parse_address(self.address)
+        sock = socket.socket(socket.AF_UNIX if family == "unix" else socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(target)
+        except OSError as e:
+            sock.close()
+            raise ConnectionError(
+                f"No embedding server at {self.address}. Start one with `rag-app serve-embeddings`."
+            ) from e
+        if family == "tcp":
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _call(self, request: Dict[str, Any]) -> bytes:
+        payload = json.dumps(request).encode()
+        # One retry on a fresh connection, e.g. after the server restarted
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None)
+            if sock is None:
+                sock = self._local.sock = self._connect()
+            try:
+                _send(sock, payload)
+                return _recv(sock)
+            except (ConnectionError, OSError):
+                sock.close()
+                self._local.sock = None
+                if attempt:
+                    raise
+        raise AssertionError("unreachable")
+
+    def _info(self) -> Dict[str, Any]:
+        return json.loads(self._call({"op": "info"}))
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), _CLIENT_BATCH):
+            response = self._call({"op": "embed", "texts": texts[start:start + _CLIENT_BATCH]})
+            (size,) = _HEADER.unpack_from(response)
+            header = json.loads(response[_HEADER.size:_HEADER.size + size])
+            if "error" in header:
+                raise RuntimeError(f"Embedding server error: {header['error']}")
+            body = np.frombuffer(response, dtype=np.float32, offset=_HEADER.size + size)
+            vectors.extend(body.reshape(header["rows"], header["dim"]).tolist())
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts)) if texts else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
@@ -0,0 +1,187 @@
+"""Embedding helpers for the RAG application."""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from .settings import DEFAULT_MODEL_NAME, DEFAULT_PERSIST_DIRECTORY
+# Kept in the persist directory unless RAG_EMBEDDING_CACHE names another file
+DEFAULT_CACHE_FILE = "embedding_cache.sqlite3"
+DEFAULT_CACHE_PATH = os.path.join(DEFAULT_PERSIST_DIRECTORY, DEFAULT_CACHE_FILE)
+DEFAULT_CACHE_MAX_ENTRIES = 200_000
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different chunks share a cache entry."""
+    return " ".join(text.split())
+
+
+def text_hash(text: str) -> str:
+    """Return the hex SHA-256 of the normalized text."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that persists document vectors in a size-bounded SQLite cache.
+
+    Entries are keyed by ``(model_name, text_hash(text))`` and evicted least
+    recently used first once ``max_entries`` is exceeded. The row count is
+    kept in memory and counted again after every tenth of ``max_entries``
+    inserts, to pick up rows written by other processes.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model_name: str = DEFAULT_MODEL_NAME,
+        cache_path: str = DEFAULT_CACHE_PATH,
+        max_entries: int = DEFAULT_CACHE_MAX_ENTRIES,
+    ):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, hash))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        self._inserted = 0
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """Fetch cached vectors for the given hashes and refresh their recency."""
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                [self.model_name, *batch],
+            ).fetchall()
+            for key, blob in rows:
+                vector = array("f")
+                vector.frombytes(blob)
+                found[key] = vector.tolist()
+        if found:
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                [(now, self.model_name, key) for key in found],
+            )
+        return found
+
+    def _store(self, items: Dict[str, List[float]]) -> None:
+        """Insert freshly computed vectors and evict the oldest entries if needed."""
+        now = time.time()
+        # Rows another process stored in the meantime hold the same vector, so they are kept
+        inserted = self._conn.executemany(
+            "INSERT OR IGNORE INTO embeddings (model, hash, vector, last_used) VALUES (?, ?, ?, ?)",
+            [
+                (self.model_name, key, array("f", vector).tobytes(), now)
+                for key, vector in items.items()
+            ],
+        ).rowcount
+        self._count += inserted
+        self._inserted += inserted
+        if self._inserted >= max(self.max_entries // 10, 1):
+            (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            self._inserted = 0
+        if self._count > self.max_entries:
+            self._count -= self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                " SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (self._count - self.max_entries,),
+            ).rowcount
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, computing only the texts that are not cached yet."""
+        hashes = [text_hash(text) for text in texts]
+        with self._lock:
+            cached = self._lookup(hashes)
+
+            # Embed each missing text once, even if it repeats within the batch
+            missing: Dict[str, str] = {}
+            for key, text in zip(hashes, texts):
+                if key not in cached and key not in missing:
+                    missing[key] = text
+            self.hits += len(texts) - sum(1 for key in hashes if key not in cached)
+            self.misses += len(missing)
+
+            if missing:
+                vectors = self.underlying.embed_documents(list(missing.values()))
+                computed = dict(zip(missing.keys(), vectors))
+                self._store(computed)
+                cached.update(computed)
+            self._conn.commit()
+
+        return [list(cached[key]) for key in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query without caching it."""
+        return self.underlying.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries in one batched model call without caching them."""
+        return embed_queries(self.underlying, texts)
+
+    def clear(self) -> None:
+        """Remove every cached vector for this model."""
+        with self._lock:
+            self._count -= self._conn.execute("DELETE FROM embeddings WHERE model = ?", (self.model_name,)).rowcount
+            self._conn.commit()
+
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """Embed several queries in one batched call.
+
+    Uses the model's own ``embed_queries`` when it has one, otherwise
+    ``embed_documents``, which is equivalent to ``embed_query`` for
+    sentence-transformers models that do not use a query instruction.
+    """
+    if not texts:
+        return []
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    return embeddings.embed_documents(texts)
+
+
+def cached_embeddings(
+    underlying: Embeddings,
+    model_name: str = DEFAULT_MODEL_NAME,
+    cache_path: Optional[str] = None,
+    max_entries: Optional[int] = None,
+    persist_directory: str = DEFAULT_PERSIST_DIRECTORY,
+) -> CachedEmbeddings:
+    """Wrap embeddings in a cache configured from the environment, by default in ``persist_directory``."""
+    return CachedEmbeddings(
+        underlying,
+        model_name=model_name,
+        cache_path=cache_path
+        or os.getenv("RAG_EMBEDDING_CACHE")
+        or os.path.join(persist_directory, DEFAULT_CACHE_FILE),
+        max_entries=max_entries or int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", DEFAULT_CACHE_MAX_ENTRIES)),
+    )
@@ -0,0 +1,256 @@
+"""Metadata filters and the secondary index that evaluates them without reading metadata.
+
+Filters use Chroma's ``where`` syntax, e.g.
+``{"$and": [{"source": "manual.pdf"}, {"page": {"$gte": 10}}, {"page": {"$lte": 20}}]}``,
+so the same filter works for every vector store backend.
+"""
+import json
+import math
+import threading
+from array import array
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+_COMPARISONS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+
+def metadata_matches(metadata: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    """Evaluate a Chroma-style ``where`` filter, e.g. ``{"source": {"$in": [...]}}``, against metadata."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(metadata_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(metadata_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator not in _COMPARISONS:
+                    raise ValueError(f"Unsupported filter operator: {operator}")
+                try:
+                    if not _COMPARISONS[operator](value, operand):
+                        return False
+                except TypeError:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def metadata_filter(
+    source: Optional[Union[str, Sequence[str]]] = None,
+    pages: Optional[Tuple[Optional[int], Optional[int]]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Build a filter for one or more sources and an inclusive ``(first, last)`` page range.
+
+    Either end of the range may be None. The result is accepted by Chroma,
+    which wants one operator per clause and several clauses under ``$and``.
+    """
+    clauses: List[Dict[str, Any]] = []
+    if isinstance(source, str):
+        clauses.append({"source": source})
+    elif source is not None:
+        sources = list(source)
+        clauses.append({"source": sources[0]} if len(sources) == 1 else {"source": {"$in": sources}})
+    if pages is not None:
+        first, last = pages
+        if first is not None and first == last:
+            clauses.append({"page": first})
+        else:
+            if first is not None:
+                clauses.append({"page": {"$gte": first}})
+            if last is not None:
+                clauses.append({"page": {"$lte": last}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def filter_key(filter: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Return a hashable, order-independent key of a filter for caches."""
+    return json.dumps(filter, sort_keys=True, default=str) if filter else None
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool)
+
+
+class MetadataIndex:
+    """Secondary index of the ``source`` and ``page`` metadata of rows numbered from 0.
+
+    Each source has a posting list of its rows and pages are kept in a
+    float64 column (NaN when a row has none), so a filter on them becomes a
+    boolean row mask from a few dictionary lookups and vectorized compares,
+    without touching per-row metadata dicts. Conditions on other keys are
+    evaluated against ``metadata(row)`` when the owner can provide it.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._sources: Dict[Any, array] = {}
+        self._pages = array("d")
+        # Set once a row has a page that is not a number; page conditions are then checked per row
+        self._irregular_pages = False
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def add(self, metadata: Optional[Dict[str, Any]]) -> int:
+        """Index the metadata of the next row and return the row."""
+        metadata = metadata or {}
+        source = metadata.get("source")
+        page = metadata.get("page")
+        with self._lock:
+            row = len(self._pages)
+            try:
+                self._sources.setdefault(source, array("q")).append(row)
+            except TypeError:
+                # Unhashable source: only reachable through the per-row fallback
+                self._sources.setdefault(json.dumps(source, default=str), array("q")).append(row)
+            if page is not None and not _is_number(page):
+                self._irregular_pages = True
+            self._pages.append(float(page) if _is_number(page) else math.nan)
+        return row
+
+    def add_many(self, metadatas: Iterable[Optional[Dict[str, Any]]]) -> None:
+        for metadata in metadatas:
+            self.add(metadata)
+
+    def mask(
+        self, where: Dict[str, Any], metadata: Optional[Callable[[int], Dict[str, Any]]] = None
+    ) -> np.ndarray:
+        """Return a boolean mask of the rows that match ``where``.
+
+        Raises ValueError for conditions on keys other than ``source`` and
+        ``page`` when ``metadata`` is not given.
+        """
+        with self._lock:
+            return self._mask(where, len(self._pages), metadata)
+
+    def _mask(self, where: Dict[str, Any], n: int, metadata: Optional[Callable[[int], Dict[str, Any]]]) -> np.ndarray:
+        mask = np.ones(n, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._mask(clause, n, metadata)
+            elif key == "$or":
+                either = np.zeros(n, dtype=bool)
+                for clause in condition:
+                    either |= self._mask(clause, n, metadata)
+                mask &= either
+            else:
+                operators = condition if isinstance(condition, dict) else {"$eq": condition}
+                for operator, operand in operators.items():
+                    if operator not in _COMPARISONS:
+                        raise ValueError(f"Unsupported filter operator: {operator}")
+                    mask &= self._condition(key, operator, operand, n, metadata)
+        return mask
+
+    def _condition(
+        self, key: str, operator: str, operand: Any, n: int, metadata: Optional[Callable[[int], Dict[str, Any]]]
+    ) -> np.ndarray:
+        indexed = None
+        if key == "source":
+            indexed = self._source_mask(operator, operand, n)
+        elif key == "page" and not self._irregular_pages:
+            indexed = self._page_mask(operator, operand, n)
+        if indexed is not None:
+            return indexed
+        if metadata is None:
+            raise ValueError(f"Only source and page conditions can be evaluated here, got {key!r} {operator}")
+        clause = {key: {operator: operand}}
+        return np.fromiter((metadata_matches(metadata(row), clause) for row in range(n)), dtype=bool, count=n)
+
+    def _source_mask(self, operator: str, operand: Any, n: int) -> Optional[np.ndarray]:
+        if operator in ("$eq", "$ne"):
+            values = [operand]
+        elif operator in ("$in", "$nin") and isinstance(operand, (list, tuple, set)):
+            values = list(operand)
+        else:
+            return None
+        mask = np.zeros(n, dtype=bool)
+        try:
+            postings = [self._sources.get(value) for value in values]
+        except TypeError:
+            return None
+        for rows in postings:
+            if rows is not None:
+                rows = np.frombuffer(rows, dtype=np.int64)
+                mask[rows[rows < n]] = True
+        return ~mask if operator in ("$ne", "$nin") else mask
+
+    def _page_mask(self, operator: str, operand: Any, n: int) -> Optional[np.ndarray]:
+        pages = np.frombuffer(self._pages, dtype=np.float64)[:n]
+        if operator in ("$in", "$nin"):
+            if not isinstance(operand, (list, tuple, set)) or not all(_is_number(value) for value in operand):
+                return None
+            found = np.isin(pages, np.array(list(operand), dtype=np.float64))
+            return ~found if operator == "$nin" else found
+        if not _is_number(operand):
+            return None
+        # Comparisons with NaN are False, like comparisons with a missing page
+        if operator == "$eq":
+            return pages == operand
+        if operator == "$ne":
+            return pages != operand
+        if operator == "$gt":
+            return pages > operand
+        if operator == "$gte":
+            return pages >= operand
+        if operator == "$lt":
+            return pages < operand
+        return pages <= operand
+
+    def select(self, rows: np.ndarray) -> "MetadataIndex":
+        """Return an index of only the given rows, in increasing order, renumbered from 0."""
+        with self._lock:
+            index = MetadataIndex()
+            renumbered = np.full(len(self._pages), -1, dtype=np.int64)
+            renumbered[rows] = np.arange(len(rows))
+            for name, posting in self._sources.items():
+                kept = renumbered[np.frombuffer(posting, dtype=np.int64)]
+                kept = kept[kept >= 0]
+                if len(kept):
+                    index._sources[name] = array("q", kept.tobytes())
+            index._pages = array("d", np.frombuffer(self._pages, dtype=np.float64)[rows].tobytes())
+            index._irregular_pages = self._irregular_pages
+            return index
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Return the index as arrays for ``np.savez``."""
+        with self._lock:
+            names = list(self._sources)
+            codes = np.zeros(len(self._pages), dtype=np.int32)
+            for code, name in enumerate(names):
+                codes[np.frombuffer(self._sources[name], dtype=np.int64)] = code
+            return {
+                "meta_sources": np.array([json.dumps(name).encode("utf-8") for name in names], dtype=bytes),
+                "meta_source_codes": codes,
+                "meta_pages": np.frombuffer(self._pages, dtype=np.float64).copy(),
+                "meta_irregular": np.array([self._irregular_pages]),
+            }
+
+    @classmethod
+    def from_arrays(cls, data: Any) -> "MetadataIndex":
+        """Rebuild an index from the arrays written by ``to_arrays``."""
+        index = cls()
+        names = [json.loads(name.decode("utf-8")) for name in data["meta_sources"].tolist()]
+        codes = data["meta_source_codes"]
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+        for code, name in enumerate(names):
+            index._sources[name] = array("q", order[bounds[code]:bounds[code + 1]].astype(np.int64).tobytes())
+        index._pages = array("d", data["meta_pages"].astype(np.float64).tobytes())
+        index._irregular_pages = bool(data["meta_irregular"][0])
+        return index
@@ -0,0 +1,265 @@
+"""Parallel multi-document ingestion pipeline."""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from langchain_core.documents import Document
+
+from .chunkstore import ChunkStore
+from .jobs import JobStore
+from .lexical import LexicalIndex
+from .manifest import Manifest, SourceSync, iter_page_chunks, remove_missing_sources
+from .metrics import INGEST_ITEMS, INGEST_SECONDS, count, observe_stage, timed
+from .tools import DEFAULT_BATCH_SIZE, embed_chunks, expand_inputs, filter_new_chunks, store_chunks
+
+DEFAULT_QUEUE_SIZE = 4
+
+# Sentinel that tells a pipeline stage its input is exhausted
+_DONE = object()
+
+
+@dataclass
+class IngestStats:
+    """Counters collected while running the ingest pipeline."""
+
+    files: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    pages: int = 0
+    chunks: int = 0
+    skipped_chunks: int = 0
+    deleted_chunks: int = 0
+    # Error message of each file that could not be ingested, by path
+    errors: Dict[str, str] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def failed(self) -> List[str]:
+        return list(self.errors)
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        """Return a one-line human readable summary."""
+        return (
+            f"Ingested {self.files} files ({self.unchanged} unchanged, {self.removed} removed, "
+            f"{len(self.failed)} failed), {self.pages} pages, {self.chunks} new chunks "
+            f"({self.skipped_chunks} already stored, {self.deleted_chunks} deleted) "
+            f"in {self.elapsed:.2f}s: {self.pages_per_second:.1f} pages/s, "
+            f"{self.chunks_per_second:.1f} chunks/s"
+        )
+
+
+@dataclass
+class _Batch:
+    """Chunks of one source on their way through the embed and write stages."""
+
+    source: SourceSync
+    chunks: List[Document]
+    new_chunks: List[Document]
+    ids: List[str]
+    pages: Dict[str, Dict]
+    next_page: int
+    vectors: Optional[List[List[float]]] = None
+
+
+def _split_pdf(pdf_path: str, plan: Dict[str, Any], pages: "queue.Queue", stop) -> None:
+    """Stream one PDF's pages to ``pages`` as they are parsed and split. Runs inside a worker process.
+
+    Every message is ``(kind, path, payload)``. Stage timings travel in the
+    final message, because metrics recorded in a worker process never reach
+    the parent.
+    """
+    timings: Dict[str, float] = {}
+    try:
+        for page in iter_page_chunks(pdf_path, timings=timings, **plan):
+            if stop.is_set():
+                return
+            pages.put(("page", pdf_path, page))
+    except Exception as e:
+        pages.put(("failed", pdf_path, f"{type(e).__name__}: {e}"))
+        return
+    pages.put(("done", pdf_path, timings))
+
+
+def _stage(target, inbox: queue.Queue, outbox: Optional[queue.Queue], errors: List[BaseException]) -> threading.Thread:
+    """Start a thread that applies ``target`` to every item of ``inbox``.
+
+    Start stages only after worker processes are forked: a child forked
+    while a thread holds a lock inherits the lock held forever.
+    """
+    def run() -> None:
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            if errors:
+                # Keep draining so upstream stages never block on a full queue
+                continue
+            try:
+                result = target(item)
+                if outbox is not None:
+                    outbox.put(result)
+            except BaseException as e:
+                errors.append(e)
+        if outbox is not None:
+            outbox.put(_DONE)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def ingest_paths(
+    inputs: Iterable[str],
+    vectorstore,
+    manifest: Manifest,
+    workers: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    lexical_index: Optional[LexicalIndex] = None,
+    chunk_store: Optional[ChunkStore] = None,
+    jobs: Optional[JobStore] = None,
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = None,
+) -> IngestStats:
+    """Sync many PDFs with overlapping parse, embed and write stages.
+
+    Each PDF goes through the same steps as ``sync_pdf``: unchanged files are
+    skipped, unchanged pages keep their chunks, progress is checkpointed in
+    its job, stale chunks are deleted and the manifest is updated, and
+    sources that disappeared from input directories are removed. PDFs are
+    read and split page by page in a process pool, with the configured chunk
+    size and overlap unless they are given, and pages stream back through a
+    bounded queue. Batches of new chunks are handed through bounded queues
+    to an embedding thread and a writer thread, so the stages run
+    concurrently and memory stays bounded however long the PDFs are.
+    """
+    inputs = list(inputs)
+    stats = IngestStats()
+    paths = expand_inputs(inputs)
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    embed_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    write_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    errors: List[BaseException] = []
+
+    def embed(item):
+        if isinstance(item, _Batch) and item.new_chunks:
+            item.vectors = embed_chunks(vectorstore, item.new_chunks)
+        return item
+
+    def write(item) -> None:
+        if isinstance(item, SourceSync):
+            # Every batch of the source is written, so its stale chunks can go
+            result = item.finish()
+            stats.deleted_chunks += result.deleted_chunks
+            manifest.save()
+            return
+        store_chunks(vectorstore, item.chunks, item.new_chunks, item.ids, item.vectors, lexical_index, chunk_store)
+        item.source.checkpoint(item.pages, item.next_page, len(item.new_chunks))
+
+    def dispatch(source: SourceSync, batch) -> None:
+        if batch is None:
+            return
+        chunks, pages, next_page = batch
+        with timed(INGEST_SECONDS, stage="dedupe"):
+            new_chunks, ids = filter_new_chunks(vectorstore, chunks)
+        stats.skipped_chunks += len(chunks) - len(new_chunks)
+        stats.chunks += len(new_chunks)
+        count(INGEST_ITEMS, len(chunks) - len(new_chunks), kind="skipped_chunks")
+        embed_queue.put(_Batch(source, chunks, new_chunks, ids, pages, next_page))
+
+    def failed(path: str, error: str) -> None:
+        stats.errors[path] = error
+        count(INGEST_ITEMS, kind="failed_files")
+
+    embedder = writer = None
+    sources: Dict[str, SourceSync] = {}
+    futures: Dict[Future, str] = {}
+    with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=workers) as pool:
+        # A few pages per worker are enough to keep the embedder busy
+        pages: queue.Queue = manager.Queue(maxsize=4 * workers)
+        stop = manager.Event()
+        try:
+            for path in paths:
+                try:
+                    source = SourceSync(
+                        vectorstore, path, manifest, batch_size, lexical_index, chunk_store, jobs,
+                        chunk_size, chunk_overlap,
+                    )
+                except Exception as e:
+                    failed(path, str(e))
+                    continue
+                if source.unchanged:
+                    stats.unchanged += 1
+                    continue
+                sources[path] = source
+                futures[pool.submit(_split_pdf, path, source.page_plan(), pages, stop)] = path
+
+            # With the fork start method the pool forks all its workers on the first submit, so the
+            # manager and workers exist before the stage threads do
+            embedder = _stage(embed, embed_queue, write_queue, errors)
+            writer = _stage(write, write_queue, None, errors)
+            while sources and not errors:
+                try:
+                    kind, path, payload = pages.get(timeout=0.5)
+                except queue.Empty:
+                    # A worker that died cannot report, but its future (or every future of a broken pool) fails
+                    for future, path in futures.items():
+                        if path in sources and future.done() and future.exception() is not None:
+                            sources.pop(path).fail(str(future.exception()))
+                            failed(path, str(future.exception()))
+                    continue
+                source = sources[path]
+                if kind == "page":
+                    dispatch(source, source.add_page(*payload))
+                    continue
+                del sources[path]
+                if kind == "failed":
+                    source.fail(payload)
+                    failed(path, payload)
+                    continue
+                for stage, seconds in payload.items():
+                    observe_stage(stage, seconds)
+                dispatch(source, source.take_batch())
+                embed_queue.put(source)
+                stats.files += 1
+                stats.pages += source.result.pages
+                count(INGEST_ITEMS, kind="files")
+                count(INGEST_ITEMS, source.result.pages, kind="pages")
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+            # Workers blocked on a full queue stop once they can put their next page
+            while not all(future.done() for future in futures):
+                try:
+                    pages.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            if embedder is not None:
+                embed_queue.put(_DONE)
+                embedder.join()
+                writer.join()
+
+    if errors:
+        raise errors[0]
+    for result in remove_missing_sources(inputs, paths, vectorstore, manifest, lexical_index, chunk_store):
+        stats.removed += 1
+        stats.deleted_chunks += result.deleted_chunks
+
+    stats.elapsed = time.perf_counter() - start
+    return stats
@@ -0,0 +1,165 @@
+"""Resumable ingest jobs recorded in SQLite.
+
+Syncing a PDF runs as a job. Every time a batch of chunks has been written,
+the job records, in one transaction, how many pages it has consumed and the
+hash and chunk IDs of each completed page. A job restarted after a crash
+resumes at the first page of its first unfinished batch: earlier pages are
+read past without being split, embedded or written again, and their manifest
+entries come from the job.
+
+A job is identified by the source, its SHA-256 and the chunking settings. If
+the file changed before an interrupted job was resumed, the old job is
+abandoned and its pages are handed to the new one, so their chunks are reused
+or deleted like those of a previous manifest entry.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_JOBS_FILE = "jobs.sqlite3"
+
+
+class IngestJob:
+    """Progress of one source's ingest, checkpointed after every written batch."""
+
+    def __init__(
+        self,
+        store: "JobStore",
+        job_id: int,
+        source: str,
+        next_page: int = 0,
+        pages: Optional[Dict[str, Dict]] = None,
+        abandoned: Optional[Dict[str, Dict]] = None,
+    ):
+        self.store = store
+        self.id = job_id
+        self.source = source
+        self.next_page = next_page
+        """Pages consumed by the last checkpoint; a resumed job skips them."""
+        self.pages: Dict[str, Dict] = pages or {}
+        """Manifest entries of the pages written before the last checkpoint."""
+        self.abandoned: Dict[str, Dict] = abandoned or {}
+        """Pages written by an interrupted job for an earlier version of the file."""
+
+    @property
+    def resumed(self) -> bool:
+        return self.next_page > 0
+
+    def checkpoint(self, pages: Dict[str, Dict], next_page: int, chunks: int) -> None:
+        """Record that every page before ``next_page`` is written, with its manifest entry."""
+        new = {key: page for key, page in pages.items() if key not in self.pages}
+        self.store._checkpoint(self.id, new, next_page, chunks)
+        self.pages.update(new)
+        self.next_page = next_page
+
+    def finish(self) -> None:
+        """Mark the job done once the manifest holds its pages."""
+        self.store._finish(self.id, "done")
+
+    def fail(self, error: str) -> None:
+        """Keep the job's progress for the next attempt and record why this one stopped."""
+        self.store._finish(self.id, "failed", error)
+
+
+class JobStore:
+    """SQLite table of ingest jobs and the pages each has written."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " source TEXT NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " chunking TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " next_page INTEGER NOT NULL DEFAULT 0,"
+            " batches INTEGER NOT NULL DEFAULT 0,"
+            " chunks INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " started REAL NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_source ON jobs (source, status)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_pages ("
+            " job INTEGER NOT NULL,"
+            " page TEXT NOT NULL,"
+            " entry TEXT NOT NULL,"
+            " PRIMARY KEY (job, page))"
+        )
+        self._conn.commit()
+
+    def _pages(self, job_id: int) -> Dict[str, Dict]:
+        rows = self._conn.execute("SELECT page, entry FROM job_pages WHERE job = ?", (job_id,)).fetchall()
+        return {page: json.loads(entry) for page, entry in rows}
+
+    def start(self, source: str, sha256: str, chunking: str) -> IngestJob:
+        """Resume the unfinished job for this version of ``source``, or start a new one."""
+        now = time.time()
+        with self._lock, self._conn:
+            unfinished = self._conn.execute(
+                "SELECT id, sha256, chunking, next_page FROM jobs "
+                "WHERE source = ? AND status IN ('running', 'failed') ORDER BY id DESC",
+                (source,),
+            ).fetchall()
+            abandoned: Dict[str, Dict] = {}
+            for job_id, job_sha256, job_chunking, next_page in unfinished:
+                if job_sha256 == sha256 and job_chunking == chunking:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', error = NULL, updated = ? WHERE id = ?", (now, job_id)
+                    )
+                    return IngestJob(self, job_id, source, next_page, self._pages(job_id), abandoned)
+                abandoned.update(self._pages(job_id))
+                self._conn.execute("UPDATE jobs SET status = 'abandoned', updated = ? WHERE id = ?", (now, job_id))
+                self._conn.execute("DELETE FROM job_pages WHERE job = ?", (job_id,))
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (source, sha256, chunking, status, started, updated) VALUES (?, ?, ?, 'running', ?, ?)",
+                (source, sha256, chunking, now, now),
+            )
+            return IngestJob(self, cursor.lastrowid, source, abandoned=abandoned)
+
+    def _checkpoint(self, job_id: int, pages: Dict[str, Dict], next_page: int, chunks: int) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO job_pages (job, page, entry) VALUES (?, ?, ?)",
+                [(job_id, key, json.dumps(page)) for key, page in pages.items()],
+            )
+            self._conn.execute(
+                "UPDATE jobs SET next_page = ?, batches = batches + 1, chunks = chunks + ?, updated = ? WHERE id = ?",
+                (next_page, chunks, time.time(), job_id),
+            )
+
+    def _finish(self, job_id: int, status: str, error: Optional[str] = None) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?", (status, error, time.time(), job_id)
+            )
+            if status == "done":
+                # The manifest now holds the pages
+                self._conn.execute("DELETE FROM job_pages WHERE job = ?", (job_id,))
+
+    def jobs(self, unfinished: bool = False, limit: int = 50) -> List[Dict]:
+        """Return the most recent jobs, newest first."""
+        where = "WHERE status IN ('running', 'failed')" if unfinished else ""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, source, status, next_page, batches, chunks, error, started, updated "
+                f"FROM jobs {where} ORDER BY id DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        keys = ("id", "source", "status", "next_page", "batches", "chunks", "error", "started", "updated")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
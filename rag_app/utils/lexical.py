@@ -0,0 +1,299 @@
+"""BM25 inverted index for lexical and hybrid retrieval."""
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .chunkstore import DEFAULT_COMPACT_FRACTION
+from .filters import MetadataIndex
+
+DEFAULT_INDEX_FILE = "lexical_index.npz"
+RRF_K = 60
+
+# Keep part numbers and versions such as "x-200" or "v2.1" as single tokens
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase ``text`` and split it into word, acronym and part-number tokens."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class LexicalIndex:
+    """Incrementally maintained BM25 index over chunk IDs.
+
+    Postings are kept per term as two parallel ``array`` objects (document
+    ordinals and term frequencies), so memory stays close to 6 bytes per
+    posting. The index is saved as a single ``.npz`` file in CSR layout.
+    The ``source`` and ``page`` of every chunk are kept in a metadata index
+    so searches can be restricted to them. Removed chunks are only masked
+    until ``compact`` rebuilds the postings without them.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_lengths = array("I")
+        self._ordinals: Dict[str, int] = {}
+        self._terms: Dict[str, int] = {}
+        self._postings_docs: List[array] = []
+        self._postings_tfs: List[array] = []
+        self._total_length = 0
+        # Ordinals of removed chunks; their postings stay until the index is rebuilt
+        self._removed: set = set()
+        # Boolean mask of self._removed by ordinal, rebuilt lazily after adds and removals
+        self._removed_mask: Optional[np.ndarray] = None
+        # None for indexes saved before chunk metadata was kept
+        self.metadata: Optional[MetadataIndex] = MetadataIndex()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.doc_ids) - len(self._removed)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._ordinals
+
+    def add(self, chunk_id: str, text: str, metadata: Optional[Dict[str, Any]] = None) -> bool:
+        """Index one chunk and its ``source`` and ``page``. Returns False if it was already indexed."""
+        with self._lock:
+            if chunk_id in self._ordinals:
+                return False
+            tokens = tokenize(text)
+            ordinal = len(self.doc_ids)
+            self._ordinals[chunk_id] = ordinal
+            self.doc_ids.append(chunk_id)
+            self._removed_mask = None
+            if self.metadata is not None:
+                self.metadata.add(metadata)
+            self.doc_lengths.append(len(tokens))
+            self._total_length += len(tokens)
+
+            for term, tf in Counter(tokens).items():
+                term_id = self._terms.get(term)
+                if term_id is None:
+                    term_id = self._terms[term] = len(self._postings_docs)
+                    self._postings_docs.append(array("I"))
+                    self._postings_tfs.append(array("H"))
+                self._postings_docs[term_id].append(ordinal)
+                self._postings_tfs[term_id].append(min(tf, 0xFFFF))
+            return True
+
+    def add_many(self, items: Iterable[Tuple]) -> int:
+        """Index ``(chunk_id, text)`` or ``(chunk_id, text, metadata)`` tuples and return how many were new."""
+        return sum(self.add(*item) for item in items)
+
+    def remove(self, chunk_ids: Iterable[str]) -> int:
+        """Stop returning the given chunks and return how many were indexed."""
+        removed = 0
+        with self._lock:
+            for chunk_id in chunk_ids:
+                ordinal = self._ordinals.pop(chunk_id, None)
+                if ordinal is None:
+                    continue
+                self._removed.add(ordinal)
+                self._total_length -= self.doc_lengths[ordinal]
+                removed += 1
+            if removed:
+                self._removed_mask = None
+        return removed
+
+    def compact(self, min_fraction: float = 0.0) -> int:
+        """Rebuild the postings without removed chunks if at least ``min_fraction`` of them are removed.
+
+        Returns the number of chunks dropped.
+        """
+        with self._lock:
+            total, dead = len(self.doc_ids), len(self._removed)
+            if not dead or dead < min_fraction * total:
+                return 0
+            live = np.flatnonzero(~self._removed_rows())
+            renumbered = np.zeros(total, dtype=np.uint32)
+            renumbered[live] = np.arange(len(live), dtype=np.uint32)
+            terms: Dict[str, int] = {}
+            postings_docs: List[array] = []
+            postings_tfs: List[array] = []
+            for term, term_id in self._terms.items():
+                docs, tfs = self._live_postings(term_id)
+                if len(docs):
+                    terms[term] = len(postings_docs)
+                    postings_docs.append(array("I", renumbered[docs].tobytes()))
+                    postings_tfs.append(array("H", tfs.tobytes()))
+            self.doc_ids = [self.doc_ids[i] for i in live.tolist()]
+            self.doc_lengths = array("I", np.frombuffer(self.doc_lengths, dtype=np.uint32)[live].tobytes())
+            self._ordinals = {chunk_id: i for i, chunk_id in enumerate(self.doc_ids)}
+            self._terms, self._postings_docs, self._postings_tfs = terms, postings_docs, postings_tfs
+            if self.metadata is not None:
+                self.metadata = self.metadata.select(live)
+            self._removed = set()
+            self._removed_mask = None
+            return dead
+
+    def _removed_rows(self) -> np.ndarray:
+        """Return a boolean mask of the removed ordinals. Callers must hold the lock."""
+        if self._removed_mask is None:
+            mask = np.zeros(len(self.doc_ids), dtype=bool)
+            if self._removed:
+                mask[np.fromiter(self._removed, dtype=np.int64)] = True
+            self._removed_mask = mask
+        return self._removed_mask
+
+    def _live_postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the ordinals and term frequencies of a term's chunks that were not removed.
+
+        Callers must hold the lock and drop the returned arrays before the
+        postings grow.
+        """
+        docs = np.frombuffer(self._postings_docs[term_id], dtype=np.uint32)
+        tfs = np.frombuffer(self._postings_tfs[term_id], dtype=np.uint16)
+        if self._removed:
+            live = ~self._removed_rows()[docs]
+            docs, tfs = docs[live], tfs[live]
+        return docs, tfs
+
+    def _idf(self, df: int) -> float:
+        n = len(self)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def idf(self, term: str) -> float:
+        """Return the BM25 inverse document frequency of ``term`` over the chunks that were not removed."""
+        with self._lock:
+            term_id = self._terms.get(term)
+            return self._idf(len(self._live_postings(term_id)[0]) if term_id is not None else 0)
+
+    def _scores(self, query: str) -> np.ndarray:
+        """Return BM25 scores of every indexed chunk. Callers must hold the lock.
+
+        The NumPy views over the postings arrays must not outlive this call,
+        because an ``array`` cannot grow while a buffer export is alive.
+        """
+        n = len(self.doc_ids)
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)
+        avg_length = self._total_length / max(len(self), 1)
+        scores = np.zeros(n, dtype=np.float32)
+
+        for term in set(tokenize(query)):
+            term_id = self._terms.get(term)
+            if term_id is None:
+                continue
+            # Removed chunks count neither towards document frequencies nor scores
+            docs, tfs = self._live_postings(term_id)
+            if not len(docs):
+                continue
+            tfs = tfs.astype(np.float32)
+            norm = self.k1 * (1.0 - self.b + self.b * lengths[docs] / avg_length)
+            scores[docs] += self._idf(len(docs)) * tfs * (self.k1 + 1.0) / (tfs + norm)
+        return scores
+
+    def search(self, query: str, k: int = 3, filter: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """Return the ``k`` best ``(chunk_id, score)`` pairs for ``query``.
+
+        ``filter`` is a ``where`` filter on ``source`` and ``page``; chunks
+        outside it are zeroed before the top ``k`` are selected.
+        """
+        with self._lock:
+            if not len(self):
+                return []
+            scores = self._scores(query)
+            if filter:
+                if self.metadata is None:
+                    raise ValueError("This BM25 index was saved without chunk metadata; rebuild it to filter")
+                scores[~self.metadata.mask(filter)] = 0.0
+            doc_ids = self.doc_ids
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        top = matched[np.argsort(-scores[matched], kind="stable")[:k]]
+        return [(doc_ids[i], float(scores[i])) for i in top]
+
+    def save(self, path: str, compact_fraction: float = DEFAULT_COMPACT_FRACTION) -> None:
+        """Write the index to ``path`` atomically, compacting it first once ``compact_fraction`` of it is removed."""
+        with self._lock:
+            self.compact(compact_fraction)
+            terms = list(self._terms)
+            counts = [len(self._postings_docs[self._terms[t]]) for t in terms]
+            offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            docs = np.concatenate(
+                [np.frombuffer(self._postings_docs[self._terms[t]], dtype=np.uint32) for t in terms]
+                or [np.zeros(0, dtype=np.uint32)]
+            )
+            tfs = np.concatenate(
+                [np.frombuffer(self._postings_tfs[self._terms[t]], dtype=np.uint16) for t in terms]
+                or [np.zeros(0, dtype=np.uint16)]
+            )
+            # Stored as UTF-8 bytes, which is 4x smaller than NumPy's unicode dtype
+            doc_ids = np.array([i.encode("utf-8") for i in self.doc_ids], dtype=bytes)
+            doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32).copy()
+            removed = np.array(sorted(self._removed), dtype=np.int64)
+            metadata = self.metadata.to_arrays() if self.metadata is not None else {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            terms=np.array([t.encode("utf-8") for t in terms], dtype=bytes),
+            offsets=offsets,
+            docs=docs,
+            tfs=tfs,
+            doc_ids=doc_ids,
+            doc_lengths=doc_lengths,
+            removed=removed,
+            params=np.array([self.k1, self.b]),
+            **metadata,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        """Load an index written by ``save``."""
+        with np.load(path, allow_pickle=False) as data:
+            k1, b = data["params"].tolist()
+            index = cls(k1=k1, b=b)
+            index.doc_ids = [i.decode("utf-8") for i in data["doc_ids"].tolist()]
+            index.doc_lengths = array("I", data["doc_lengths"].astype(np.uint32).tobytes())
+            # Indexes saved before chunks could be removed have no "removed" array
+            if "removed" in data.files:
+                index._removed = set(data["removed"].tolist())
+            index.metadata = MetadataIndex.from_arrays(data) if "meta_pages" in data.files else None
+            index._ordinals = {
+                chunk_id: i for i, chunk_id in enumerate(index.doc_ids) if i not in index._removed
+            }
+            index._total_length = sum(index.doc_lengths[i] for i in index._ordinals.values())
+            offsets = data["offsets"]
+            docs = data["docs"].astype(np.uint32)
+            tfs = data["tfs"].astype(np.uint16)
+            for term_id, term in enumerate(t.decode("utf-8") for t in data["terms"].tolist()):
+                start, end = offsets[term_id], offsets[term_id + 1]
+                index._terms[term] = term_id
+                index._postings_docs.append(array("I", docs[start:end].tobytes()))
+                index._postings_tfs.append(array("H", tfs[start:end].tobytes()))
+        return index
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[str]:
+    """Fuse several ranked lists of IDs with reciprocal rank fusion."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)
+
+
+def is_confident(results: Sequence[Tuple[str, float]], margin: float = 2.0, min_score: float = 0.0) -> bool:
+    """Return True if the best lexical hit scores at least ``min_score`` and clearly beats the runner-up.
+
+    A single hit is never decisive: one match on a rare word says nothing
+    about how the rest of the corpus compares.
+    """
+    if len(results) < 2:
+        return False
+    return results[0][1] >= min_score and results[0][1] >= margin * results[1][1]
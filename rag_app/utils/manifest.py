@@ -0,0 +1,425 @@
+"""Document manifest for incremental re-indexing.
+
+The manifest records, for every ingested source, the file's size,
+modification time and SHA-256, the hash of each page's text and the IDs of
+the chunks each page produced. Syncing a source compares it with its entry:
+unchanged files are skipped without being read, unchanged pages keep their
+chunks, and chunks of changed or removed pages are deleted.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from .chunkstore import ChunkStore
+from .embeddings import text_hash
+from .jobs import JobStore
+from .lexical import LexicalIndex
+from .tools import (
+    DEFAULT_BATCH_SIZE,
+    add_new_chunks,
+    chunk_id,
+    delete_chunks,
+    expand_inputs,
+    get_chunker,
+    index_missing_chunks,
+    iter_pdf_pages,
+    split_documents,
+)
+
+DEFAULT_MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str) -> str:
+    """Return the hex SHA-256 of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunking_signature(chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None) -> str:
+    """Describe the chunker configuration; chunks made with another one are not reused."""
+    chunker = get_chunker(chunk_size, chunk_overlap)
+    mode = "tokens" if chunker.token_offsets is not None else "chars"
+    return f"{mode}:{chunker.chunk_size}:{chunker.chunk_overlap}"
+
+
+class Manifest:
+    """JSON file mapping each source to its file hash, page hashes and chunk IDs."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sources: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self._sources = data.get("sources", {})
+
+    def get(self, source: str) -> Optional[Dict]:
+        return self._sources.get(source)
+
+    def set(self, source: str, entry: Dict) -> None:
+        with self._lock:
+            self._sources[source] = entry
+
+    def remove(self, source: str) -> Optional[Dict]:
+        with self._lock:
+            return self._sources.pop(source, None)
+
+    def sources(self) -> List[str]:
+        return list(self._sources)
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    def save(self) -> None:
+        """Write the manifest atomically."""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            data = {"version": MANIFEST_VERSION, "sources": self._sources}
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".json")
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+
+@dataclass
+class SyncResult:
+    """What syncing one source changed."""
+
+    source: str
+    status: str  # "unchanged", "added", "updated", "removed" or "failed"
+    pages: int = 0
+    changed_pages: int = 0
+    resumed_pages: int = 0
+    added_chunks: int = 0
+    deleted_chunks: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class SyncStats:
+    """Totals of a directory sync."""
+
+    results: List[SyncResult] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def count(self, status: str) -> int:
+        return sum(1 for result in self.results if result.status == status)
+
+    def summary(self) -> str:
+        """Return a one-line human readable summary."""
+        added = sum(result.added_chunks for result in self.results)
+        deleted = sum(result.deleted_chunks for result in self.results)
+        changed_pages = sum(result.changed_pages for result in self.results)
+        return (
+            f"Synced {len(self.results)} sources in {self.elapsed:.2f}s: {self.count('added')} added, "
+            f"{self.count('updated')} updated, {self.count('unchanged')} unchanged, "
+            f"{self.count('removed')} removed, {self.count('failed')} failed; "
+            f"{changed_pages} changed pages, {added} chunks added, {deleted} chunks deleted"
+        )
+
+
+def iter_page_chunks(
+    pdf_path: str,
+    resume_from: int = 0,
+    resumed: Iterable[str] = (),
+    known: Optional[Dict[str, str]] = None,
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = None,
+    timings: Optional[Dict[str, float]] = None,
+) -> Iterator[Tuple[str, Optional[str], Optional[List[Document]]]]:
+    """Read a PDF page by page and yield ``(page key, text hash, chunks)``, splitting only pages that need it.
+
+    Pages before ``resume_from`` whose key is in ``resumed`` were written by
+    an interrupted job and are read past without a hash. Pages whose hash
+    matches ``known`` keep their chunks and yield none. Parse and split times
+    are added to ``timings``, which lets a worker process report them.
+    """
+    resumed = set(resumed)
+    known = known or {}
+    timings = timings if timings is not None else {}
+    pages = iter_pdf_pages(pdf_path)
+    number = 0
+    while True:
+        start = time.perf_counter()
+        page = next(pages, None)
+        parsed = time.perf_counter()
+        timings["parse"] = timings.get("parse", 0.0) + parsed - start
+        if page is None:
+            return
+        number += 1
+        key = str(page.metadata.get("page", number - 1))
+        if number <= resume_from and key in resumed:
+            yield key, None, None
+            continue
+        page_hash = text_hash(page.page_content)
+        if known.get(key) == page_hash:
+            yield key, page_hash, None
+            continue
+        chunks = split_documents([page], chunk_size, chunk_overlap)
+        timings["split"] = timings.get("split", 0.0) + time.perf_counter() - parsed
+        yield key, page_hash, chunks
+
+
+class SourceSync:
+    """Sync of one PDF, fed its pages in order by ``sync_pdf`` or by the ``ingest_paths`` pipeline.
+
+    Creating it compares the file with its manifest entry and, unless it is
+    unchanged, starts or resumes its ingest job. Pages are then added with
+    ``add_page``; it returns a batch of chunks to write whenever
+    ``batch_size`` of them are pending, and ``checkpoint`` is called once a
+    batch is written. ``finish`` deletes the chunks of changed or removed
+    pages and records the source in the manifest.
+    """
+
+    def __init__(
+        self,
+        vectorstore,
+        pdf_path: str,
+        manifest: Manifest,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        lexical_index: Optional[LexicalIndex] = None,
+        chunk_store: Optional[ChunkStore] = None,
+        jobs: Optional[JobStore] = None,
+        chunk_size: Optional[int] = None,
+        chunk_overlap: Optional[int] = None,
+    ):
+        self.vectorstore = vectorstore
+        self.manifest = manifest
+        self.batch_size = batch_size
+        self.lexical_index = lexical_index
+        self.chunk_store = chunk_store
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.job = None
+        self.pages: Dict[str, Dict] = {}
+        self.pending: List[Document] = []
+
+        self.entry = manifest.get(pdf_path)
+        self.stat = os.stat(pdf_path)
+        self.signature = chunking_signature(chunk_size, chunk_overlap)
+        entry = self.entry
+        if entry and entry.get("chunking") == self.signature:
+            if entry["size"] == self.stat.st_size and entry["mtime_ns"] == self.stat.st_mtime_ns:
+                self.result = SyncResult(pdf_path, "unchanged", pages=len(entry["pages"]))
+                return
+            self.sha256 = file_sha256(pdf_path)
+            if entry["sha256"] == self.sha256:
+                # Touched but not modified: remember the new timestamp and skip
+                manifest.set(pdf_path, {**entry, "size": self.stat.st_size, "mtime_ns": self.stat.st_mtime_ns})
+                self.result = SyncResult(pdf_path, "unchanged", pages=len(entry["pages"]))
+                return
+            old_pages = entry["pages"]
+        else:
+            # New source, or chunked with other settings so none of its chunks can be reused
+            self.sha256 = file_sha256(pdf_path)
+            old_pages = {}
+
+        self.result = SyncResult(pdf_path, "updated" if entry else "added")
+        self.job = job = jobs.start(pdf_path, self.sha256, self.signature) if jobs is not None else None
+        # Pages an interrupted job wrote for an earlier version of the file are reused or deleted like old pages
+        self.written = {**job.abandoned, **old_pages} if job is not None else old_pages
+        if job is not None and lexical_index is not None:
+            # The interrupted run may have stopped before saving the BM25 index
+            interrupted = [*job.pages.values(), *job.abandoned.values()]
+            index_missing_chunks(vectorstore, [i for page in interrupted for i in page["chunks"]], lexical_index)
+
+    @property
+    def unchanged(self) -> bool:
+        return self.result.status == "unchanged"
+
+    def page_plan(self) -> Dict[str, Any]:
+        """Return the ``iter_page_chunks`` arguments that skip resumed and unchanged pages."""
+        return {
+            "resume_from": self.job.next_page if self.job is not None else 0,
+            "resumed": list(self.job.pages) if self.job is not None else [],
+            "known": {key: page["sha256"] for key, page in self.written.items()},
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+        }
+
+    def add_page(
+        self, key: str, page_hash: Optional[str], chunks: Optional[List[Document]]
+    ) -> Optional[Tuple[List[Document], Dict[str, Dict], int]]:
+        """Record one page from ``iter_page_chunks`` and return a batch to write if one is full."""
+        self.result.pages += 1
+        if page_hash is None:
+            # Written before the job was interrupted
+            self.pages[key] = self.job.pages[key]
+            self.result.resumed_pages += 1
+            return None
+        if chunks is None:
+            self.pages[key] = self.written[key]
+            return None
+        self.result.changed_pages += 1
+        self.pages[key] = {"sha256": page_hash, "chunks": list(dict.fromkeys(chunk_id(c) for c in chunks))}
+        self.pending.extend(chunks)
+        return self.take_batch() if len(self.pending) >= self.batch_size else None
+
+    def take_batch(self) -> Optional[Tuple[List[Document], Dict[str, Dict], int]]:
+        """Return the pending chunks with the page entries and page count to checkpoint once they are written."""
+        if not self.pending:
+            return None
+        batch, self.pending = self.pending, []
+        return batch, dict(self.pages), self.result.pages
+
+    def write(self, chunks: List[Document], pages: Dict[str, Dict], next_page: int) -> None:
+        """Embed and write a batch, then checkpoint it."""
+        added = add_new_chunks(self.vectorstore, chunks, self.lexical_index, self.chunk_store)
+        self.checkpoint(pages, next_page, added)
+
+    def checkpoint(self, pages: Dict[str, Dict], next_page: int, added: int) -> None:
+        """Record that a batch taken with ``take_batch`` is written."""
+        self.result.added_chunks += added
+        if self.job is not None:
+            self.job.checkpoint(pages, next_page, added)
+
+    def finish(self) -> SyncResult:
+        """Delete chunks no page produces any more and record the source in the manifest.
+
+        New chunks are written before stale ones are deleted, so an
+        interrupted sync never leaves a page without chunks.
+        """
+        entry, job = self.entry, self.job
+        if entry or (job is not None and job.abandoned):
+            current = {i for page in self.pages.values() for i in page["chunks"]}
+            earlier = [*(entry["pages"].values() if entry else ()), *(job.abandoned.values() if job else ())]
+            stale = [i for page in earlier for i in page["chunks"] if i not in current]
+            self.result.deleted_chunks = delete_chunks(
+                self.vectorstore, list(dict.fromkeys(stale)), self.lexical_index, self.chunk_store
+            )
+
+        self.manifest.set(self.result.source, {
+            "sha256": self.sha256,
+            "size": self.stat.st_size,
+            "mtime_ns": self.stat.st_mtime_ns,
+            "chunking": self.signature,
+            "pages": self.pages,
+        })
+        if job is not None:
+            # The job's pages are dropped once the manifest on disk has them
+            self.manifest.save()
+            job.finish()
+        return self.result
+
+    def fail(self, error: str) -> None:
+        """Keep the job's progress for the next attempt."""
+        if self.job is not None:
+            self.job.fail(error)
+
+
+def sync_pdf(
+    vectorstore,
+    pdf_path: str,
+    manifest: Manifest,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    lexical_index: Optional[LexicalIndex] = None,
+    chunk_store: Optional[ChunkStore] = None,
+    jobs: Optional[JobStore] = None,
+) -> SyncResult:
+    """Bring the chunks of one PDF in line with its current content.
+
+    New chunks are written before stale ones are deleted, so an interrupted
+    sync never leaves a page without chunks. With a job store, progress is
+    checkpointed after every batch and an interrupted sync of the same file
+    resumes after the last batch it wrote.
+    """
+    source = SourceSync(vectorstore, pdf_path, manifest, batch_size, lexical_index, chunk_store, jobs)
+    if source.unchanged:
+        return source.result
+    try:
+        for key, page_hash, chunks in iter_page_chunks(pdf_path, **source.page_plan()):
+            batch = source.add_page(key, page_hash, chunks)
+            if batch is not None:
+                source.write(*batch)
+        batch = source.take_batch()
+        if batch is not None:
+            source.write(*batch)
+        return source.finish()
+    except BaseException as e:
+        source.fail(f"{type(e).__name__}: {e}")
+        raise
+
+
+def remove_source(
+    vectorstore,
+    source: str,
+    manifest: Manifest,
+    lexical_index: Optional[LexicalIndex] = None,
+    chunk_store: Optional[ChunkStore] = None,
+) -> SyncResult:
+    """Delete every chunk of a source and drop it from the manifest."""
+    entry = manifest.remove(source) or {"pages": {}}
+    ids = list(dict.fromkeys(i for page in entry["pages"].values() for i in page["chunks"]))
+    return SyncResult(source, "removed", deleted_chunks=delete_chunks(vectorstore, ids, lexical_index, chunk_store))
+
+
+def _within(path: str, directories: List[str]) -> bool:
+    path = os.path.abspath(path)
+    return any(os.path.commonpath([path, directory]) == directory for directory in directories)
+
+
+def remove_missing_sources(
+    inputs: List[str],
+    paths: List[str],
+    vectorstore,
+    manifest: Manifest,
+    lexical_index: Optional[LexicalIndex] = None,
+    chunk_store: Optional[ChunkStore] = None,
+) -> List[SyncResult]:
+    """Remove sources that were under an input directory but no longer exist, and save the manifest."""
+    directories = [os.path.abspath(item) for item in inputs if os.path.isdir(item)]
+    if not directories:
+        return []
+    present = set(paths)
+    results = [
+        remove_source(vectorstore, source, manifest, lexical_index, chunk_store)
+        for source in manifest.sources()
+        if source not in present and _within(source, directories) and not os.path.exists(source)
+    ]
+    manifest.save()
+    return results
+
+
+def sync_paths(
+    inputs: Iterable[str],
+    vectorstore,
+    manifest: Manifest,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    lexical_index: Optional[LexicalIndex] = None,
+    chunk_store: Optional[ChunkStore] = None,
+    jobs: Optional[JobStore] = None,
+) -> SyncStats:
+    """Sync every PDF under the inputs and remove sources that disappeared from input directories.
+
+    Unchanged files cost one ``stat`` call, so the run time is proportional
+    to what changed rather than to the size of the collection.
+    """
+    inputs = list(inputs)
+    stats = SyncStats()
+    start = time.perf_counter()
+
+    paths = expand_inputs(inputs)
+    for path in paths:
+        try:
+            stats.results.append(sync_pdf(vectorstore, path, manifest, batch_size, lexical_index, chunk_store, jobs))
+        except Exception as e:
+            print(f"Error syncing {path}: {e}")
+            stats.results.append(SyncResult(path, "failed", error=str(e)))
+        manifest.save()
+    stats.results.extend(remove_missing_sources(inputs, paths, vectorstore, manifest, lexical_index, chunk_store))
+
+    stats.elapsed = time.perf_counter() - start
+    return stats
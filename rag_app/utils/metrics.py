@@ -0,0 +1,308 @@
+"""Low-overhead latency histograms and counters with Prometheus and JSON export."""
+import asyncio
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from 0.1 ms to 60 s
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+ENABLED = os.getenv("RAG_METRICS", "1").lower() not in ("0", "false", "no")
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Fixed-bucket histogram. Quantiles are interpolated within buckets."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Estimate the ``q`` quantile by linear interpolation inside its bucket."""
+        with self._lock:
+            counts, total, largest = list(self.counts), self.count, self.max
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else largest
+                return min(lower + (upper - lower) * (rank - seen) / count, largest)
+            seen += count
+        return largest
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.sum = 0.0
+            self.count = 0
+            self.max = 0.0
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Counter:
+    """Monotonically increasing counter."""
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def reset(self) -> None:
+        with self._lock:
+            self.value = 0.0
+
+
+class MetricFamily:
+    """A named metric with one child per combination of label values."""
+
+    def __init__(self, name: str, help: str, kind: str, buckets: Optional[Sequence[float]] = None):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.buckets = buckets
+        self._children: Dict[LabelKey, Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels: str):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = Histogram(self.buckets) if self.kind == "histogram" else Counter()
+                    self._children[key] = child
+        return child
+
+    def children(self) -> List[Tuple[LabelKey, Any]]:
+        with self._lock:
+            return sorted(self._children.items())
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class MetricsRegistry:
+    """Collection of metric families that can be rendered as Prometheus text or JSON."""
+
+    def __init__(self):
+        self._families: Dict[str, MetricFamily] = {}
+        self._lock = threading.Lock()
+
+    def _family(self, name: str, help: str, kind: str, buckets=None) -> MetricFamily:
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = MetricFamily(name, help, kind, buckets)
+            return family
+
+    def counter(self, name: str, help: str) -> MetricFamily:
+        return self._family(name, help, "counter")
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> MetricFamily:
+        return self._family(name, help, "histogram", buckets)
+
+    def reset(self) -> None:
+        """Zero every recorded value but keep the metric definitions."""
+        with self._lock:
+            families = list(self._families.values())
+        for family in families:
+            for _, child in family.children():
+                child.reset()
+
+    def to_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            families = sorted(self._families.values(), key=lambda f: f.name)
+        for family in families:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for key, child in family.children():
+                if family.kind == "counter":
+                    lines.append(f"{family.name}{_format_labels(key)} {_format_value(child.value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(child.buckets + (float("inf"),), child.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    lines.append(f"{family.name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+                lines.append(f"{family.name}_sum{_format_labels(key)} {_format_value(child.sum)}")
+                lines.append(f"{family.name}_count{_format_labels(key)} {child.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Return every metric with its labels, counters and p50/p95/p99 quantiles."""
+        with self._lock:
+            families = sorted(self._families.values(), key=lambda f: f.name)
+        result = {}
+        for family in families:
+            series = []
+            for key, child in family.children():
+                values = {"value": child.value} if family.kind == "counter" else child.snapshot()
+                series.append({"labels": dict(key), **values})
+            result[family.name] = series
+        return result
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+
+REGISTRY = MetricsRegistry()
+
+NODE_SECONDS = REGISTRY.histogram("rag_node_seconds", "Latency of each LangGraph node.")
+NODE_CALLS = REGISTRY.counter("rag_node_calls_total", "Number of LangGraph node executions.")
+NODE_ERRORS = REGISTRY.counter("rag_node_errors_total", "Number of LangGraph node executions that raised.")
+QUERY_STAGE_SECONDS = REGISTRY.histogram("rag_query_stage_seconds", "Latency of each step inside the query nodes.")
+INGEST_SECONDS = REGISTRY.histogram("rag_ingest_stage_seconds", "Latency of each ingest stage call.")
+INGEST_ITEMS = REGISTRY.counter("rag_ingest_items_total", "Pages and chunks processed by ingest.")
+BATCH_SIZE = REGISTRY.histogram("rag_batch_size", "Number of items per batched call.", SIZE_BUCKETS)
+RERANK_CANDIDATES = REGISTRY.counter("rag_rerank_candidates_total", "Rerank candidates scored, cached or skipped.")
+
+
+@contextmanager
+def timed(family: MetricFamily, **labels: str) -> Iterator[None]:
+    """Observe the wall time of the ``with`` block in ``family``."""
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        family.labels(**labels).observe(time.perf_counter() - start)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record one call of an ingest stage that was timed elsewhere, e.g. in a worker process."""
+    if ENABLED:
+        INGEST_SECONDS.labels(stage=stage).observe(seconds)
+
+
+def count(family: MetricFamily, amount: float = 1.0, **labels: str) -> None:
+    """Increment a counter if metrics are enabled."""
+    if ENABLED:
+        family.labels(**labels).inc(amount)
+
+
+def observe_batch(operation: str, size: int) -> None:
+    """Record the size of a batched call."""
+    if ENABLED:
+        BATCH_SIZE.labels(operation=operation).observe(size)
+
+
+def instrument_node(name: str, fn: Callable) -> Callable:
+    """Wrap a sync or async graph node so every call records its latency, call count and errors."""
+    if not ENABLED:
+        return fn
+    seconds = NODE_SECONDS.labels(node=name)
+    calls = NODE_CALLS.labels(node=name)
+    errors = NODE_ERRORS.labels(node=name)
+
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state):
+            start = time.perf_counter()
+            try:
+                return await fn(state)
+            except BaseException:
+                errors.inc()
+                raise
+            finally:
+                seconds.observe(time.perf_counter() - start)
+                calls.inc()
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(state):
+        start = time.perf_counter()
+        try:
+            return fn(state)
+        except BaseException:
+            errors.inc()
+            raise
+        finally:
+            seconds.observe(time.perf_counter() - start)
+            calls.inc()
+
+    return wrapper
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.startswith("/metrics.json"):
+            body, content_type = REGISTRY.to_json().encode("utf-8"), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, content_type = REGISTRY.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass  # Scrapes would otherwise flood the server log
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve ``/metrics`` (Prometheus text) and ``/metrics.json`` from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
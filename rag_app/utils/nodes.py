@@ -1,27 +1,327 @@
 """Node functions for the RAG graph."""
-from typing import Dict, List
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
 from langchain_core.documents import Document
-from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langgraph.config import get_stream_writer
+from .cache import LRUCache, SemanticCache, collection_version
+from .chunkstore import ChunkStore
+from .concurrency import get_query_batcher, run_in_search_pool
+from .embeddings import embed_queries
+from .filters import filter_key
+from .lexical import LexicalIndex, is_confident, reciprocal_rank_fusion
+from .metrics import QUERY_STAGE_SECONDS, observe_batch, timed
+from .tools import chunk_id
+from .settings import DEFAULT_TOP_K
 from .state import RAGState
+from .vectorstores import search_ids
 
+# Query embeddings only depend on the model, so they never go stale
+query_embedding_cache = LRUCache(
+    max_size=int(os.getenv("RAG_QUERY_CACHE_SIZE", 1024)),
+)
 
-def retrieve(state: RAGState, vectorstore: Chroma) -> RAGState:
-    """Retrieve relevant documents based on the query."""
+# Retrieval results are keyed by collection version, so ingest invalidates them
+retrieval_cache = LRUCache(
+    max_size=int(os.getenv("RAG_QUERY_CACHE_SIZE", 1024)),
+    ttl=float(os.getenv("RAG_QUERY_CACHE_TTL", 300)),
+)
+
+# How much the best BM25 hit must beat the runner-up to skip the vector search
+LEXICAL_CONFIDENCE_MARGIN = float(os.getenv("RAG_LEXICAL_CONFIDENCE_MARGIN", 2.0))
+# ... and must reach this BM25 score
+LEXICAL_MIN_SCORE = float(os.getenv("RAG_LEXICAL_MIN_SCORE", 3.0))
+
+# Paraphrased queries reuse the chunks retrieved for an earlier query (opt-in with RAG_SEMANTIC_CACHE=1)
+semantic_cache = (
+    SemanticCache(
+        capacity=int(os.getenv("RAG_SEMANTIC_CACHE_SIZE", 2048)),
+        threshold=float(os.getenv("RAG_SEMANTIC_CACHE_THRESHOLD", 0.95)),
+        ttl=float(os.getenv("RAG_SEMANTIC_CACHE_TTL", 300)),
+    )
+    if os.getenv("RAG_SEMANTIC_CACHE", "").lower() in ("1", "true", "yes")
+    else None
+)
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for cache lookups (MiniLM is uncased, so case is dropped)."""
+    return " ".join(query.lower().split())
+
+
+def _embedding_key(embeddings: Embeddings, query: str) -> tuple:
+    return (type(embeddings).__name__, getattr(embeddings, "model_name", ""), normalize_query(query))
+
+
+def embed_queries_cached(embeddings: Embeddings, queries: List[str]) -> List[List[float]]:
+    """Embed queries in one batched call, reusing cached query embeddings."""
+    keys = [_embedding_key(embeddings, query) for query in queries]
+    vectors = [query_embedding_cache.get(key) for key in keys]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        observe_batch("embed_queries", len(missing))
+        with timed(QUERY_STAGE_SECONDS, stage="embed_query"):
+            computed = embed_queries(embeddings, [queries[i] for i in missing])
+        for i, vector in zip(missing, computed):
+            query_embedding_cache.put(keys[i], vector)
+            vectors[i] = vector
+    return vectors
+
+
+async def aembed_query(embeddings: Embeddings, query: str) -> List[float]:
+    """Embed one query, batching it with queries from concurrent requests in the embedding pool."""
+    key = _embedding_key(embeddings, query)
+    vector = query_embedding_cache.get(key)
+    if vector is None:
+        vector = await get_query_batcher(embeddings).submit(query)
+        query_embedding_cache.put(key, vector)
+    return vector
+
+
+def clear_query_caches() -> None:
+    """Drop all cached query embeddings, retrieval results and semantic cache entries."""
+    query_embedding_cache.clear()
+    retrieval_cache.clear()
+    if semantic_cache is not None:
+        semantic_cache.clear()
+
+
+def query_cache_stats() -> Dict[str, Dict[str, float]]:
+    """Return hit/miss counters of the query caches."""
+    stats = {
+        "query_embeddings": query_embedding_cache.stats(),
+        "retrieval": retrieval_cache.stats(),
+    }
+    if semantic_cache is not None:
+        stats["semantic"] = semantic_cache.stats()
+    return stats
+
+
+def check_semantic_cache(state: RAGState, embeddings: Embeddings, cache: SemanticCache) -> RAGState:
+    """Reuse the chunks retrieved for a similar earlier query, so only ``generate`` runs.
+
+    Filtered queries are never answered from, or stored in, the cache.
+    """
     query = state["query"]
-    docs = vectorstore.similarity_search(query, k=3)
-    return {"query": query, "context": docs, "response": state.get("response")}
+    query_embedding = state.get("query_embedding")
+    if query_embedding is None:
+        query_embedding = embed_queries_cached(embeddings, [query])[0]
+
+    hit = cache.lookup(query_embedding) if not state.get("filter") else None
+    if hit is not None:
+        context_ids, _ = hit
+        return {"query": query, "query_embedding": query_embedding, "context_ids": list(context_ids)}
+    return {"query": query, "query_embedding": query_embedding, "started_at": time.perf_counter()}
+
+
+async def acheck_semantic_cache(state: RAGState, embeddings: Embeddings, cache: SemanticCache) -> RAGState:
+    """Async ``check_semantic_cache``: the query is embedded through the micro-batcher."""
+    if state.get("query_embedding") is None:
+        state = {**state, "query_embedding": await aembed_query(embeddings, state["query"])}
+    return check_semantic_cache(state, embeddings, cache)
+
+
+def route_semantic_cache(state: RAGState) -> str:
+    """Skip retrieval when the semantic cache produced the context."""
+    return "hit" if state.get("context_ids") is not None else "miss"
+
+
+def update_semantic_cache(state: RAGState, cache: SemanticCache) -> RAGState:
+    """Store the retrieved chunk IDs for future similar queries."""
+    if state.get("filter"):
+        return {}
+    started_at = state.get("started_at")
+    latency = time.perf_counter() - started_at if started_at is not None else None
+    cache.put(state["query_embedding"], list(state.get("context_ids") or []), latency=latency)
+    return {}
+
+
+def recall_session_context(state: RAGState, embeddings: Embeddings, threshold: float) -> RAGState:
+    """Reuse the chunk IDs of the earlier turn whose query is most similar, if it is similar enough.
+
+    Only turns asked with the same filter are considered. ``context_ids`` is
+    set to None when no earlier turn qualifies, so the query is retrieved as
+    usual.
+    """
+    query_embedding = state.get("query_embedding")
+    if query_embedding is None:
+        query_embedding = embed_queries_cached(embeddings, [state["query"]])[0]
+    key = filter_key(state.get("filter"))
+    turns = [turn for turn in state.get("session_turns") or [] if turn.get("filter") == key]
+    if turns:
+        matrix = np.asarray([turn["embedding"] for turn in turns], dtype=np.float32)
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        scores = matrix @ vector / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector) + 1e-12)
+        best = int(np.argmax(scores))
+        if scores[best] >= threshold:
+            return {"query_embedding": query_embedding, "context_ids": list(turns[best]["context_ids"])}
+    return {"query_embedding": query_embedding, "context_ids": None}
+
+
+async def arecall_session_context(state: RAGState, embeddings: Embeddings, threshold: float) -> RAGState:
+    """Async ``recall_session_context``: the query is embedded through the micro-batcher."""
+    if state.get("query_embedding") is None:
+        state = {**state, "query_embedding": await aembed_query(embeddings, state["query"])}
+    return recall_session_context(state, embeddings, threshold)
+
+
+def route_session_context(state: RAGState) -> str:
+    """Skip retrieval when an earlier turn's context was reused."""
+    return "reuse" if state.get("context_ids") is not None else "retrieve"
+
+
+def remember_session_context(state: RAGState, max_turns: int) -> RAGState:
+    """Add this turn's query embedding and chunk IDs to the session, keeping the latest ``max_turns``."""
+    turn = {
+        "query": state["query"],
+        "embedding": [float(x) for x in state["query_embedding"]],
+        "context_ids": list(state.get("context_ids") or []),
+        "filter": filter_key(state.get("filter")),
+    }
+    return {"session_turns": [*(state.get("session_turns") or []), turn][-max_turns:]}
+
 
+def _dense_search(state: RAGState, vectorstore: VectorStore, k: int) -> List[str]:
+    """Run a vector search for chunk IDs, reusing a precomputed or cached query embedding.
 
-def generate(state: RAGState) -> RAGState:
-    """Generate response using the retrieved context."""
-    context = state.get("context", [])
+    The state's ``filter`` is evaluated inside the vector index, so the
+    search returns the ``k`` nearest matching chunks.
+    """
     query = state["query"]
-    
-    # Format context for prompt
-    context_text = "\n".join([doc.page_content for doc in context])
-    
-    # Create a detailed response based on the context
-    response = f"Based on the retrieved documents related to '{query}':\n\n"
+    query_embedding = state.get("query_embedding")
+    embeddings = vectorstore.embeddings
+    if query_embedding is None and embeddings is not None:
+        query_embedding = embed_queries_cached(embeddings, [query])[0]
+
+    with timed(QUERY_STAGE_SECONDS, stage="vector_search"):
+        if query_embedding is not None:
+            return [i for i, _ in search_ids(vectorstore, query_embedding, k, filter=state.get("filter"))]
+        return [chunk_id(doc) for doc in vectorstore.similarity_search(query, k=k, filter=state.get("filter"))]
+
+
+def _hybrid_search(
+    state: RAGState, vectorstore: VectorStore, lexical_index: LexicalIndex, k: int
+) -> List[str]:
+    """Fuse BM25 and vector results, or answer from BM25 alone when it is confident."""
+    candidates = max(k * 4, 10)
+    with timed(QUERY_STAGE_SECONDS, stage="lexical_search"):
+        lexical_hits = lexical_index.search(state["query"], k=candidates, filter=state.get("filter"))
+    if len(lexical_hits) >= k and is_confident(lexical_hits, LEXICAL_CONFIDENCE_MARGIN, LEXICAL_MIN_SCORE):
+        # Fast path: a decisive lexical match (e.g. an exact part number) with k hits to return
+        return [i for i, _ in lexical_hits[:k]]
+
+    dense_ids = _dense_search(state, vectorstore, candidates)
+    return reciprocal_rank_fusion([dense_ids, [i for i, _ in lexical_hits]])[:k]
+
+
+def _search(
+    state: RAGState, vectorstore: VectorStore, k: int, mode: str, lexical_index: Optional[LexicalIndex]
+) -> List[str]:
+    if mode == "dense" or lexical_index is None:
+        return _dense_search(state, vectorstore, k)
+    if mode == "lexical":
+        with timed(QUERY_STAGE_SECONDS, stage="lexical_search"):
+            hits = lexical_index.search(state["query"], k=k, filter=state.get("filter"))
+        return [i for i, _ in hits]
+    if mode == "hybrid":
+        return _hybrid_search(state, vectorstore, lexical_index, k)
+    raise ValueError(f"Unknown retrieval mode: {mode}")
+
+
+def retrieve(
+    state: RAGState,
+    vectorstore: VectorStore,
+    k: int = DEFAULT_TOP_K,
+    mode: str = "dense",
+    lexical_index: Optional[LexicalIndex] = None,
+) -> RAGState:
+    """Retrieve the IDs of the chunks most relevant to the query.
+
+    ``mode`` is ``"dense"`` (vector search), ``"lexical"`` (BM25 only) or
+    ``"hybrid"`` (both, fused with reciprocal rank fusion). A ``filter`` in
+    the state, e.g. from ``metadata_filter``, restricts the search to
+    matching chunks.
+    """
+    query = state["query"]
+    key = (normalize_query(query), k, mode, filter_key(state.get("filter")), collection_version())
+    ids = retrieval_cache.get(key)
+    if ids is None:
+        ids = _search(state, vectorstore, k, mode, lexical_index)
+        retrieval_cache.put(key, ids)
+    return {"query": query, "context_ids": list(ids), "response": state.get("response")}
+
+
+async def aretrieve(
+    state: RAGState,
+    vectorstore: VectorStore,
+    k: int = DEFAULT_TOP_K,
+    mode: str = "dense",
+    lexical_index: Optional[LexicalIndex] = None,
+) -> RAGState:
+    """Async ``retrieve``: the query is embedded through the micro-batcher and searched in the search pool."""
+    query = state["query"]
+    key = (normalize_query(query), k, mode, filter_key(state.get("filter")), collection_version())
+    ids = retrieval_cache.get(key)
+    if ids is None:
+        if state.get("query_embedding") is None and mode != "lexical" and vectorstore.embeddings is not None:
+            state = {**state, "query_embedding": await aembed_query(vectorstore.embeddings, query)}
+        ids = await run_in_search_pool(_search, state, vectorstore, k, mode, lexical_index)
+        retrieval_cache.put(key, ids)
+    return {"query": query, "context_ids": list(ids), "response": state.get("response")}
+
+
+def materialize(
+    ids: List[str], chunk_store: ChunkStore, vectorstore: Optional[VectorStore] = None
+) -> List[Tuple[str, Document]]:
+    """Read chunks by ID from the chunk store, in order, skipping IDs that are not stored.
+
+    Chunks written before the chunk store existed are fetched from the vector
+    store; queries only read, so they are not added to the chunk store here.
+    """
+    with timed(QUERY_STAGE_SECONDS, stage="materialize"):
+        docs = chunk_store.lookup(ids)
+        missing = [i for i, doc in zip(ids, docs) if doc is None]
+        if missing and vectorstore is not None:
+            result = vectorstore.get(ids=missing, include=["documents", "metadatas"])
+            found = {
+                i: Document(page_content=text, metadata=metadata or {})
+                for i, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+            }
+            docs = [found.get(i) if doc is None else doc for i, doc in zip(ids, docs)]
+        return [(i, doc) for i, doc in zip(ids, docs) if doc is not None]
+
+
+def rerank(
+    state: RAGState,
+    reranker: Any,
+    chunk_store: ChunkStore,
+    vectorstore: Optional[VectorStore] = None,
+    k: int = DEFAULT_TOP_K,
+) -> RAGState:
+    """Reorder the retrieved candidates with a cross-encoder and keep the IDs of the best ``k``."""
+    candidates = materialize(state.get("context_ids") or [], chunk_store, vectorstore)
+    ids = {id(doc): i for i, doc in candidates}
+    best = reranker.rerank(state["query"], [doc for _, doc in candidates], k, ids=[i for i, _ in candidates])
+    return {"context_ids": [ids[id(doc)] for doc in best]}
+
+
+async def arerank(
+    state: RAGState,
+    reranker: Any,
+    chunk_store: ChunkStore,
+    vectorstore: Optional[VectorStore] = None,
+    k: int = DEFAULT_TOP_K,
+) -> RAGState:
+    """Async ``rerank``: the cross-encoder runs in the search pool."""
+    return await run_in_search_pool(rerank, state, reranker, chunk_store, vectorstore, k)
+
+
+def iter_response(query: str, context: List[Document]) -> Iterator[str]:
+    """Yield the response in pieces: a header, one piece per document and a summary."""
+    yield f"Based on the retrieved documents related to '{query}':\n\n"
     
     # Add full content from the context
     for i, doc in enumerate(context, 1):
@@ -29,16 +329,47 @@ def generate(state: RAGState) -> RAGState:
         source = doc.metadata.get('source', 'Unknown source')
         page = doc.metadata.get('page', 'Unknown page')
         
-        response += f"--- Document {i} (Source: {source}, Page: {page}) ---\n\n"
-        response += f"{doc.page_content}\n\n"
+        yield f"--- Document {i} (Source: {source}, Page: {page}) ---\n\n{doc.page_content}\n\n"
     
     # Add a summary section
-    response += "--- Summary ---\n\n"
-    response += f"The documents above contain information related to '{query}'. "
-    
+    summary = ["--- Summary ---\n\n", f"The documents above contain information related to '{query}'. "]
     if context:
-        response += "They cover topics including " + ", ".join([doc.page_content.split('.')[0] for doc in context[:3]]) + ". "
+        summary.append("They cover topics including " + ", ".join([doc.page_content.split('.')[0] for doc in context[:3]]) + ". ")
+    summary.append("For more specific information, please ask a more targeted question.")
+    yield "".join(summary)
+
+
+def _stream_writer() -> Optional[Callable[[Any], None]]:
+    """Return LangGraph's custom stream writer, or None outside a graph run."""
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return None
+
+
+def generate(state: RAGState, chunk_store: ChunkStore, vectorstore: Optional[VectorStore] = None) -> RAGState:
+    """Generate response using the retrieved context.
+
+    The text of the retrieved chunks is read from the chunk store here, the
+    only node that needs it. Each piece of the response is also sent to
+    LangGraph's ``custom`` stream as ``{"chunk": piece}``, so streaming
+    callers see it before the node ends.
+    """
+    context = [doc for _, doc in materialize(state.get("context_ids") or [], chunk_store, vectorstore)]
+    query = state["query"]
+    writer = _stream_writer()
     
-    response += "For more specific information, please ask a more targeted question."
+    parts = []
+    for part in iter_response(query, context):
+        parts.append(part)
+        if writer is not None:
+            writer({"chunk": part})
     
-    return {"query": query, "context": context, "response": response} 
\ No newline at end of file
+    return {"query": query, "response": "".join(parts)}
+
+
+async def agenerate(
+    state: RAGState, chunk_store: ChunkStore, vectorstore: Optional[VectorStore] = None
+) -> RAGState:
+    """Async ``generate``. Reading a few chunks and building the response is cheap, so it runs on the event loop."""
+    return generate(state, chunk_store, vectorstore)
@@ -0,0 +1,110 @@
+"""Cross-encoder reranking of retrieved candidates.
+
+Candidates are scored in retrieval order, a batch at a time, and scoring
+stops early when the best score already stands out from the rest (the order
+is decisive) or when the latency budget is spent. Candidates that
+were not scored keep their retrieval order after the scored ones.
+"""
+import statistics
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from .cache import LRUCache
+from .metrics import QUERY_STAGE_SECONDS, RERANK_CANDIDATES, count, observe_batch, timed
+from .nodes import normalize_query
+from .tools import chunk_id
+
+# Scores (query, passage) pairs; higher is more relevant
+Scorer = Callable[[List[Tuple[str, str]]], Sequence[float]]
+
+
+@lru_cache(maxsize=2)
+def load_cross_encoder(model_name: str) -> Scorer:
+    """Load a sentence-transformers cross-encoder as a scorer."""
+    # Deferred because it imports torch
+    from sentence_transformers import CrossEncoder
+
+    model = CrossEncoder(model_name)
+    return lambda pairs: model.predict(pairs, batch_size=len(pairs), show_progress_bar=False).tolist()
+
+
+class Reranker:
+    """Rerank candidates with a cross-encoder under a latency budget.
+
+    After each batch, scoring stops once more than ``k`` candidates are
+    scored and the best score is at least ``decisive_z`` standard deviations
+    above their mean: a clear winner has been found, and candidates retrieved
+    further down are unlikely to beat it. Scores are cached per
+    ``(query, chunk ID)``.
+    """
+
+    def __init__(
+        self,
+        scorer: Scorer,
+        batch_size: int = 4,
+        decisive_z: float = 2.0,
+        budget: float = 0.2,
+        cache_size: int = 8192,
+    ):
+        self.scorer = scorer
+        self.batch_size = batch_size
+        self.decisive_z = decisive_z
+        self.budget = budget
+        self.cache = LRUCache(max_size=cache_size)
+
+    def _decisive(self, scores: Dict[int, float], k: int) -> bool:
+        if len(scores) <= max(k, 2):
+            return False
+        values = list(scores.values())
+        spread = statistics.pstdev(values)
+        return spread > 0 and (max(values) - statistics.fmean(values)) / spread >= self.decisive_z
+
+    def rerank(
+        self, query: str, candidates: List[Document], k: int, ids: Optional[List[str]] = None
+    ) -> List[Document]:
+        """Return the ``k`` best candidates by cross-encoder score.
+
+        ``ids`` are the candidates' chunk IDs, used as score cache keys; they
+        are computed from the candidates when the caller does not have them.
+        """
+        start = time.perf_counter()
+        key = normalize_query(query)
+        if ids is None:
+            ids = [chunk_id(doc) for doc in candidates]
+        scores: Dict[int, float] = {}
+        cached = 0
+        for i, id_ in enumerate(ids):
+            score = self.cache.get((key, id_))
+            if score is not None:
+                scores[i] = score
+                cached += 1
+
+        scored = 0
+        position = 0
+        while position < len(candidates):
+            if time.perf_counter() - start > self.budget:
+                break
+            batch = list(range(position, min(position + self.batch_size, len(candidates))))
+            position += len(batch)
+            todo = [i for i in batch if i not in scores]
+            if todo:
+                with timed(QUERY_STAGE_SECONDS, stage="rerank_score"):
+                    new_scores = self.scorer([(query, candidates[i].page_content) for i in todo])
+                for i, score in zip(todo, new_scores):
+                    scores[i] = float(score)
+                    self.cache.put((key, ids[i]), float(score))
+                scored += len(todo)
+            if self._decisive(scores, k):
+                break
+
+        count(RERANK_CANDIDATES, scored, outcome="scored")
+        count(RERANK_CANDIDATES, cached, outcome="cached")
+        count(RERANK_CANDIDATES, len(candidates) - len(scores), outcome="skipped")
+        observe_batch("rerank_depth", len(scores))
+
+        order = sorted(scores, key=lambda i: -scores[i])
+        order += [i for i in range(len(candidates)) if i not in scores]
+        return [candidates[i] for i in order[:k]]
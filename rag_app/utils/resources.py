@@ -0,0 +1,328 @@
+"""Lazily initialized embeddings and vector store shared by the application.
+
+Loading the embedding model pulls in torch and sentence-transformers and
+opening Chroma starts its client, which together take several seconds. Both
+are therefore created on first use rather than at import time.
+"""
+import os
+import sqlite3
+import threading
+from typing import TYPE_CHECKING, Any, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from .cache import bump_collection_version
+from .chunkstore import DEFAULT_COMPACT_FRACTION, ChunkStore
+from .embeddings import cached_embeddings
+from .jobs import DEFAULT_JOBS_FILE, JobStore
+from .lexical import DEFAULT_INDEX_FILE, LexicalIndex
+from .vectorstores import (
+    DEFAULT_HNSW_THRESHOLD,
+    DEFAULT_RESCORE_FACTOR,
+    DEFAULT_SHARD_COUNT,
+    MatrixVectorStore,
+    ShardedVectorStore,
+)
+from .settings import (
+    DEFAULT_MODEL_NAME,
+    DEFAULT_PERSIST_DIRECTORY,
+    DEFAULT_RERANK_MODEL,
+    DEFAULT_SESSION_STORE,
+    DEFAULT_VECTOR_BACKEND,
+)
+
+_lock = threading.RLock()
+_embeddings: Optional[Embeddings] = None
+_vectorstore = None
+_lexical_index: Optional[LexicalIndex] = None
+_chunk_store: Optional[ChunkStore] = None
+_persist_directory: Optional[str] = None
+_manifest = None
+_jobs: Optional[JobStore] = None
+_checkpointer = None
+_reranker = None
+
+if TYPE_CHECKING:
+    from .manifest import Manifest
+    from .rerank import Reranker
+
+
+def get_model_name() -> str:
+    """Return the configured embedding model name."""
+    return os.getenv("RAG_EMBEDDING_MODEL", DEFAULT_MODEL_NAME)
+
+
+def get_persist_directory() -> str:
+    """Return the directory the vector store persists to."""
+    return _persist_directory or os.getenv("RAG_PERSIST_DIRECTORY", DEFAULT_PERSIST_DIRECTORY)
+
+
+def get_vector_backend() -> str:
+    """Return the configured vector store backend."""
+    return os.getenv("RAG_VECTOR_BACKEND", DEFAULT_VECTOR_BACKEND)
+
+
+def get_embeddings() -> Embeddings:
+    """Return the shared embeddings, loading the model on first use."""
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                underlying = load_embedding_model()
+                model_name = getattr(underlying, "model_name", "") or get_model_name()
+                _embeddings = cached_embeddings(
+                    underlying, model_name=model_name, persist_directory=get_persist_directory()
+                )
+    return _embeddings
+
+
+def load_embedding_model() -> Embeddings:
+    """Return the configured embedding model without the persistent embedding cache."""
+    server = os.getenv("RAG_EMBEDDING_SERVER")
+    if server:
+        # Use the model resident in `rag-app serve-embeddings` instead of loading one
+        from .embedding_server import EmbeddingClient
+
+        return EmbeddingClient(server)
+    # Deferred because it imports torch and sentence-transformers
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    # Avoid tokenizer warnings when worker processes are forked
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    return HuggingFaceEmbeddings(model_name=get_model_name())
+
+
+def get_vectorstore():
+    """Return the shared vector store, opening it on first use."""
+    global _vectorstore
+    if _vectorstore is None:
+        with _lock:
+            if _vectorstore is None:
+                backend = get_vector_backend()
+                if backend not in ("matrix", "chroma"):
+                    raise ValueError(f"Unknown vector backend: {backend}")
+                if get_shard_count() > 1 or os.path.exists(shard_config_path()):
+                    _vectorstore = open_sharded_store()
+                elif backend == "matrix":
+                    _vectorstore = open_matrix_store()
+                else:
+                    _vectorstore = open_chroma()
+    return _vectorstore
+
+
+def open_chroma(collection_name: str = "langchain"):
+    """Open a Chroma collection in the persist directory."""
+    # Deferred because it starts the Chroma client
+    from langchain_community.vectorstores import Chroma
+
+    return Chroma(
+        collection_name=collection_name,
+        persist_directory=get_persist_directory(),
+        embedding_function=get_embeddings(),
+    )
+
+
+def open_matrix_store(
+    dtype: Optional[str] = None, quantization: Optional[str] = None, name: str = "matrix"
+) -> MatrixVectorStore:
+    """Open a memory-mapped matrix store in the persist directory."""
+    return MatrixVectorStore(
+        os.path.join(get_persist_directory(), name),
+        get_embeddings(),
+        dtype=dtype or os.getenv("RAG_VECTOR_DTYPE", "float32"),
+        index=os.getenv("RAG_ANN_INDEX", "auto"),
+        hnsw_threshold=int(os.getenv("RAG_HNSW_THRESHOLD", DEFAULT_HNSW_THRESHOLD)),
+        quantization=quantization or os.getenv("RAG_VECTOR_QUANTIZATION", "none"),
+        rescore_factor=int(os.getenv("RAG_RESCORE_FACTOR", DEFAULT_RESCORE_FACTOR)),
+    )
+
+
+def get_shard_count() -> int:
+    """Return the configured number of shards; 1 disables sharding."""
+    return int(os.getenv("RAG_SHARDS", 1))
+
+
+def shard_config_path() -> str:
+    """Return where the shard layout of the configured backend is recorded."""
+    return os.path.join(get_persist_directory(), f"shards-{get_vector_backend()}.json")
+
+
+def open_unsharded_store():
+    """Open the single default store of the configured backend, e.g. to migrate it into shards."""
+    return open_matrix_store() if get_vector_backend() == "matrix" else open_chroma()
+
+
+def open_sharded_store(count: Optional[int] = None, strategy: Optional[str] = None) -> ShardedVectorStore:
+    """Open the configured backend as shards, e.g. Chroma collections ``shard-0``, ``shard-1``, ..."""
+    if get_vector_backend() == "matrix":
+        open_shard = lambda i: open_matrix_store(name=os.path.join("matrix", f"shard-{i}"))
+    else:
+        open_shard = lambda i: open_chroma(collection_name=f"shard-{i}")
+    workers = os.getenv("RAG_SHARD_WORKERS")
+    return ShardedVectorStore(
+        shard_config_path(),
+        open_shard,
+        get_embeddings(),
+        count=count or (get_shard_count() if get_shard_count() > 1 else DEFAULT_SHARD_COUNT),
+        strategy=strategy or os.getenv("RAG_SHARD_BY", "source"),
+        workers=int(workers) if workers else None,
+    )
+
+
+def get_lexical_index() -> LexicalIndex:
+    """Return the shared BM25 index, loading it from disk or rebuilding it from the vector store."""
+    global _lexical_index
+    if _lexical_index is None:
+        with _lock:
+            if _lexical_index is None:
+                path = os.path.join(get_persist_directory(), DEFAULT_INDEX_FILE)
+                if os.path.exists(path):
+                    _lexical_index = LexicalIndex.load(path)
+                if _lexical_index is None or _lexical_index.metadata is None:
+                    # Indexes saved before chunk metadata was kept cannot be filtered
+                    _lexical_index = build_lexical_index(get_vectorstore())
+    return _lexical_index
+
+
+def get_chunk_store() -> ChunkStore:
+    """Return the shared columnar chunk store that generation reads chunk text from."""
+    global _chunk_store
+    if _chunk_store is None:
+        with _lock:
+            if _chunk_store is None:
+                _chunk_store = ChunkStore(os.path.join(get_persist_directory(), "chunks"))
+    return _chunk_store
+
+
+def build_lexical_index(vectorstore, batch_size: int = 1000) -> LexicalIndex:
+    """Build a BM25 index from every chunk already stored in the vector store."""
+    index = LexicalIndex()
+    offset = 0
+    while True:
+        result = vectorstore.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        if not result["ids"]:
+            break
+        index.add_many(zip(result["ids"], result["documents"], result["metadatas"]))
+        offset += len(result["ids"])
+    return index
+
+
+def get_manifest() -> "Manifest":
+    """Return the shared document manifest stored next to the vector store."""
+    global _manifest
+    if _manifest is None:
+        with _lock:
+            if _manifest is None:
+                # Deferred because it imports the PDF loaders
+                from .manifest import DEFAULT_MANIFEST_FILE, Manifest
+
+                _manifest = Manifest(os.path.join(get_persist_directory(), DEFAULT_MANIFEST_FILE))
+    return _manifest
+
+
+def get_job_store() -> JobStore:
+    """Return the shared record of resumable ingest jobs stored next to the vector store."""
+    global _jobs
+    if _jobs is None:
+        with _lock:
+            if _jobs is None:
+                _jobs = JobStore(os.path.join(get_persist_directory(), DEFAULT_JOBS_FILE))
+    return _jobs
+
+
+def get_checkpointer() -> Any:
+    """Return the LangGraph checkpointer that keeps the state of multi-turn sessions.
+
+    ``RAG_SESSION_STORE=sqlite`` (default) keeps sessions in
+    ``sessions.sqlite3`` next to the vector store so they survive restarts;
+    ``memory`` keeps them only for the life of the process.
+    """
+    global _checkpointer
+    if _checkpointer is None:
+        with _lock:
+            if _checkpointer is None:
+                store = os.getenv("RAG_SESSION_STORE", DEFAULT_SESSION_STORE)
+                if store == "memory":
+                    from langgraph.checkpoint.memory import InMemorySaver
+
+                    _checkpointer = InMemorySaver()
+                elif store == "sqlite":
+                    try:
+                        from langgraph.checkpoint.sqlite import SqliteSaver
+                    except ImportError as e:
+                        raise ImportError(
+                            "Persistent sessions require langgraph-checkpoint-sqlite. Install it with "
+                            "`pip install langgraph-checkpoint-sqlite` or set RAG_SESSION_STORE=memory."
+                        ) from e
+
+                    directory = get_persist_directory()
+                    os.makedirs(directory, exist_ok=True)
+                    connection = sqlite3.connect(os.path.join(directory, "sessions.sqlite3"), check_same_thread=False)
+                    _checkpointer = SqliteSaver(connection)
+                else:
+                    raise ValueError(f"Unknown session store: {store}")
+    return _checkpointer
+
+
+def get_reranker() -> "Reranker":
+    """Return the shared cross-encoder reranker, loading the model on first use."""
+    global _reranker
+    if _reranker is None:
+        with _lock:
+            if _reranker is None:
+                from .rerank import Reranker, load_cross_encoder
+
+                _reranker = Reranker(
+                    load_cross_encoder(os.getenv("RAG_RERANK_MODEL", DEFAULT_RERANK_MODEL)),
+                    batch_size=int(os.getenv("RAG_RERANK_BATCH_SIZE", 4)),
+                    decisive_z=float(os.getenv("RAG_RERANK_DECISIVE_Z", 2.0)),
+                    budget=float(os.getenv("RAG_RERANK_BUDGET_MS", 200)) / 1000,
+                )
+    return _reranker
+
+
+def save_lexical_index() -> None:
+    """Persist the BM25 index next to the vector store if it has been loaded."""
+    if _lexical_index is not None:
+        _lexical_index.save(os.path.join(get_persist_directory(), DEFAULT_INDEX_FILE))
+
+
+def save_indexes() -> None:
+    """Persist the BM25 index and any in-process ANN index after an ingest, and compact the chunk store."""
+    save_lexical_index()
+    if _chunk_store is not None:
+        _chunk_store.compact(DEFAULT_COMPACT_FRACTION)
+    if isinstance(_vectorstore, (MatrixVectorStore, ShardedVectorStore)):
+        _vectorstore.persist()
+
+
+def configure(
+    embeddings: Optional[Embeddings] = None,
+    persist_directory: Optional[str] = None,
+    reranker: Optional[Any] = None,
+) -> None:
+    """Replace the shared resources, e.g. with a stub model in benchmarks.
+
+    Resources that are not given are recreated lazily on next use.
+    """
+    global _embeddings, _vectorstore, _lexical_index, _chunk_store, _manifest, _jobs, _checkpointer
+    global _persist_directory, _reranker
+    with _lock:
+        _embeddings = embeddings
+        _reranker = reranker
+        _persist_directory = persist_directory
+        _vectorstore = None
+        _lexical_index = None
+        _chunk_store = None
+        _manifest = None
+        _jobs = None
+        _checkpointer = None
+    # Results cached for the previous store must not be served for the new one
+    bump_collection_version(persist=False)
+
+
+def warmup() -> None:
+    """Load the model and open the vector store ahead of the first request."""
+    get_vectorstore()
+    get_embeddings().embed_query("warm up")
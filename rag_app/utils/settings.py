@@ -0,0 +1,28 @@
+"""Default settings for the RAG application.
+
+This module must stay free of heavy imports so the CLI can start quickly.
+"""
+
+DEFAULT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_PERSIST_DIRECTORY = "./data"
+DEFAULT_BATCH_SIZE = 256
+
+# Chunk lengths are counted in "chars", or in "tokens" of the embedding model
+DEFAULT_CHUNK_MODE = "chars"
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
+
+# Chunks passed to generate per query
+DEFAULT_TOP_K = 3
+
+# Vector store backend: "chroma", or "matrix" for the in-process MatrixVectorStore
+DEFAULT_VECTOR_BACKEND = "chroma"
+
+# Cross-encoder used by the optional rerank node
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Where multi-turn session state is checkpointed: "sqlite" (persistent) or "memory"
+DEFAULT_SESSION_STORE = "sqlite"
+
+# Address of the shared embedding server started with `rag-app serve-embeddings`
+DEFAULT_EMBEDDING_SERVER = "unix:/tmp/rag_app_embeddings.sock"
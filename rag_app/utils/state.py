@@ -1,6 +1,5 @@
 """State definition for the RAG graph."""
-from typing import Dict, List, TypedDict, Optional
-from langchain_core.documents import Document
+from typing import Any, Dict, List, TypedDict, Optional
 
 
 class RAGState(TypedDict):
@@ -9,8 +8,20 @@ class RAGState(TypedDict):
     query: str
     """The user query."""
     
-    context: Optional[List[Document]]
-    """Retrieved documents."""
+    query_embedding: Optional[List[float]]
+    """Precomputed query embedding, if the caller embedded queries in a batch."""
+    
+    context_ids: Optional[List[str]]
+    """IDs of the retrieved chunks. Their text is read from the chunk store only by ``generate``."""
     
     response: Optional[str]
-    """Generated response.""" 
\ No newline at end of file
+    """Generated response."""
+    
+    started_at: Optional[float]
+    """``time.perf_counter()`` when the query missed the semantic cache.""" 
+    
+    filter: Optional[Dict[str, Any]]
+    """Chroma-style ``where`` filter on chunk metadata, e.g. from ``metadata_filter``."""
+    
+    session_turns: Optional[List[Dict[str, Any]]]
+    """Query, query embedding and chunk IDs of earlier turns, kept by the session checkpointer."""
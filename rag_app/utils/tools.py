@@ -1,12 +1,58 @@
 """Utility functions for document loading and processing."""
+import glob
 import os
-import tempfile
-import requests
-from urllib.parse import quote
-from typing import List, Optional
+import hashlib
+import time
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Tuple
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_core.documents import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from .cache import bump_collection_version
+from .chunking import TextChunker, token_chunker
+from .chunkstore import ChunkStore
+from .embeddings import normalize_text
+from .lexical import LexicalIndex
+from .metrics import INGEST_ITEMS, INGEST_SECONDS, count, observe_batch, observe_stage, timed
+from .download import get_downloader
+from .settings import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_CHUNK_MODE,
+    DEFAULT_CHUNK_OVERLAP,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_MODEL_NAME,
+)
+from .vectorstores import add_embedded_chunks
+
+
+MANIFEST_SUFFIXES = (".txt", ".lst", ".manifest")
+
+
+def expand_inputs(inputs: Iterable[str]) -> List[str]:
+    """Expand directories, glob patterns and manifest files into a list of PDF paths."""
+    paths: List[str] = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, "**", "*.pdf"), recursive=True)))
+        elif os.path.isfile(item) and item.lower().endswith(MANIFEST_SUFFIXES):
+            # Manifest files list one path per line; blank lines and comments are ignored
+            with open(item) as f:
+                entries = [line.strip() for line in f]
+            base = os.path.dirname(item)
+            paths.extend(
+                expand_inputs(
+                    entry if os.path.isabs(entry) else os.path.join(base, entry)
+                    for entry in entries
+                    if entry and not entry.startswith("#")
+                )
+            )
+        elif glob.has_magic(item):
+            paths.extend(sorted(glob.glob(item, recursive=True)))
+        else:
+            paths.append(item)
+
+    # Keep the first occurrence of each file
+    return list(dict.fromkeys(paths))
 
 
 def load_pdf_from_path(pdf_path: str) -> List[Document]:
@@ -14,43 +60,35 @@ def load_pdf_from_path(pdf_path: str) -> List[Document]:
     if not os.path.exists(pdf_path):
         raise FileNotFoundError(f"PDF file not found at {pdf_path}")
     
-    loader = PyPDFLoader(pdf_path)
-    documents = loader.load()
+    with timed(INGEST_SECONDS, stage="parse"):
+        loader = PyPDFLoader(pdf_path)
+        documents = loader.load()
     return documents
 
 
+def iter_pdf_pages(pdf_path: str) -> Iterator[Document]:
+    """Lazily yield the pages of a local PDF one at a time."""
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"PDF file not found at {pdf_path}")
+
+    loader = PyPDFLoader(pdf_path)
+    yield from loader.lazy_load()
+
+
 def download_pdf(url: str) -> Optional[str]:
-    """Download a PDF from a URL and save it to a temporary file."""
-    try:
-        print(f"Downloading PDF from {url}...")
-        # Handle URL encoding for special characters
-        if '!' in url and not url.startswith('http'):
-            # If URL was passed without quotes and has special chars
-            url = quote(url, safe=':/?&=')
-            
-        response = requests.get(url, stream=True)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        
-        # Check if the content is a PDF
-        content_type = response.headers.get('Content-Type', '')
-        if 'application/pdf' not in content_type and not url.lower().endswith('.pdf'):
-            print(f"Warning: URL might not be a PDF. Content-Type: {content_type}")
-        
-        # Create a temporary file to store the PDF
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        temp_path = temp_file.name
-        
-        # Write the PDF content to the temporary file
-        with open(temp_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        
-        print(f"PDF downloaded and saved to temporary file: {temp_path}")
-        return temp_path
-    except Exception as e:
-        print(f"Error downloading PDF: {e}")
+    """Download a PDF from a URL into the local download cache and return its path."""
+    print(f"Downloading PDF from {url}...")
+    result = get_downloader().fetch(url)
+    if not result.ok:
+        print(f"Error downloading PDF: {result.error}")
         return None
 
+    if result.changed:
+        print(f"PDF downloaded and saved to: {result.path}")
+    else:
+        print(f"PDF unchanged since last download, using cached copy: {result.path}")
+    return result.path
+
 
 def load_pdf_from_url(url: str) -> List[Document]:
     """Download and load a PDF from a URL."""
@@ -58,20 +96,212 @@ def load_pdf_from_url(url: str) -> List[Document]:
     if not pdf_path:
         raise ValueError(f"Failed to download PDF from {url}")
     
-    try:
-        documents = load_pdf_from_path(pdf_path)
-        return documents
-    finally:
-        # Clean up the temporary file
-        if os.path.exists(pdf_path):
-            os.remove(pdf_path)
+    return load_pdf_from_path(pdf_path)
 
 
-def split_documents(documents: List[Document], chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Document]:
-    """Split documents into chunks."""
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
+def chunk_settings() -> Tuple[int, int]:
+    """Return the configured chunk size and overlap (``RAG_CHUNK_SIZE``, ``RAG_CHUNK_OVERLAP``)."""
+    return (
+        int(os.getenv("RAG_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)),
+        int(os.getenv("RAG_CHUNK_OVERLAP", DEFAULT_CHUNK_OVERLAP)),
     )
-    return text_splitter.split_documents(documents) 
\ No newline at end of file
+
+
+def get_chunker(chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None) -> TextChunker:
+    """Return the chunker for the configured chunk mode, size and overlap, unless given.
+
+    With ``RAG_CHUNK_MODE=tokens`` sizes are counted in tokens of the
+    embedding model and capped at its input limit, so no chunk is truncated
+    when it is embedded.
+    """
+    default_size, default_overlap = chunk_settings()
+    chunk_size = default_size if chunk_size is None else chunk_size
+    chunk_overlap = default_overlap if chunk_overlap is None else chunk_overlap
+    if not 0 <= chunk_overlap < chunk_size:
+        raise ValueError(f"Chunk overlap must be at least 0 and below the chunk size, got {chunk_overlap}/{chunk_size}")
+    mode = os.getenv("RAG_CHUNK_MODE", DEFAULT_CHUNK_MODE)
+    return _chunker(chunk_size, chunk_overlap, mode, os.getenv("RAG_EMBEDDING_MODEL", DEFAULT_MODEL_NAME))
+
+
+@lru_cache(maxsize=8)
+def _chunker(chunk_size: int, chunk_overlap: int, mode: str, model_name: str) -> TextChunker:
+    if mode == "tokens":
+        return token_chunker(model_name, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    if mode == "chars":
+        return TextChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    raise ValueError(f"Unknown chunk mode: {mode}")
+
+
+def split_documents(
+    documents: List[Document], chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None
+) -> List[Document]:
+    """Split documents into chunks."""
+    chunker = get_chunker(chunk_size, chunk_overlap)
+    with timed(INGEST_SECONDS, stage="split"):
+        return chunker.split_documents(documents)
+
+
+def iter_split_documents(
+    documents: Iterable[Document], chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None
+) -> Iterator[Document]:
+    """Split documents into chunks one document at a time."""
+    chunker = get_chunker(chunk_size, chunk_overlap)
+    for document in documents:
+        with timed(INGEST_SECONDS, stage="split"):
+            chunks = chunker.split_documents([document])
+        yield from chunks
+
+
+def iter_batches(items: Iterable, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List]:
+    """Group an iterable into lists of at most ``batch_size`` items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def chunk_id(chunk: Document) -> str:
+    """Return a deterministic ID for a chunk based on its source, page and text."""
+    source = str(chunk.metadata.get("source", ""))
+    page = str(chunk.metadata.get("page", ""))
+    text = normalize_text(chunk.page_content)
+    return hashlib.sha256(f"{source}\x00{page}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def filter_new_chunks(vectorstore, chunks: List[Document]) -> Tuple[List[Document], List[str]]:
+    """Drop chunks whose IDs are already stored (or repeated) and return the rest with their IDs."""
+    unique = {}
+    for chunk in chunks:
+        unique.setdefault(chunk_id(chunk), chunk)
+    if not unique:
+        return [], []
+
+    existing = set(vectorstore.get(ids=list(unique), include=[])["ids"])
+    ids = [i for i in unique if i not in existing]
+    return [unique[i] for i in ids], ids
+
+
+def embed_chunks(vectorstore, chunks: List[Document]) -> List[List[float]]:
+    """Embed chunk texts with the vector store's embedding model."""
+    observe_batch("embed_documents", len(chunks))
+    with timed(INGEST_SECONDS, stage="embed"):
+        return vectorstore.embeddings.embed_documents([c.page_content for c in chunks])
+
+
+def store_chunks(
+    vectorstore,
+    chunks: List[Document],
+    new_chunks: List[Document],
+    ids: List[str],
+    vectors: List[List[float]],
+    lexical_index: Optional[LexicalIndex] = None,
+    chunk_store: Optional[ChunkStore] = None,
+) -> None:
+    """Write the embedded ``new_chunks`` of a batch and make sure every chunk of it is in the BM25 index."""
+    if new_chunks:
+        with timed(INGEST_SECONDS, stage="write"):
+            add_embedded_chunks(vectorstore, new_chunks, ids, vectors)
+            if chunk_store is not None:
+                chunk_store.add(ids, new_chunks)
+        count(INGEST_ITEMS, len(new_chunks), kind="chunks")
+        if lexical_index is not None:
+            lexical_index.add_many(zip(ids, (c.page_content for c in new_chunks), (c.metadata for c in new_chunks)))
+        bump_collection_version()
+    if lexical_index is not None and len(new_chunks) < len(chunks):
+        # Stored chunks can be missing from the BM25 index if a run stopped before saving it
+        lexical_index.add_many((chunk_id(c), c.page_content, c.metadata) for c in chunks)
+
+
+def add_new_chunks(
+    vectorstore,
+    chunks: List[Document],
+    lexical_index: Optional[LexicalIndex] = None,
+    chunk_store: Optional[ChunkStore] = None,
+) -> int:
+    """Add only the chunks that are not in the vector store yet and return how many were added."""
+    with timed(INGEST_SECONDS, stage="dedupe"):
+        new_chunks, ids = filter_new_chunks(vectorstore, chunks)
+    count(INGEST_ITEMS, len(chunks) - len(new_chunks), kind="skipped_chunks")
+    vectors = embed_chunks(vectorstore, new_chunks) if new_chunks else []
+    store_chunks(vectorstore, chunks, new_chunks, ids, vectors, lexical_index, chunk_store)
+    return len(new_chunks)
+
+
+def index_missing_chunks(vectorstore, ids: List[str], lexical_index: LexicalIndex) -> int:
+    """Add stored chunks that the BM25 index lacks, reading their text from the vector store."""
+    missing = [i for i in dict.fromkeys(ids) if i not in lexical_index]
+    if not missing:
+        return 0
+    result = vectorstore.get(ids=missing, include=["documents", "metadatas"])
+    return lexical_index.add_many(zip(result["ids"], result["documents"], result["metadatas"]))
+
+
+def delete_chunks(
+    vectorstore,
+    ids: List[str],
+    lexical_index: Optional[LexicalIndex] = None,
+    chunk_store: Optional[ChunkStore] = None,
+) -> int:
+    """Delete chunks from the vector store, the BM25 index and the chunk store and return how many were requested."""
+    if not ids:
+        return 0
+    with timed(INGEST_SECONDS, stage="delete"):
+        for batch in iter_batches(ids, DEFAULT_BATCH_SIZE * 16):
+            vectorstore.delete(ids=batch)
+        if lexical_index is not None:
+            lexical_index.remove(ids)
+        if chunk_store is not None:
+            chunk_store.delete(ids)
+    count(INGEST_ITEMS, len(ids), kind="deleted_chunks")
+    bump_collection_version()
+    return len(ids)
+
+
+def documents_by_ids(vectorstore, ids: List[str]) -> List[Document]:
+    """Fetch stored chunks by ID, in the order given, skipping IDs that are not stored."""
+    if not ids:
+        return []
+    result = vectorstore.get(ids=list(ids), include=["documents", "metadatas"])
+    found = {
+        i: Document(page_content=text, metadata=metadata or {})
+        for i, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+    }
+    return [found[i] for i in ids if i in found]
+
+
+def ingest_pdf_stream(
+    vectorstore,
+    pdf_path: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    lexical_index: Optional[LexicalIndex] = None,
+    chunk_store: Optional[ChunkStore] = None,
+) -> int:
+    """Stream a PDF into a vector store and return the number of pages.
+
+    Pages are loaded lazily and split incrementally, and chunks are written in
+    batches of ``batch_size``, so peak memory depends on the batch size rather
+    than on the length of the document.
+    """
+    pages = 0
+
+    def counted_pages() -> Iterator[Document]:
+        nonlocal pages
+        page_iter = iter_pdf_pages(pdf_path)
+        while True:
+            # Each page is parsed when it is pulled from the lazy loader
+            start = time.perf_counter()
+            page = next(page_iter, None)
+            if page is None:
+                break
+            observe_stage("parse", time.perf_counter() - start)
+            pages += 1
+            count(INGEST_ITEMS, kind="pages")
+            yield page
+
+    for batch in iter_batches(iter_split_documents(counted_pages()), batch_size):
+        add_new_chunks(vectorstore, batch, lexical_index, chunk_store)
+    return pages
@@ -0,0 +1,167 @@
+"""Grid search over chunk size, chunk overlap and ``k`` on a labeled corpus.
+
+Every chunking configuration is ingested into a fresh store in a temporary
+directory, and every labeled query is then retrieved with each ``k``. A
+label names the PDF, and optionally the page, that answers the query; a
+query counts as answered when any retrieved chunk comes from it. The
+results show what each setting costs (chunks, index size, ingest time and
+query latency) next to the recall it buys.
+
+Labels are JSON lines::
+
+    {"query": "What is a baseline?", "source": "handbook.pdf", "page": 12}
+"""
+import json
+import os
+import statistics
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from . import resources
+from .ingest import expand_inputs, ingest_paths
+from .nodes import clear_query_caches, materialize, retrieve
+
+
+@dataclass
+class TuningResult:
+    """Cost and quality of one combination of settings."""
+
+    chunk_size: int
+    chunk_overlap: int
+    k: int
+    chunks: int
+    index_bytes: int
+    ingest_seconds: float
+    p50_ms: float
+    p95_ms: float
+    recall: float
+
+
+def load_labels(path: str) -> List[Dict[str, Any]]:
+    """Read labeled queries from a JSON lines file."""
+    with open(path) as f:
+        labels = [json.loads(line) for line in f if line.strip()]
+    for label in labels:
+        if "query" not in label or "source" not in label:
+            raise ValueError(f"Labels need a query and a source: {label}")
+    return labels
+
+
+def is_relevant(metadata: Dict[str, Any], label: Dict[str, Any]) -> bool:
+    """Return whether a chunk comes from the labeled source (matched by path suffix) and page."""
+    source = str(metadata.get("source", ""))
+    if not (source == label["source"] or source.endswith(os.sep + label["source"].lstrip(os.sep))):
+        return False
+    return "page" not in label or metadata.get("page") == label["page"]
+
+
+def _directory_bytes(directory: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names
+    )
+
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def run_grid(
+    inputs: Iterable[str],
+    labels: List[Dict[str, Any]],
+    embeddings: Embeddings,
+    chunk_sizes: Iterable[int],
+    chunk_overlaps: Iterable[int],
+    ks: Iterable[int],
+    mode: str = "dense",
+    workers: Optional[int] = None,
+) -> List[TuningResult]:
+    """Ingest the corpus once per chunking configuration and measure retrieval for each ``k``.
+
+    Combinations where the overlap is not smaller than the chunk size are
+    skipped. The shared resources are reset when the grid is done.
+    """
+    paths = expand_inputs(inputs)
+    ks = sorted(set(ks))
+    results: List[TuningResult] = []
+    try:
+        for chunk_size in chunk_sizes:
+            for chunk_overlap in chunk_overlaps:
+                if chunk_overlap >= chunk_size:
+                    continue
+                with tempfile.TemporaryDirectory() as tmp:
+                    resources.configure(embeddings=embeddings, persist_directory=tmp)
+                    vectorstore = resources.get_vectorstore()
+                    lexical_index = resources.get_lexical_index() if mode != "dense" else None
+                    chunk_store = resources.get_chunk_store()
+
+                    start = time.perf_counter()
+                    stats = ingest_paths(
+                        paths,
+                        vectorstore,
+                        resources.get_manifest(),
+                        workers=workers,
+                        lexical_index=lexical_index,
+                        chunk_store=chunk_store,
+                        chunk_size=chunk_size,
+                        chunk_overlap=chunk_overlap,
+                    )
+                    resources.save_indexes()
+                    ingest_seconds = time.perf_counter() - start
+                    index_bytes = _directory_bytes(tmp)
+
+                    for k in ks:
+                        latencies, found = [], 0
+                        for label in labels:
+                            clear_query_caches()  # Measure cold queries, including the query embedding
+                            state = {"query": label["query"], "query_embedding": None, "context_ids": None}
+                            start = time.perf_counter()
+                            ids = retrieve(state, vectorstore, k=k, mode=mode, lexical_index=lexical_index)["context_ids"]
+                            latencies.append(time.perf_counter() - start)
+                            found += any(is_relevant(doc.metadata, label) for _, doc in materialize(ids, chunk_store))
+                        results.append(TuningResult(
+                            chunk_size=chunk_size,
+                            chunk_overlap=chunk_overlap,
+                            k=k,
+                            chunks=stats.chunks,
+                            index_bytes=index_bytes,
+                            ingest_seconds=ingest_seconds,
+                            p50_ms=statistics.median(latencies) * 1000 if latencies else 0.0,
+                            p95_ms=_percentile(latencies, 95) * 1000 if latencies else 0.0,
+                            recall=found / len(labels) if labels else 0.0,
+                        ))
+                    chunk_store.close()
+    finally:
+        clear_query_caches()
+        resources.configure()
+    return results
+
+
+def cheapest(results: List[TuningResult], min_recall: float) -> Optional[TuningResult]:
+    """Return the result with the smallest index, then the lowest p95 latency, among those meeting ``min_recall``."""
+    candidates = [result for result in results if result.recall >= min_recall]
+    return min(candidates, key=lambda r: (r.index_bytes, r.p95_ms, r.k)) if candidates else None
+
+
+def format_results(results: List[TuningResult]) -> str:
+    """Format results as a table."""
+    lines = [
+        f"{'size':>6} {'overlap':>7} {'k':>3} {'chunks':>8} {'index MB':>9} {'ingest s':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'recall':>7}"
+    ]
+    for r in results:
+        lines.append(
+            f"{r.chunk_size:>6} {r.chunk_overlap:>7} {r.k:>3} {r.chunks:>8} {r.index_bytes / 1e6:>9.2f} "
+            f"{r.ingest_seconds:>9.2f} {r.p50_ms:>8.2f} {r.p95_ms:>8.2f} {r.recall:>7.3f}"
+        )
+    return "\n".join(lines)
+
+
+def save_results(results: List[TuningResult], path: str) -> None:
+    """Write results as a JSON list."""
+    with open(path, "w") as f:
+        json.dump([asdict(result) for result in results], f, indent=2)
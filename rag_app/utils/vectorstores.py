@@ -0,0 +1,1017 @@
+"""In-process vector store backed by a memory-mapped embedding matrix, and sharding over several stores."""
+import heapq
+import json
+import os
+import shutil
+import threading
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from .cache import LRUCache
+from .filters import MetadataIndex, filter_key
+
+DEFAULT_HNSW_THRESHOLD = 50_000
+DEFAULT_RESCORE_FACTOR = 8
+DEFAULT_SHARD_COUNT = 4
+SHARD_STRATEGIES = ("source", "hash")
+_SEARCH_BLOCK_ROWS = 65_536
+# Filters matching at most this share of the rows are searched by scoring only the matching rows
+_PREFILTER_SCAN_FRACTION = 0.25
+_CODE_BLOCK_ROWS = 1024
+_DTYPES = {"float32": np.float32, "float16": np.float16}
+_QUANTIZATIONS = {"none": None, "int8": np.int8, "float16": np.float16}
+# Keeps the sign bit and the 15 exponent and mantissa bits of a float16 shifted left by 13
+_FLOAT16_BITS = np.int32(-0x70000001)  # 0x8FFFFFFF
+_FLOAT16_REBIAS = np.float32(2.0 ** 112)
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _decode_float16(codes: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """Decode float16 ``codes`` into the float32 array ``out`` and return it.
+
+    NumPy's float16 cast is scalar code and costs ~10x a float32 scan. The
+    bits are instead widened with vectorized integer operations (sign to bit
+    31, exponent and mantissa to bits 13-27), and one multiplication by
+    2**112 rebiases the exponent. The result is exact for every finite value.
+    """
+    bits = out.view(np.int32)
+    np.copyto(bits, codes.view(np.int16), casting="unsafe")
+    np.left_shift(bits, 13, out=bits)
+    np.bitwise_and(bits, _FLOAT16_BITS, out=bits)
+    np.multiply(out, _FLOAT16_REBIAS, out=out)
+    return out
+
+
+def _block_scores(matrix: np.ndarray, query: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """Write ``matrix @ query`` to ``out``, decoding float16 or int8 rows block by block into one reused buffer."""
+    query = np.asarray(query, dtype=np.float32)
+    if matrix.dtype == np.float32:
+        for start in range(0, len(matrix), _SEARCH_BLOCK_ROWS):
+            block = matrix[start:start + _SEARCH_BLOCK_ROWS]
+            np.dot(block, query, out=out[start:start + len(block)])
+        return out
+    # A buffer of this size stays in cache between decoding and the product
+    buffer = np.empty((min(_CODE_BLOCK_ROWS, len(matrix)), matrix.shape[1]), dtype=np.float32)
+    for start in range(0, len(matrix), _CODE_BLOCK_ROWS):
+        block = matrix[start:start + _CODE_BLOCK_ROWS]
+        decoded = buffer[:len(block)]
+        if block.dtype == np.float16:
+            _decode_float16(block, decoded)
+        else:
+            np.copyto(decoded, block, casting="unsafe")
+        np.dot(decoded, query, out=out[start:start + len(block)])
+    return out
+
+
+def quantize(vectors: np.ndarray, quantization: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Return the codes of normalized vectors and, for int8, the per-row scale that decodes them."""
+    if quantization == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class MatrixVectorStore(VectorStore):
+    """Vector store that keeps L2-normalized embeddings in a memory-mapped matrix.
+
+    Vectors are appended to ``vectors.bin`` (float32 or float16) and chunk
+    text and metadata to an append-only ``docs.jsonl`` log, so writes never
+    rewrite existing data. Search is an exact, blocked matrix-vector product
+    for small corpora and switches to an HNSW graph (``hnswlib``) once the
+    collection reaches ``hnsw_threshold`` rows, unless ``index`` forces one
+    or the other. Scores are cosine similarities.
+
+    With ``quantization`` set to ``"int8"`` or ``"float16"``, the exact scan
+    reads a compact copy of the vectors held in memory (``codes.bin``) and
+    rescores the best ``k * rescore_factor`` candidates with the full vectors,
+    which stay on disk and are paged in only for those rows.
+
+    Searches can be restricted with a Chroma-style ``filter``. ``source`` and
+    ``page`` conditions are answered by a metadata index maintained as rows
+    are added, and a filter matching few rows is searched by scoring only
+    those rows instead of masking a full scan or graph search.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        embedding_function: Embeddings,
+        dtype: str = "float32",
+        index: str = "auto",
+        hnsw_threshold: int = DEFAULT_HNSW_THRESHOLD,
+        quantization: str = "none",
+        rescore_factor: int = DEFAULT_RESCORE_FACTOR,
+    ):
+        if dtype not in _DTYPES:
+            raise ValueError(f"Unsupported dtype {dtype!r}, expected one of {sorted(_DTYPES)}")
+        if quantization not in _QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization {quantization!r}, expected one of {sorted(_QUANTIZATIONS)}")
+        if index not in ("auto", "exact", "hnsw"):
+            raise ValueError(f"Unknown index type: {index}")
+        self.directory = directory
+        self.embedding_function = embedding_function
+        self.index = index
+        self.hnsw_threshold = hnsw_threshold
+        self.rescore_factor = rescore_factor
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._vectors_path = os.path.join(directory, "vectors.bin")
+        self._docs_path = os.path.join(directory, "docs.jsonl")
+        self._config_path = os.path.join(directory, "config.json")
+        self._hnsw_path = os.path.join(directory, "hnsw.bin")
+        self._codes_path = os.path.join(directory, "codes.bin")
+        self._scales_path = os.path.join(directory, "scales.bin")
+
+        config = self._load_config()
+        self.dtype = np.dtype(config.get("dtype", dtype))
+        self.dim: Optional[int] = config.get("dim")
+        self.quantization = quantization
+        self._stored_quantization = config.get("quantization", "none")
+
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._deleted: set = set()
+        self._metadata_index = MetadataIndex()
+        self._load_docs()
+
+        self._matrix: Optional[np.ndarray] = None
+        self._hnsw = None
+        self._codes: List[np.ndarray] = []
+        self._scales: List[np.ndarray] = []
+        # Matching rows of recent filters, keyed by the filter and the number of rows and deletions
+        self._filter_masks = LRUCache(max_size=64)
+        if self.quantization != "none" and self.dim:
+            self._load_codes()
+
+    # Persistence
+
+    def _load_config(self) -> Dict[str, Any]:
+        if not os.path.exists(self._config_path):
+            return {}
+        with open(self._config_path) as f:
+            return json.load(f)
+
+    def _save_config(self) -> None:
+        with open(self._config_path, "w") as f:
+            json.dump({"dtype": self.dtype.name, "dim": self.dim, "quantization": self.quantization}, f)
+
+    def _stored_rows(self) -> int:
+        if not self.dim or not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (self.dim * self.dtype.itemsize)
+
+    def _load_docs(self) -> None:
+        """Replay the document log, ignoring records whose vectors were never written."""
+        if not os.path.exists(self._docs_path):
+            return
+        rows = self._stored_rows()
+        with open(self._docs_path) as f:
+            for line in f:
+                record = json.loads(line)
+                if "delete" in record:
+                    row = self._rows.pop(record["delete"], None)
+                    if row is not None:
+                        self._deleted.add(row)
+                    continue
+                if len(self._ids) >= rows:
+                    break
+                self._append_record(record["id"], record["text"], record.get("metadata") or {})
+
+    def _load_codes(self) -> None:
+        """Read the quantized codes into memory, repairing them if they disagree with the vectors.
+
+        Codes left over from an interrupted write are truncated, and rows
+        written without codes (or before quantization was enabled or changed)
+        are quantized from the stored vectors.
+        """
+        code_dtype = np.dtype(_QUANTIZATIONS[self.quantization])
+        n = len(self._ids)
+        int8 = self.quantization == "int8"
+        stored = 0
+        if self._stored_quantization == self.quantization and os.path.exists(self._codes_path):
+            stored = min(n, os.path.getsize(self._codes_path) // (self.dim * code_dtype.itemsize))
+            if int8:
+                stored = min(stored, os.path.getsize(self._scales_path) // 4 if os.path.exists(self._scales_path) else 0)
+        codes = np.fromfile(self._codes_path, dtype=code_dtype, count=stored * self.dim) if stored else np.zeros(0, code_dtype)
+        codes = codes.reshape(stored, self.dim)
+        scales = None
+        if int8:
+            scales = np.fromfile(self._scales_path, dtype=np.float32, count=stored) if stored else np.zeros(0, np.float32)
+
+        if stored < n or not os.path.exists(self._codes_path) or os.path.getsize(self._codes_path) != codes.nbytes:
+            missing, missing_scales = quantize(
+                _normalize_rows(np.asarray(self._matrix_view()[stored:], dtype=np.float32)), self.quantization
+            )
+            codes = np.concatenate([codes, missing])
+            if scales is not None:
+                scales = np.concatenate([scales, missing_scales])
+            self._write_codes(codes, scales, mode="wb")
+        if self._stored_quantization != self.quantization:
+            self._stored_quantization = self.quantization
+            self._save_config()
+        self._codes = [codes]
+        self._scales = [scales] if scales is not None else []
+
+    def _write_codes(self, codes: np.ndarray, scales: Optional[np.ndarray], mode: str = "ab") -> None:
+        with open(self._codes_path, mode) as f:
+            f.write(codes.tobytes())
+        if scales is not None:
+            with open(self._scales_path, mode) as f:
+                f.write(scales.tobytes())
+
+    def _code_matrix(self) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Return the in-memory codes and scales, merging blocks appended since the last search."""
+        with self._lock:
+            if len(self._codes) > 1:
+                self._codes = [np.concatenate(self._codes)]
+            if len(self._scales) > 1:
+                self._scales = [np.concatenate(self._scales)]
+            codes = self._codes[0] if self._codes else np.zeros((0, self.dim or 0), dtype=np.int8)
+            return codes, self._scales[0] if self._scales else None
+
+    def _append_record(self, chunk_id: str, text: str, metadata: Dict[str, Any]) -> int:
+        row = len(self._ids)
+        previous = self._rows.get(chunk_id)
+        if previous is not None:
+            # Upsert: the old row stays in the matrix but is never returned again
+            self._deleted.add(previous)
+        self._rows[chunk_id] = row
+        self._ids.append(chunk_id)
+        self._texts.append(text)
+        self._metadatas.append(metadata)
+        self._metadata_index.add(metadata)
+        return row
+
+    def _matrix_view(self) -> np.ndarray:
+        """Return a read-only memory map of every stored row."""
+        with self._lock:
+            n = len(self._ids)
+            if self._matrix is None or len(self._matrix) != n:
+                if n == 0:
+                    self._matrix = np.zeros((0, self.dim or 0), dtype=self.dtype)
+                else:
+                    self._matrix = np.memmap(self._vectors_path, dtype=self.dtype, mode="r", shape=(n, self.dim))
+            return self._matrix
+
+    # Writing
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding_function
+
+    def add_embeddings(
+        self,
+        text_embeddings: Iterable[Tuple[str, List[float]]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """Add texts with precomputed embeddings. Existing IDs are replaced."""
+        text_embeddings = list(text_embeddings)
+        if not text_embeddings:
+            return []
+        texts, vectors = zip(*text_embeddings)
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        matrix = _normalize_rows(np.asarray(vectors, dtype=np.float32)).astype(self.dtype)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                self._stored_quantization = self.quantization
+                self._save_config()
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {matrix.shape[1]}")
+
+            if self.quantization != "none":
+                # Codes first: extra codes are truncated on load, missing ones rebuilt
+                codes, scales = quantize(matrix.astype(np.float32), self.quantization)
+                self._write_codes(codes, scales)
+                self._codes.append(codes)
+                if scales is not None:
+                    self._scales.append(scales)
+
+            # Vectors are written before the log, so a crash never leaves records without vectors
+            with open(self._vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+            with open(self._docs_path, "a") as f:
+                for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                    f.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata or {}}) + "\n")
+
+            first = len(self._ids)
+            replaced = [self._rows[i] for i in ids if i in self._rows]
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                self._append_record(chunk_id, text, metadata or {})
+            if self._hnsw is not None:
+                self._hnsw_add(matrix, first)
+                for row in replaced:
+                    self._hnsw.mark_deleted(row)
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        vectors = self.embedding_function.embed_documents(texts)
+        return self.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Mark chunks as deleted. Their rows are skipped by every search."""
+        if not ids:
+            return False
+        with self._lock:
+            with open(self._docs_path, "a") as f:
+                for chunk_id in ids:
+                    row = self._rows.pop(chunk_id, None)
+                    if row is None:
+                        continue
+                    self._deleted.add(row)
+                    f.write(json.dumps({"delete": chunk_id}) + "\n")
+                    if self._hnsw is not None:
+                        self._hnsw.mark_deleted(row)
+        return True
+
+    # Reading
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        include: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        """Return stored chunks in the same shape as ``Chroma.get``."""
+        include = ["documents", "metadatas"] if include is None else include
+        with self._lock:
+            if ids is not None:
+                rows = [self._rows[i] for i in ids if i in self._rows]
+            else:
+                rows = sorted(self._rows.values())
+                start = offset or 0
+                rows = rows[start:start + limit] if limit is not None else rows[start:]
+            result: Dict[str, Any] = {"ids": [self._ids[r] for r in rows]}
+            if "documents" in include:
+                result["documents"] = [self._texts[r] for r in rows]
+            if "metadatas" in include:
+                result["metadatas"] = [self._metadatas[r] for r in rows]
+        if "embeddings" in include:
+            matrix = self._matrix_view()
+            result["embeddings"] = [matrix[r].astype(np.float32).tolist() for r in rows]
+        return result
+
+    def _use_hnsw(self) -> bool:
+        if self.index == "exact":
+            return False
+        if self.index == "hnsw":
+            return True
+        return len(self._ids) >= self.hnsw_threshold
+
+    def _exclude(self, scores: np.ndarray, allowed: Optional[np.ndarray]) -> int:
+        """Set the scores of deleted rows and rows outside ``allowed`` to -inf; return how many rows remain."""
+        n = len(scores)
+        if self._deleted:
+            deleted = np.fromiter((r for r in self._deleted if r < n), dtype=np.int64)
+            scores[deleted] = -np.inf
+        if allowed is None:
+            return n - len(self._deleted)
+        scores[~allowed[:n]] = -np.inf
+        return int(np.count_nonzero(allowed[:n]))
+
+    def _filter_rows(self, filter: Optional[Dict[str, Any]]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Return the mask and the indices of the live rows matching a ``where`` filter, or None without one.
+
+        ``source`` and ``page`` conditions are answered by the metadata index;
+        other keys are checked against each row's metadata.
+        """
+        if not filter:
+            return None
+        with self._lock:
+            key = (filter_key(filter), len(self._ids), len(self._deleted))
+            found = self._filter_masks.get(key)
+            if found is None:
+                mask = self._metadata_index.mask(filter, self._metadatas.__getitem__)
+                if self._deleted:
+                    mask[list(self._deleted)] = False
+                found = (mask, np.flatnonzero(mask))
+                self._filter_masks.put(key, found)
+        return found
+
+    def _exact_search(self, query: np.ndarray, k: int, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        matrix = self._matrix_view()
+        n = len(matrix)
+        if not n:
+            return []
+        scores = _block_scores(matrix, query, np.empty(n, dtype=np.float32))
+        k = min(k, self._exclude(scores, allowed))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(r), float(scores[r])) for r in top]
+
+    def _rows_search(self, query: np.ndarray, k: int, rows: np.ndarray) -> List[Tuple[int, float]]:
+        """Score only the given live rows, reading their full vectors from the memory map."""
+        k = min(k, len(rows))
+        if k <= 0:
+            return []
+        matrix = self._matrix_view()
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), _SEARCH_BLOCK_ROWS):
+            block = rows[start:start + _SEARCH_BLOCK_ROWS]
+            _block_scores(matrix[block], query, scores[start:start + len(block)])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def _quantized_search(
+        self, query: np.ndarray, k: int, allowed: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """Rank every row by its quantized codes, then rescore the best candidates with the full vectors."""
+        codes, scales = self._code_matrix()
+        n = len(codes)
+        if not n:
+            return []
+        scores = _block_scores(codes, query, np.empty(n, dtype=np.float32))
+        if scales is not None:
+            scores *= scales
+        live = self._exclude(scores, allowed)
+        k = min(k, live)
+        if k <= 0:
+            return []
+        candidates = min(live, k * self.rescore_factor)
+        rows = np.sort(np.argpartition(-scores, candidates - 1)[:candidates])
+        exact = _block_scores(self._matrix_view()[rows], query, np.empty(len(rows), dtype=np.float32))
+        best = np.argsort(-exact, kind="stable")[:k]
+        return [(int(rows[i]), float(exact[i])) for i in best]
+
+    def _hnsw_index(self):
+        """Load or build the HNSW graph and bring it up to date with the matrix."""
+        with self._lock:
+            if self._hnsw is None:
+                try:
+                    import hnswlib
+                except ImportError as e:
+                    raise ImportError(
+                        "The HNSW index requires hnswlib. Install it with `pip install hnswlib` "
+                        "or set RAG_ANN_INDEX=exact."
+                    ) from e
+
+                index = hnswlib.Index(space="ip", dim=self.dim)
+                if os.path.exists(self._hnsw_path):
+                    index.load_index(self._hnsw_path, max_elements=max(len(self._ids), 1))
+                else:
+                    index.init_index(max_elements=max(len(self._ids), 1024), ef_construction=200, M=16)
+                self._hnsw = index
+                # Catch up with rows written since the graph was last saved
+                indexed = index.get_current_count()
+                if indexed < len(self._ids):
+                    self._hnsw_add(self._matrix_view()[indexed:], indexed)
+                for row in self._deleted:
+                    if row < index.get_current_count():
+                        try:
+                            index.mark_deleted(row)
+                        except RuntimeError:
+                            pass  # Already marked
+            return self._hnsw
+
+    def _hnsw_add(self, vectors: np.ndarray, first_row: int) -> None:
+        needed = first_row + len(vectors)
+        if needed > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(max(needed, 2 * self._hnsw.get_max_elements()))
+        self._hnsw.add_items(np.asarray(vectors, dtype=np.float32), np.arange(first_row, needed))
+
+    def _hnsw_search(self, query: np.ndarray, k: int, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        index = self._hnsw_index()
+        k = min(k, len(self._rows) if allowed is None else int(np.count_nonzero(allowed)))
+        if k <= 0:
+            return []
+        index.set_ef(max(64, 4 * k))
+        if allowed is None:
+            labels, distances = index.knn_query(query, k=k)
+        else:
+            labels, distances = index.knn_query(query, k=k, filter=lambda row: bool(allowed[row]))
+        # Inner-product distance is 1 - similarity
+        return [(int(r), float(1.0 - d)) for r, d in zip(labels[0], distances[0])]
+
+    def _search_rows(
+        self, embedding: Sequence[float], k: int, filter: Optional[Dict[str, Any]]
+    ) -> List[Tuple[int, float]]:
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        found = self._filter_rows(filter)
+        allowed = None
+        if found is not None:
+            allowed, rows = found
+            # Selective filters score just their rows; the graph or full scan is faster for broad ones
+            limit = self.hnsw_threshold if self._use_hnsw() else len(allowed) * _PREFILTER_SCAN_FRACTION
+            if len(rows) <= limit:
+                return self._rows_search(query, k, rows)
+        if self._use_hnsw():
+            return self._hnsw_search(query, k, allowed)
+        if self.quantization != "none":
+            return self._quantized_search(query, k, allowed)
+        return self._exact_search(query, k, allowed)
+
+    def similarity_search_ids_by_vector(
+        self, embedding: Sequence[float], k: int = 4, filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[str, float]]:
+        """Return the IDs and scores of the ``k`` nearest chunks without building documents."""
+        return [(self._ids[r], score) for r, score in self._search_rows(embedding, k, filter)]
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: Sequence[float], k: int = 4, filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        """Return the ``k`` nearest chunks, only among those whose metadata matches ``filter`` if given."""
+        return [
+            (Document(page_content=self._texts[r], metadata=dict(self._metadatas[r])), score)
+            for r, score in self._search_rows(embedding, k, filter)
+        ]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(
+            self.embedding_function.embed_query(query), k=k, filter=filter
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    def persist(self) -> None:
+        """Save the HNSW graph, if one has been built, so it need not be rebuilt on load."""
+        with self._lock:
+            if self._hnsw is not None:
+                self._hnsw.save_index(self._hnsw_path)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        directory: str = "./data/matrix",
+        **kwargs: Any,
+    ) -> "MatrixVectorStore":
+        store = cls(directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    @classmethod
+    def from_chroma(
+        cls, chroma, directory: str, batch_size: int = 5000, **kwargs: Any
+    ) -> "MatrixVectorStore":
+        """Copy every vector, text and metadata of a Chroma collection into a new store."""
+        store = cls(directory, chroma.embeddings, **kwargs)
+        offset = 0
+        while True:
+            result = chroma._collection.get(
+                include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset
+            )
+            if not len(result["ids"]):
+                break
+            store.add_embeddings(
+                list(zip(result["documents"], result["embeddings"])),
+                metadatas=result["metadatas"],
+                ids=result["ids"],
+            )
+            offset += len(result["ids"])
+        return store
+
+
+def _store_count(store) -> int:
+    return len(store) if isinstance(store, MatrixVectorStore) else store._collection.count()
+
+
+def _scored_search(
+    store, embedding: Sequence[float], k: int, filter: Optional[Dict[str, Any]]
+) -> List[Tuple[Document, float]]:
+    """Search one store, returning scores where higher is closer for either backend."""
+    if isinstance(store, MatrixVectorStore):
+        return store.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)
+    if not store._collection.count():
+        return []  # Chroma warns and can fail when k exceeds the collection size
+    k = min(k, store._collection.count())
+    # Chroma returns distances, lower is closer
+    hits = store.similarity_search_by_vector_with_relevance_scores(list(embedding), k=k, filter=filter)
+    return [(doc, -distance) for doc, distance in hits]
+
+
+def search_ids(
+    store, embedding: Sequence[float], k: int, filter: Optional[Dict[str, Any]] = None
+) -> List[Tuple[str, float]]:
+    """Return the IDs and scores (higher is closer) of the nearest chunks, without fetching their text."""
+    if isinstance(store, (MatrixVectorStore, ShardedVectorStore)):
+        return store.similarity_search_ids_by_vector(embedding, k=k, filter=filter)
+    size = store._collection.count()
+    if not size:
+        return []
+    result = store._collection.query(
+        query_embeddings=[list(embedding)], n_results=min(k, size), where=filter or None, include=["distances"]
+    )
+    # Chroma returns distances, lower is closer
+    return [(i, -distance) for i, distance in zip(result["ids"][0], result["distances"][0])]
+
+
+def _drop_store(store) -> None:
+    if isinstance(store, MatrixVectorStore):
+        shutil.rmtree(store.directory, ignore_errors=True)
+    else:
+        store.delete_collection()
+
+
+class ShardedVectorStore(VectorStore):
+    """Vector store that partitions chunks over several underlying stores.
+
+    Each chunk goes to the shard given by a hash of its ``source`` metadata
+    (so every chunk of a document lives in one shard) or of its chunk ID (for
+    an even spread). Searches run on the shards in parallel threads and the
+    per-shard top-k lists are merged with a heap. A filter on ``source``
+    routes a search to just the shards that can hold matches.
+
+    The shard count and strategy are kept in ``config_path`` and take
+    precedence over the arguments, so chunks are always looked up where they
+    were written; ``rebalance`` changes them.
+    """
+
+    def __init__(
+        self,
+        config_path: str,
+        open_shard: Callable[[int], VectorStore],
+        embedding_function: Embeddings,
+        count: int = DEFAULT_SHARD_COUNT,
+        strategy: str = "source",
+        workers: Optional[int] = None,
+    ):
+        self.config_path = config_path
+        self.open_shard = open_shard
+        self.embedding_function = embedding_function
+        config = {}
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                config = json.load(f)
+        self.count = config.get("count", count)
+        self.strategy = config.get("strategy", strategy)
+        if self.strategy not in SHARD_STRATEGIES:
+            raise ValueError(f"Unknown shard strategy {self.strategy!r}, expected one of {SHARD_STRATEGIES}")
+        if self.count < 1:
+            raise ValueError("The shard count must be at least 1")
+        # Shards beyond ``count`` still hold chunks while an interrupted rebalance is unfinished
+        self._opened = max(self.count, config.get("rebalancing_from", 0))
+        if not config:
+            self._save_config()
+        self.shards: List[VectorStore] = [open_shard(i) for i in range(self._opened)]
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers or self._opened, thread_name_prefix="rag-shard")
+
+    def _save_config(self, **extra: Any) -> None:
+        os.makedirs(os.path.dirname(self.config_path) or ".", exist_ok=True)
+        with open(self.config_path, "w") as f:
+            json.dump({"count": self.count, "strategy": self.strategy, **extra}, f)
+
+    # Routing
+
+    def shard_for(self, chunk_id: str, metadata: Optional[Dict[str, Any]] = None) -> int:
+        """Return the shard a chunk belongs to."""
+        if self.strategy == "source":
+            key = str((metadata or {}).get("source", ""))
+        else:
+            key = chunk_id
+        # crc32 rather than hash(), which is salted per process
+        return zlib.crc32(key.encode("utf-8")) % self.count
+
+    def _sources(self, filter: Dict[str, Any]) -> Optional[Set[str]]:
+        """Return the sources a filter restricts results to, or None if it allows any source."""
+        condition = filter.get("source")
+        if isinstance(condition, str):
+            return {condition}
+        if isinstance(condition, dict):
+            if "$eq" in condition:
+                return {condition["$eq"]}
+            if "$in" in condition:
+                return set(condition["$in"])
+        for clause in filter.get("$and", []):
+            sources = self._sources(clause)
+            if sources is not None:
+                return sources
+        return None
+
+    def route(self, filter: Optional[Dict[str, Any]] = None) -> List[int]:
+        """Return the shards a search with ``filter`` has to visit."""
+        if filter and self.strategy == "source" and self._opened == self.count:
+            sources = self._sources(filter)
+            if sources is not None:
+                return sorted({self.shard_for("", {"source": source}) for source in sources})
+        return list(range(self._opened))
+
+    def _map(self, fn: Callable[[VectorStore], Any], shards: List[int]) -> List[Any]:
+        if len(shards) == 1:
+            return [fn(self.shards[shards[0]])]
+        return list(self._executor.map(lambda i: fn(self.shards[i]), shards))
+
+    # Writing
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding_function
+
+    def add_embedded(self, chunks: List[Document], ids: List[str], vectors: List[List[float]]) -> None:
+        """Write chunks with precomputed embeddings to their shards."""
+        groups: Dict[int, List[int]] = {}
+        for i, (chunk, chunk_id) in enumerate(zip(chunks, ids)):
+            groups.setdefault(self.shard_for(chunk_id, chunk.metadata), []).append(i)
+        for shard, rows in groups.items():
+            add_embedded_chunks(
+                self.shards[shard], [chunks[i] for i in rows], [ids[i] for i in rows], [vectors[i] for i in rows]
+            )
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        chunks = [Document(page_content=text, metadata=metadata or {}) for text, metadata in zip(texts, metadatas)]
+        self.add_embedded(chunks, ids, self.embedding_function.embed_documents(texts))
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete chunks from whichever shard holds them."""
+        if not ids:
+            return False
+        self._map(lambda store: store.delete(ids=list(ids)), list(range(self._opened)))
+        return True
+
+    # Reading
+
+    def __len__(self) -> int:
+        return sum(_store_count(store) for store in self.shards)
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        include: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        """Return stored chunks in the same shape as ``Chroma.get``, shard by shard."""
+        include = ["documents", "metadatas"] if include is None else include
+        merged: Dict[str, Any] = {"ids": [], **{key: [] for key in include}}
+        if ids is not None:
+            results = self._map(lambda store: store.get(ids=list(ids), include=include), list(range(self._opened)))
+        else:
+            results = []
+            skip, remaining = offset or 0, limit
+            for store in self.shards:
+                if remaining is not None and remaining <= 0:
+                    break
+                size = _store_count(store)
+                if skip >= size:
+                    skip -= size
+                    continue
+                result = store.get(include=include, limit=remaining, offset=skip)
+                skip = 0
+                if remaining is not None:
+                    remaining -= len(result["ids"])
+                results.append(result)
+        for result in results:
+            for key in merged:
+                values = result.get(key)
+                if values is not None:
+                    merged[key].extend(list(values))
+        return merged
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: Sequence[float], k: int = 4, filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        """Search the routed shards in parallel and merge their results by score."""
+        results = self._map(lambda store: _scored_search(store, embedding, k, filter), self.route(filter))
+        merged = heapq.merge(*results, key=lambda hit: -hit[1])
+        hits: List[Tuple[Document, float]] = []
+        seen = set()
+        for doc, score in merged:
+            # A chunk is in two shards only while a rebalance is moving it
+            key = (doc.page_content, doc.metadata.get("source"), doc.metadata.get("page"))
+            if key not in seen:
+                seen.add(key)
+                hits.append((doc, score))
+                if len(hits) == k:
+                    break
+        return hits
+
+    def similarity_search_ids_by_vector(
+        self, embedding: Sequence[float], k: int = 4, filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[str, float]]:
+        """Return the IDs and scores of the ``k`` nearest chunks over the routed shards."""
+        results = self._map(lambda store: search_ids(store, embedding, k, filter), self.route(filter))
+        hits: Dict[str, float] = {}
+        for chunk_id, score in heapq.merge(*results, key=lambda hit: -hit[1]):
+            hits.setdefault(chunk_id, score)
+            if len(hits) == k:
+                break
+        return list(hits.items())
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(
+            self.embedding_function.embed_query(query), k=k, filter=filter
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    def persist(self) -> None:
+        """Persist the in-process ANN index of every matrix shard."""
+        for store in self.shards:
+            if isinstance(store, MatrixVectorStore):
+                store.persist()
+
+    # Rebalancing
+
+    def _move(self, source, target, ids: List[str]) -> None:
+        """Copy chunks to another store, then delete them from the one they were in."""
+        result = source.get(ids=ids, include=["embeddings", "documents", "metadatas"])
+        if not len(result["ids"]):
+            return
+        chunks = [
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(result["documents"], result["metadatas"])
+        ]
+        add_embedded_chunks(target, chunks, list(result["ids"]), list(result["embeddings"]))
+        source.delete(ids=list(result["ids"]))
+
+    def import_store(self, store, batch_size: int = 1000) -> int:
+        """Move every chunk of an unsharded store into the shards; return how many were moved."""
+        moved = 0
+        while True:
+            result = store.get(include=["metadatas"], limit=batch_size, offset=0)
+            if not len(result["ids"]):
+                return moved
+            groups: Dict[int, List[str]] = {}
+            for chunk_id, metadata in zip(result["ids"], result["metadatas"]):
+                groups.setdefault(self.shard_for(chunk_id, metadata), []).append(chunk_id)
+            for shard, ids in groups.items():
+                self._move(store, self.shards[shard], ids)
+            moved += len(result["ids"])
+
+    def rebalance(
+        self, count: Optional[int] = None, strategy: Optional[str] = None, batch_size: int = 1000
+    ) -> int:
+        """Change the shard count or strategy and move chunks to their new shards.
+
+        The new layout is recorded before anything moves and chunks are copied
+        before they are deleted, so an interrupted rebalance loses nothing and
+        running it again finishes the job. Returns how many chunks moved.
+        """
+        count = count or self.count
+        strategy = strategy or self.strategy
+        if strategy not in SHARD_STRATEGIES:
+            raise ValueError(f"Unknown shard strategy {strategy!r}, expected one of {SHARD_STRATEGIES}")
+        previous = self._opened
+        self.count, self.strategy = count, strategy
+        self._opened = max(count, previous)
+        self._save_config(rebalancing_from=previous)
+        self.shards += [self.open_shard(i) for i in range(len(self.shards), self._opened)]
+
+        moved = 0
+        for i, store in enumerate(self.shards):
+            # Collect first: paging through a store while deleting from it would skip chunks
+            moves: Dict[int, List[str]] = {}
+            offset = 0
+            while True:
+                result = store.get(include=["metadatas"], limit=batch_size, offset=offset)
+                if not len(result["ids"]):
+                    break
+                for chunk_id, metadata in zip(result["ids"], result["metadatas"]):
+                    target = self.shard_for(chunk_id, metadata)
+                    if target != i:
+                        moves.setdefault(target, []).append(chunk_id)
+                offset += len(result["ids"])
+            for target, ids in moves.items():
+                for start in range(0, len(ids), batch_size):
+                    self._move(store, self.shards[target], ids[start:start + batch_size])
+                moved += len(ids)
+
+        for store in self.shards[count:]:
+            _drop_store(store)
+        self.shards = self.shards[:count]
+        self._opened = count
+        self._save_config()
+        self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers or count, thread_name_prefix="rag-shard")
+        return moved
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        directory: str = "./data/matrix",
+        count: int = DEFAULT_SHARD_COUNT,
+        strategy: str = "source",
+        workers: Optional[int] = None,
+        open_shard: Optional[Callable[[int], VectorStore]] = None,
+        **kwargs: Any,
+    ) -> "ShardedVectorStore":
+        """Open or create shards under ``directory`` and add ``texts`` to them.
+
+        Shards are matrix stores in ``directory/shard-N`` opened with the
+        remaining keyword arguments, unless ``open_shard`` opens them. The
+        layout is kept in ``directory/shards.json``.
+        """
+        if open_shard is None:
+            open_shard = lambda i: MatrixVectorStore(os.path.join(directory, f"shard-{i}"), embedding, **kwargs)
+        store = cls(
+            os.path.join(directory, "shards.json"),
+            open_shard,
+            embedding,
+            count=count,
+            strategy=strategy,
+            workers=workers,
+        )
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+def add_embedded_chunks(vectorstore, chunks: List[Document], ids: List[str], vectors: List[List[float]]) -> None:
+    """Write chunks with precomputed embeddings to any supported backend.
+
+    Chroma's public API only takes texts, which it would embed again, so the
+    vectors are upserted into its collection directly. Stores with neither
+    ``add_embeddings`` nor a collection fall back to ``add_documents``.
+    """
+    if isinstance(vectorstore, ShardedVectorStore):
+        vectorstore.add_embedded(chunks, ids, vectors)
+    elif hasattr(vectorstore, "add_embeddings"):
+        vectorstore.add_embeddings(
+            list(zip((c.page_content for c in chunks), vectors)),
+            metadatas=[c.metadata for c in chunks],
+            ids=ids,
+        )
+    elif getattr(vectorstore, "_collection", None) is not None:
+        vectorstore._collection.upsert(
+            ids=ids,
+            embeddings=np.asarray(vectors, dtype=np.float32),
+            documents=[c.page_content for c in chunks],
+            # Chroma rejects empty metadata dicts but accepts None
+            metadatas=[c.metadata or None for c in chunks],
+        )
+    else:
+        vectorstore.add_documents(chunks, ids=ids)
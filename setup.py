@@ -4,10 +4,10 @@ from setuptools import setup, find_packages
 setup(
     name="rag_app",
     version="0.1.0",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     install_requires=[
         "langchain>=0.1.0",
-        "langgraph>=0.0.10",
+        "langgraph>=0.3.0",
         "chromadb>=0.4.22",
         "python-dotenv>=1.0.0",
         "langchain_community>=0.3.19",
@@ -17,7 +17,12 @@ setup(
         "langchain-core>=0.1.0",
         "pypdf>=3.15.1",
         "requests>=2.31.0",
+        "numpy>=1.24.0",
     ],
+    extras_require={
+        "hnsw": ["hnswlib>=0.8.0"],
+        "sessions": ["langgraph-checkpoint-sqlite>=2.0.0"],
+    },
     entry_points={
         "console_scripts": [
             "rag-app=rag_app.cli:main",
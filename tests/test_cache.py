@@ -0,0 +1,77 @@
+"""Query caches: invalidation by other processes, expiry, and reuse of cached context."""
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from benchmarks.synthetic import BagOfWordsEmbeddings, make_documents
+from rag_app.utils import resources
+from rag_app.utils.cache import SemanticCache, bump_collection_version, collection_version
+
+
+@pytest.fixture
+def persist_directory(tmp_path):
+    resources.configure(persist_directory=str(tmp_path))
+    yield str(tmp_path)
+    resources.configure()
+
+
+def bump_in_another_process(directory: str) -> None:
+    code = "from rag_app.utils.cache import bump_collection_version; bump_collection_version()"
+    env = {**os.environ, "RAG_PERSIST_DIRECTORY": directory}
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+
+
+def test_version_changes_when_another_process_writes(persist_directory):
+    before = collection_version()
+    bump_in_another_process(persist_directory)
+    after = collection_version()
+    assert after != before
+    assert bump_collection_version() != after != collection_version()
+
+
+def test_semantic_cache_drops_entries_written_before_another_process_changed_the_collection(persist_directory):
+    cache = SemanticCache(capacity=4, threshold=0.9)
+    cache.put([1.0, 0.0], "cached")
+    assert cache.lookup([1.0, 0.01]) is not None
+    bump_in_another_process(persist_directory)
+    assert cache.lookup([1.0, 0.01]) is None
+
+
+def test_semantic_cache_entries_expire(persist_directory):
+    cache = SemanticCache(capacity=2, threshold=0.9, ttl=0.05)
+    cache.put([1.0, 0.0], "old")
+    assert cache.lookup([1.0, 0.0]) is not None
+    time.sleep(0.06)
+    assert cache.lookup([1.0, 0.0]) is None
+    # Expired entries are replaced before live ones
+    cache.put([0.0, 1.0], "live")
+    cache.put([1.0, 1.0], "new")
+    assert cache.lookup([1.0, 0.0]) is None and cache.lookup([0.0, 1.0])[0] == "live"
+
+
+def test_paraphrase_reuses_the_context_but_answers_the_new_query(tmp_path, monkeypatch):
+    from rag_app import agent
+
+    monkeypatch.setenv("RAG_VECTOR_BACKEND", "matrix")
+    resources.configure(embeddings=BagOfWordsEmbeddings(size=64), persist_directory=str(tmp_path))
+    try:
+        agent.ingest_documents(make_documents(20))
+        cache = SemanticCache(capacity=16, threshold=0.95, ttl=60)
+        monkeypatch.setattr(agent, "semantic_cache", cache)
+        app = agent.create_graph().compile()
+
+        def ask(query):
+            state = {"query": query, "query_embedding": None, "context_ids": None, "response": None,
+                     "started_at": None, "filter": None}
+            return app.invoke(state)
+
+        first = ask("what topics does this document cover")
+        second = ask("what topics does this document cover?!")
+        assert cache.hits == 1 and len(cache) == 1
+        assert second["context_ids"] == first["context_ids"]
+        assert "'what topics does this document cover?!'" in second["response"]
+    finally:
+        resources.configure()
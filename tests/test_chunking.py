@@ -0,0 +1,27 @@
+"""The offset-based chunker must produce exactly the chunks of RecursiveCharacterTextSplitter."""
+import pytest
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from benchmarks.bench_chunking import golden_corpus
+from rag_app.utils.chunking import TextChunker
+
+# Synthetic prose plus pages with blank lines, runs of spaces and unbroken strings longer than a chunk
+CORPUS = golden_corpus(200) + [
+    Document(page_content=text, metadata={"source": "edge.pdf", "page": i})
+    for i, text in enumerate(["", " ", "\n\n", "short", "x" * 1000, "x" * 1001, "a b " * 600, "word\n\n" * 300])
+]
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(1000, 200), (500, 0), (300, 50), (100, 99), (40, 10)])
+def test_chunks_match_recursive_splitter(chunk_size, chunk_overlap):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len)
+    expected = splitter.split_documents(CORPUS)
+    actual = TextChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap).split_documents(CORPUS)
+
+    assert [(d.page_content, d.metadata) for d in actual] == [(d.page_content, d.metadata) for d in expected]
+
+
+def test_overlap_larger_than_chunk_is_rejected():
+    with pytest.raises(ValueError):
+        TextChunker(chunk_size=100, chunk_overlap=101)
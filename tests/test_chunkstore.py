@@ -0,0 +1,115 @@
+"""Chunk store deletion, compaction, recovery and sharing a directory between handles."""
+import multiprocessing
+import os
+
+from langchain_core.documents import Document
+
+from rag_app.utils.chunkstore import ChunkStore
+
+
+def chunks(n: int, offset: int = 0):
+    ids = [f"chunk-{i}" for i in range(offset, offset + n)]
+    docs = [
+        Document(page_content=f"text of chunk {i} " * (i % 5 + 1), metadata={"source": f"{i % 3}.pdf", "page": i})
+        for i in range(offset, offset + n)
+    ]
+    return ids, docs
+
+
+def test_deleted_chunks_no_longer_resolve(tmp_path):
+    store = ChunkStore(str(tmp_path / "chunks"))
+    ids, docs = chunks(100)
+    store.add(ids, docs)
+    store.rows(ids)  # Build the sorted key index, so deletes of sorted and recent rows are both covered
+    more_ids, more_docs = chunks(10, offset=100)
+    store.add(more_ids, more_docs)
+
+    assert store.delete(ids[10:20] + more_ids[:5] + ["never-stored"]) == 15
+    assert store.delete(ids[10:20]) == 0
+    assert len(store) == 95
+    assert store.lookup(ids[9:21]) == [docs[9]] + [None] * 10 + [docs[20]]
+    assert all(i not in store for i in more_ids[:5])
+
+    # Tombstones are persisted, and a deleted chunk can be added again
+    reopened = ChunkStore(str(tmp_path / "chunks"))
+    assert reopened.documents(ids[10:12]) == [] and len(reopened) == 95
+    assert reopened.add(ids[10:11], docs[10:11]) == 1
+    assert reopened.documents(ids[10:12]) == [docs[10]]
+
+
+def test_compaction_drops_deleted_rows(tmp_path):
+    directory = str(tmp_path / "chunks")
+    store = ChunkStore(directory)
+    ids, docs = chunks(200)
+    store.add(ids, docs)
+    store.delete(ids[::3])
+    size = os.path.getsize(os.path.join(directory, "text.bin"))
+
+    assert store.compact(min_fraction=0.5) == 0
+    assert store.compact() == 67
+    assert os.path.getsize(os.path.join(directory, "text.bin")) < size
+    live = [i for n, i in enumerate(ids) if n % 3]
+    expected = [d for n, d in enumerate(docs) if n % 3]
+    assert store.documents(ids) == expected
+    assert ChunkStore(directory).documents(ids) == expected
+    assert len(store) == len(live) and store.compact() == 0
+
+
+def test_interrupted_compaction_is_recovered(tmp_path):
+    directory = str(tmp_path / "chunks")
+    store = ChunkStore(directory)
+    ids, docs = chunks(30)
+    store.add(ids, docs)
+    store.delete(ids[:10])
+    store.compact()
+    store.close()
+
+    # Stopped after moving the store aside but before moving the compacted copy in
+    os.rename(directory, directory + ".compact")
+    os.makedirs(directory + ".old")
+    assert ChunkStore(directory).documents(ids) == docs[10:]
+    assert not os.path.exists(directory + ".old") and not os.path.exists(directory + ".compact")
+
+    # Stopped while writing the compacted copy: the store itself is intact
+    os.makedirs(directory + ".compact")
+    assert ChunkStore(directory).documents(ids) == docs[10:]
+    assert not os.path.exists(directory + ".compact")
+
+
+def test_handles_sharing_a_directory_see_each_others_writes(tmp_path):
+    directory = str(tmp_path / "chunks")
+    cli, server = ChunkStore(directory), ChunkStore(directory)
+    ids, docs = chunks(6)
+    cli.add(ids[:2], docs[:2])
+    assert server.documents(ids[:2]) == docs[:2]
+    server.add(ids[2:4], docs[2:4])
+    cli.add(ids[3:6], docs[3:6])
+    assert ChunkStore(directory).documents(ids) == docs
+
+    # A compaction through one handle is picked up by the other, which keeps writing at the right offsets
+    server.delete(ids[:3])
+    assert cli.compact() == 3
+    assert server.documents(ids) == docs[3:] and len(server) == 3
+    server.add(ids[:1], docs[:1])
+    assert cli.documents(ids) == docs[:1] + docs[3:]
+    assert ChunkStore(directory).documents(ids) == docs[:1] + docs[3:]
+
+
+def _add_from_process(directory: str, offset: int) -> None:
+    store = ChunkStore(directory)
+    for start in range(offset, offset + 200, 10):
+        store.add(*chunks(10, offset=start))
+
+
+def test_processes_append_to_one_directory(tmp_path):
+    directory = str(tmp_path / "chunks")
+    ChunkStore(directory)
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=_add_from_process, args=(directory, n * 200)) for n in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+    ids, docs = chunks(600)
+    assert ChunkStore(directory).documents(ids) == docs
@@ -0,0 +1,72 @@
+"""MicroBatcher shared by event loops in different threads."""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from rag_app.utils.concurrency import MicroBatcher
+
+POOL = ThreadPoolExecutor(max_workers=4)
+
+
+def double(items):
+    return [2 * item for item in items]
+
+
+def make_batcher(**kwargs) -> MicroBatcher:
+    return MicroBatcher(double, lambda: POOL, **kwargs)
+
+
+async def submit_all(batcher: MicroBatcher, items):
+    return await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in items)), timeout=5)
+
+
+def test_items_are_batched_and_answered_in_order():
+    batcher = make_batcher(max_batch=8, max_wait=0.01)
+    assert asyncio.run(submit_all(batcher, range(20))) == [2 * i for i in range(20)]
+    assert batcher.items == 20 and batcher.batches == 3
+
+
+def test_sequential_event_loops_reuse_the_batcher():
+    batcher = make_batcher(max_batch=64, max_wait=0.005)
+    for _ in range(3):
+        assert asyncio.run(submit_all(batcher, range(5))) == [0, 2, 4, 6, 8]
+
+
+def test_concurrent_event_loops_do_not_drop_each_others_items():
+    batcher = make_batcher(max_batch=16, max_wait=0.005)
+    barrier = threading.Barrier(8)
+    results, errors = {}, []
+
+    def run(n: int) -> None:
+        async def main():
+            barrier.wait()
+            return await submit_all(batcher, range(n * 100, n * 100 + 50))
+
+        try:
+            results[n] = asyncio.run(main())
+        except BaseException as e:  # Collected so a hang or loss fails the test rather than the thread
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert results == {n: [2 * i for i in range(n * 100, n * 100 + 50)] for n in range(8)}
+    assert batcher.items == 400
+
+
+def test_cancelled_items_are_not_sent():
+    batcher = make_batcher(max_batch=64, max_wait=10)
+
+    async def main():
+        task = asyncio.ensure_future(batcher.submit(1))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    assert batcher.batches == 0
+    assert all(not queue.pending and queue.timer is None for queue in batcher._queues.values())
@@ -0,0 +1,122 @@
+"""Downloader against a local HTTP server: conditional re-fetch and the ingested flag."""
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from rag_app.utils.download import Downloader
+
+
+class Server:
+    """Local HTTP server whose files, and whether it honours ``If-None-Match``, can change between requests."""
+
+    def __init__(self):
+        self.files = {}
+        self.honour_etags = True
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                name = self.path.lstrip("/")
+                server.requests.append((name, self.headers.get("If-None-Match")))
+                if name not in server.files:
+                    self.send_error(404)
+                    return
+                body = server.files[name]
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                if server.honour_etags and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/pdf")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, name: str) -> str:
+        return f"{self.base}/{name}"
+
+
+@pytest.fixture
+def server():
+    server = Server()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_unchanged_file_is_revalidated_not_downloaded(server, tmp_path):
+    server.files["a.pdf"] = b"%PDF-1.4 first"
+    downloader = Downloader(cache_dir=str(tmp_path))
+
+    first = downloader.fetch(server.url("a.pdf"))
+    assert first.ok and first.changed and not first.ingested
+    assert read(first.path) == b"%PDF-1.4 first"
+
+    second = downloader.fetch(server.url("a.pdf"))
+    assert second.ok and not second.changed and second.path == first.path
+    etag = '"%s"' % hashlib.md5(b"%PDF-1.4 first").hexdigest()
+    assert server.requests == [("a.pdf", None), ("a.pdf", etag)]
+
+
+def test_ingested_flag_survives_revalidation_and_restarts(server, tmp_path):
+    server.files["a.pdf"] = b"%PDF-1.4 first"
+    url = server.url("a.pdf")
+    downloader = Downloader(cache_dir=str(tmp_path))
+    downloader.fetch(url)
+    downloader.mark_ingested(url)
+
+    assert downloader.fetch(url).ingested
+    # The index is persisted, so a new process skips the unchanged PDF too
+    restarted = Downloader(cache_dir=str(tmp_path))
+    result = restarted.fetch(url)
+    assert not result.changed and result.ingested
+
+    # A server that ignores If-None-Match but sends the same bytes is still unchanged
+    server.honour_etags = False
+    result = restarted.fetch(url)
+    assert not result.changed and result.ingested
+
+
+def test_changed_file_is_downloaded_and_needs_ingest(server, tmp_path):
+    server.files["a.pdf"] = b"%PDF-1.4 first"
+    url = server.url("a.pdf")
+    downloader = Downloader(cache_dir=str(tmp_path))
+    downloader.fetch(url)
+    downloader.mark_ingested(url)
+
+    server.files["a.pdf"] = b"%PDF-1.4 second"
+    result = downloader.fetch(url)
+    assert result.changed and not result.ingested
+    assert read(result.path) == b"%PDF-1.4 second"
+
+
+def test_fetch_many_keeps_order_and_reports_errors(server, tmp_path):
+    for i in range(6):
+        server.files[f"{i}.pdf"] = b"%PDF-1.4 " + str(i).encode()
+    urls = [server.url(f"{i}.pdf") for i in range(6)] + [server.url("missing.pdf")]
+    results = Downloader(cache_dir=str(tmp_path), max_workers=4, per_host=2).fetch_many(urls)
+
+    assert [r.url for r in results] == urls
+    assert all(read(r.path) == b"%PDF-1.4 " + str(i).encode() for i, r in enumerate(results[:6]))
+    assert not results[-1].ok and results[-1].error
@@ -0,0 +1,53 @@
+"""Embedding server start-up on an existing socket path and malformed requests."""
+import errno
+import json
+import socket
+
+import pytest
+
+from benchmarks.synthetic import BagOfWordsEmbeddings
+from rag_app.utils.embedding_server import EmbeddingClient, EmbeddingServer, _recv, _send
+
+
+@pytest.fixture
+def address(tmp_path):
+    return f"unix:{tmp_path / 'embeddings.sock'}"
+
+
+def test_refuses_to_take_over_a_live_server(address):
+    server = EmbeddingServer(BagOfWordsEmbeddings(size=8), address).start()
+    try:
+        with pytest.raises(OSError) as raised:
+            EmbeddingServer(BagOfWordsEmbeddings(size=8), address)
+        assert raised.value.errno == errno.EADDRINUSE
+        expected = BagOfWordsEmbeddings(size=8).embed_query("still served")
+        assert EmbeddingClient(address).embed_query("still served") == pytest.approx(expected, rel=1e-6)
+    finally:
+        server.shutdown()
+
+
+def test_replaces_a_stale_socket_file(address):
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(address[len("unix:"):])
+    stale.close()
+    server = EmbeddingServer(BagOfWordsEmbeddings(size=8), address).start()
+    try:
+        assert len(EmbeddingClient(address).embed_query("hello")) == 8
+    finally:
+        server.shutdown()
+
+
+def test_malformed_request_gets_an_error_reply(address):
+    server = EmbeddingServer(BagOfWordsEmbeddings(size=8), address).start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(5)
+            sock.connect(address[len("unix:"):])
+            _send(sock, b"{not json")
+            response = _recv(sock)
+            assert "Malformed request" in json.loads(response[4:])["error"]
+            # The connection keeps working
+            _send(sock, json.dumps({"op": "info"}).encode())
+            assert "model_name" in json.loads(_recv(sock))
+    finally:
+        server.shutdown()
@@ -0,0 +1,33 @@
+"""Persistent embedding cache: location, eviction and the in-memory row count."""
+import os
+import sqlite3
+
+from benchmarks.synthetic import BagOfWordsEmbeddings
+from rag_app.utils.embeddings import DEFAULT_CACHE_FILE, CachedEmbeddings, cached_embeddings
+
+
+def rows(path: str) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def test_cache_defaults_to_the_persist_directory(tmp_path, monkeypatch):
+    monkeypatch.delenv("RAG_EMBEDDING_CACHE", raising=False)
+    cache = cached_embeddings(BagOfWordsEmbeddings(size=8), persist_directory=str(tmp_path / "store"))
+    assert cache.cache_path == os.path.join(str(tmp_path / "store"), DEFAULT_CACHE_FILE)
+    assert os.path.exists(cache.cache_path)
+
+
+def test_cache_stays_within_max_entries(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = CachedEmbeddings(BagOfWordsEmbeddings(size=8), cache_path=path, max_entries=50)
+    for start in range(0, 200, 15):
+        texts = [f"text {i}" for i in range(start, start + 15)]
+        assert cache.embed_documents(texts + texts[:3]) == BagOfWordsEmbeddings(size=8).embed_documents(texts + texts[:3])
+        assert cache._count == rows(path) <= 50
+
+    # Rows written by another handle are counted again within a tenth of max_entries inserts
+    other = CachedEmbeddings(BagOfWordsEmbeddings(size=8), cache_path=path, max_entries=50)
+    other.embed_documents([f"other {i}" for i in range(20)])
+    cache.embed_documents([f"more {i}" for i in range(5)])
+    assert cache._count == rows(path) <= 50
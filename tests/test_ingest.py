@@ -0,0 +1,81 @@
+"""``ingest`` and ``sync`` leave the same vector store, BM25 index, manifest and jobs."""
+import os
+
+import pytest
+
+from benchmarks.synthetic import BagOfWordsEmbeddings, make_pages, make_pdf
+from rag_app.utils import resources
+from rag_app.utils.ingest import ingest_paths
+from rag_app.utils.manifest import sync_paths
+
+
+@pytest.fixture(autouse=True)
+def matrix_backend(monkeypatch):
+    monkeypatch.setenv("RAG_VECTOR_BACKEND", "matrix")
+    yield
+    resources.configure()
+
+
+def run(mode: str, pdfs: str, directory: str) -> dict:
+    """Ingest or sync ``pdfs`` into the store in ``directory`` and return what it holds."""
+    resources.configure(embeddings=BagOfWordsEmbeddings(size=64), persist_directory=directory)
+    vectorstore, manifest = resources.get_vectorstore(), resources.get_manifest()
+    lexical_index = resources.get_lexical_index()
+    options = dict(
+        batch_size=16, lexical_index=lexical_index, chunk_store=resources.get_chunk_store(), jobs=resources.get_job_store()
+    )
+    if mode == "ingest":
+        ingest_paths([pdfs], vectorstore, manifest, workers=2, **options)
+    else:
+        sync_paths([pdfs], vectorstore, manifest, **options)
+    resources.save_indexes()
+    return {
+        "ids": sorted(vectorstore.get(include=[])["ids"]),
+        "bm25": sorted(i for i in lexical_index.doc_ids if i in lexical_index),
+        "manifest": {source: manifest.get(source)["pages"] for source in manifest.sources()},
+        "chunk_store": len(resources.get_chunk_store()),
+        "jobs": sorted(job["status"] for job in resources.get_job_store().jobs()),
+    }
+
+
+def test_ingest_matches_sync(tmp_path):
+    pdfs = tmp_path / "pdfs"
+    pdfs.mkdir()
+    for i in range(3):
+        make_pdf(str(pdfs / f"{i}.pdf"), make_pages(12, words_per_page=200, seed=i))
+
+    first = {mode: run(mode, str(pdfs), str(tmp_path / mode)) for mode in ("ingest", "sync")}
+    assert first["ingest"] == first["sync"]
+    assert len(first["ingest"]["manifest"]) == 3 and first["ingest"]["jobs"] == ["done"] * 3
+
+    # Change one page of a PDF and delete another PDF
+    pages = make_pages(12, words_per_page=200, seed=0)
+    pages[5] = "A rewritten page."
+    make_pdf(str(pdfs / "0.pdf"), pages)
+    os.remove(pdfs / "2.pdf")
+    second = {mode: run(mode, str(pdfs), str(tmp_path / mode)) for mode in ("ingest", "sync")}
+    assert second["ingest"] == second["sync"]
+    assert len(second["ingest"]["manifest"]) == 2
+    assert len(second["ingest"]["ids"]) < len(first["ingest"]["ids"])
+    assert second["ingest"]["bm25"] == second["ingest"]["ids"]
+    # Deleted chunks no longer resolve in the chunk store
+    assert second["ingest"]["chunk_store"] == len(second["ingest"]["ids"])
+    chunk_store = resources.get_chunk_store()
+    stale = set(first["sync"]["ids"]) - set(second["sync"]["ids"])
+    assert stale and chunk_store.documents(sorted(stale)) == []
+
+
+def test_failed_files_are_reported_in_stats(tmp_path, capsys):
+    pdfs = tmp_path / "pdfs"
+    pdfs.mkdir()
+    make_pdf(str(pdfs / "good.pdf"), make_pages(4, words_per_page=100))
+    (pdfs / "broken.pdf").write_bytes(b"%PDF-1.4 not really a PDF")
+    resources.configure(embeddings=BagOfWordsEmbeddings(size=64), persist_directory=str(tmp_path / "store"))
+
+    stats = ingest_paths(
+        [str(pdfs)], resources.get_vectorstore(), resources.get_manifest(), workers=2,
+        lexical_index=resources.get_lexical_index(), chunk_store=resources.get_chunk_store(),
+    )
+    assert stats.failed == [str(pdfs / "broken.pdf")] and stats.errors[str(pdfs / "broken.pdf")]
+    assert stats.files == 1 and stats.chunks > 0
+    assert capsys.readouterr().out == ""
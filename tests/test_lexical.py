@@ -0,0 +1,72 @@
+"""BM25 scores after removals and compaction, and the confidence test of the hybrid fast path."""
+import os
+import random
+
+import pytest
+
+from benchmarks.synthetic import random_text
+from rag_app.utils.lexical import LexicalIndex, is_confident
+
+
+def test_removed_chunks_do_not_affect_scores():
+    rng = random.Random(0)
+    texts = {f"c{i}": random_text(60, rng) for i in range(300)}
+    removed = set(rng.sample(sorted(texts), 120))
+
+    index = LexicalIndex()
+    index.add_many(texts.items())
+    index.remove(removed)
+    rebuilt = LexicalIndex()
+    rebuilt.add_many((chunk_id, text) for chunk_id, text in texts.items() if chunk_id not in removed)
+
+    for query in [random_text(4, rng) for _ in range(50)]:
+        hits, expected = index.search(query, k=10), rebuilt.search(query, k=10)
+        assert [i for i, _ in hits] == [i for i, _ in expected]
+        assert [s for _, s in hits] == pytest.approx([s for _, s in expected], rel=1e-5)
+    for term in ("system", "requirement", "baseline"):
+        assert index.idf(term) == pytest.approx(rebuilt.idf(term))
+
+
+def test_save_compacts_removed_chunks(tmp_path):
+    rng = random.Random(1)
+    texts = {f"c{i}": random_text(60, rng) for i in range(300)}
+    metadatas = {chunk_id: {"source": f"{i % 4}.pdf", "page": i} for i, chunk_id in enumerate(texts)}
+    index = LexicalIndex()
+    index.add_many((chunk_id, text, metadatas[chunk_id]) for chunk_id, text in texts.items())
+    path = str(tmp_path / "index.npz")
+
+    index.remove(list(texts)[:20])
+    index.save(path, compact_fraction=0.1)
+    assert len(index.doc_ids) == 300
+    size = os.path.getsize(path)
+    removed = set(list(texts)[:20] + rng.sample(list(texts)[20:], 80))
+    index.remove(removed)
+    index.save(path, compact_fraction=0.1)
+    assert len(index.doc_ids) == len(index) == 200 and not index._removed
+    assert os.path.getsize(path) < size
+
+    loaded = LexicalIndex.load(path)
+    rebuilt = LexicalIndex()
+    rebuilt.add_many((chunk_id, text, metadatas[chunk_id]) for chunk_id, text in texts.items() if chunk_id not in removed)
+    page_filter = {"$and": [{"source": "1.pdf"}, {"page": {"$gte": 100}}]}
+    for query in [random_text(4, rng) for _ in range(50)]:
+        for where in (None, page_filter):
+            expected = rebuilt.search(query, k=10, filter=where)
+            for compacted in (index, loaded):
+                hits = compacted.search(query, k=10, filter=where)
+                assert [i for i, _ in hits] == [i for i, _ in expected]
+                assert [s for _, s in hits] == pytest.approx([s for _, s in expected], rel=1e-5)
+    # New chunks are added after the compacted ones
+    assert index.add("new", "baseline review", {"source": "1.pdf", "page": 500})
+    assert index.search("baseline review", k=1, filter={"page": 500})[0][0] == "new"
+
+
+def test_single_hit_is_not_confident():
+    assert not is_confident([])
+    assert not is_confident([("a", 50.0)])
+
+
+def test_confidence_needs_margin_and_min_score():
+    assert is_confident([("a", 9.0), ("b", 3.0)], margin=2.0, min_score=3.0)
+    assert not is_confident([("a", 5.0), ("b", 3.0)], margin=2.0, min_score=3.0)
+    assert not is_confident([("a", 2.0), ("b", 0.5)], margin=2.0, min_score=3.0)
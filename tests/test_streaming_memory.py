@@ -0,0 +1,70 @@
+"""Peak memory of streaming PDF ingest must not grow with the length of the PDF."""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.synthetic import make_pages, make_pdf
+
+pytest.importorskip("resource")
+
+# Run in a fresh interpreter so earlier tests do not raise the peak RSS baseline
+CHILD = """
+import json, resource, sys
+from benchmarks.synthetic import NullVectorStore
+from rag_app.utils.tools import add_new_chunks, ingest_pdf_stream, load_pdf_from_path, split_documents
+
+def peak_mb():
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) / 1024
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+try:
+    # ru_maxrss survives fork and exec, so it starts at the test runner's peak; reset the high-water mark
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+except OSError:
+    pass
+pdf_path, mode = sys.argv[1], sys.argv[2]
+store = NullVectorStore()
+baseline = peak_mb()
+if mode == "stream":
+    ingest_pdf_stream(store, pdf_path, batch_size=64)
+else:
+    add_new_chunks(store, split_documents(load_pdf_from_path(pdf_path)))
+print(json.dumps({"chunks": store.count, "growth_mb": peak_mb() - baseline}))
+"""
+
+TOLERANCE_MB = 16.0
+
+
+def ingest(pdf_path: str, mode: str) -> dict:
+    # Ingest bumps the collection version stored in the persist directory, so keep that out of the working tree
+    env = {**os.environ, "RAG_PERSIST_DIRECTORY": os.path.dirname(pdf_path)}
+    output = subprocess.check_output([sys.executable, "-c", CHILD, pdf_path, mode], text=True, env=env)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@pytest.fixture(scope="module")
+def pdfs(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("pdfs")
+    return {n: make_pdf(str(directory / f"{n}.pdf"), make_pages(n)) for n in (100, 500)}
+
+
+def test_streaming_peak_is_flat(pdfs):
+    small = ingest(pdfs[100], "stream")
+    large = ingest(pdfs[500], "stream")
+    assert large["chunks"] > 4 * small["chunks"]
+    assert large["growth_mb"] - small["growth_mb"] < TOLERANCE_MB
+
+
+def test_streaming_peak_is_below_eager(pdfs):
+    streamed = ingest(pdfs[500], "stream")
+    eager = ingest(pdfs[500], "eager")
+    assert streamed["chunks"] == eager["chunks"]
+    assert streamed["growth_mb"] + TOLERANCE_MB < eager["growth_mb"]
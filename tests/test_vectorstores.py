@@ -0,0 +1,83 @@
+"""Matrix vector store search over float16 storage and codes, and writing precomputed vectors to Chroma."""
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from benchmarks.synthetic import BagOfWordsEmbeddings, make_documents
+from rag_app.utils import resources
+from rag_app.utils.tools import add_new_chunks, split_documents
+from rag_app.utils.vectorstores import MatrixVectorStore, _decode_float16, add_embedded_chunks
+
+
+def test_float16_decode_is_exact():
+    codes = np.arange(1 << 16, dtype=np.uint32).astype(np.uint16).view(np.float16)
+    codes = codes[np.isfinite(codes)]
+    decoded = _decode_float16(codes, np.empty(len(codes), dtype=np.float32))
+    assert np.array_equal(decoded.view(np.uint32), codes.astype(np.float32).view(np.uint32))
+
+
+@pytest.mark.parametrize("dtype,quantization", [("float16", "none"), ("float32", "float16"), ("float16", "int8")])
+def test_float16_search_matches_decoded_vectors(tmp_path, dtype, quantization):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((3000, 64)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    store = MatrixVectorStore(str(tmp_path), None, dtype=dtype, quantization=quantization, index="exact")
+    chunks = [Document(page_content="", metadata={"source": "a.pdf", "page": i}) for i in range(len(vectors))]
+    add_embedded_chunks(store, chunks, [str(i) for i in range(len(vectors))], vectors)
+
+    stored = vectors.astype(np.float16).astype(np.float32) if dtype == "float16" else vectors
+    for query in vectors[:20]:
+        hits = store.similarity_search_ids_by_vector(query, k=5)
+        expected = stored @ query
+        assert [int(i) for i, _ in hits] == np.argsort(-expected, kind="stable")[:5].tolist()
+        assert np.allclose([s for _, s in hits], np.sort(expected)[::-1][:5], atol=1e-5)
+        # A selective filter is answered by scoring only the matching rows
+        hits = store.similarity_search_ids_by_vector(query, k=5, filter={"page": {"$lt": 100}})
+        assert [int(i) for i, _ in hits] == np.argsort(-expected[:100], kind="stable")[:5].tolist()
+
+
+class CountingEmbeddings(BagOfWordsEmbeddings):
+    """Bag-of-words embeddings that count the texts embedded for documents."""
+
+    def __init__(self):
+        super().__init__(size=32)
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def chroma(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_VECTOR_BACKEND", "chroma")
+    embeddings = CountingEmbeddings()
+    resources.configure(embeddings=embeddings, persist_directory=str(tmp_path))
+    yield embeddings
+    resources.configure()
+
+
+def test_chroma_keeps_the_vectors_computed_by_ingest(chroma):
+    chunks = split_documents(make_documents(5))
+    store = resources.get_vectorstore()
+    assert add_new_chunks(store, chunks) == len(chunks)
+    assert chroma.embedded == len(chunks)
+    stored = store.get(include=["embeddings"])
+    assert len(stored["ids"]) == len(chunks)
+    assert np.allclose(stored["embeddings"][0], chroma.embed_query(store.get(ids=stored["ids"][:1])["documents"][0]))
+
+
+def test_rebalancing_chroma_shards_embeds_nothing(chroma, monkeypatch):
+    monkeypatch.setenv("RAG_SHARDS", "2")
+    store = resources.get_vectorstore()
+    chunks = split_documents(make_documents(6, source="a.pdf") + make_documents(6, source="b.pdf", seed=1))
+    add_new_chunks(store, chunks)
+    result = store.get(include=["embeddings"])
+    before = dict(zip(result["ids"], result["embeddings"]))
+    chroma.embedded = 0
+
+    assert store.rebalance(count=3, strategy="hash") > 0
+    assert chroma.embedded == 0
+    after = store.get(include=["embeddings"])
+    assert sorted(after["ids"]) == sorted(before)
+    assert all(np.allclose(before[i], e) for i, e in zip(after["ids"], after["embeddings"]))
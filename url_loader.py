@@ -1,43 +1,8 @@
 import os
 import sys
-import requests
-import tempfile
-import shlex
-from urllib.parse import urlparse, quote
 from langchain_community.document_loaders import PyPDFLoader
 from rag import ingest_documents, process_query
-
-def download_pdf(url):
-    """Download a PDF from a URL and save it to a temporary file."""
-    try:
-        print(f"Downloading PDF from {url}...")
-        # Handle URL encoding for special characters
-        if '!' in url and not url.startswith('http'):
-            # If URL was passed without quotes and has special chars
-            url = quote(url, safe=':/?&=')
-            
-        response = requests.get(url, stream=True)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        
-        # Check if the content is a PDF
-        content_type = response.headers.get('Content-Type', '')
-        if 'application/pdf' not in content_type and not url.lower().endswith('.pdf'):
-            print(f"Warning: URL might not be a PDF. Content-Type: {content_type}")
-        
-        # Create a temporary file to store the PDF
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        temp_path = temp_file.name
-        
-        # Write the PDF content to the temporary file
-        with open(temp_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        
-        print(f"PDF downloaded and saved to temporary file: {temp_path}")
-        return temp_path
-    except Exception as e:
-        print(f"Error downloading PDF: {e}")
-        return None
+from rag_app.utils.tools import download_pdf
 
 def load_pdf(pdf_path):
     """Load a PDF file and return the documents."""
@@ -98,14 +63,6 @@ def main():
                 print(f"Error processing query: {e}")
     except Exception as e:
         print(f"Error during document processing: {e}")
-    finally:
-        # Clean up the temporary file
-        if pdf_path and os.path.exists(pdf_path):
-            try:
-                os.remove(pdf_path)
-                print(f"Temporary file {pdf_path} removed.")
-            except Exception as e:
-                print(f"Error removing temporary file: {e}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file